@@ -1,13 +1,46 @@
-from django.contrib import admin
+import asyncio
+from functools import update_wrapper, wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib import admin, messages
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import ValidationError
+from django.forms.models import BaseInlineFormSet
 from django.urls import path, reverse
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponseRedirect
 from django.shortcuts import render
-
-from .models import Account, JournalEntry, Transaction, TaxRate
-from .utils import (get_account_info,
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import csrf_protect
+
+from .models import Account, BankMatch, BankStatement, FiscalPeriod, JournalEntry, Transaction, TaxRate
+from .periods import close_period, ensure_period_open
+from .posting import post_transactions, save_entry
+from .posting_queue import get_posting_queue, posting_queue_enabled, posting_timeout
+from .precompute import serve_report
+from .reconciliation import reconcile_statement
+from .registry import chart_of_accounts
+from .utils import (PERIOD_GRAINS,
                     create_custom_app,
-                    create_custom_model)
-from .components import (DateRangeForm,
+                    create_custom_model,
+                    default_period_range)
+from .concurrency import gather_sections
+from .components import (AccountTreeForm,
+                         ComparativeReportForm,
+                         DateRangeForm,
+                         JournalImportForm,
                          ViewComponent)
+from .exports import (EXPORT_FORMATS,
+                      account_ledger_rows,
+                      comparative_rows,
+                      export_response,
+                      general_ledger_rows,
+                      trial_balance_rows)
+from .importers import IMPORT_FORMATS, import_journal
+from .instrumentation import (follow_stream,
+                              instrumentation_enabled,
+                              request_profile,
+                              summarize_samples)
 
 
 class ModelAdmin(admin.ModelAdmin):
@@ -17,19 +50,43 @@ class ModelAdmin(admin.ModelAdmin):
         super().save_model(request, obj, form, change)
 
 
+class TransactionFormSet(BaseInlineFormSet):
+    def clean(self):
+        super().clean()
+        if any(self.errors):
+            return
+        total = sum(
+            form.cleaned_data.get("amount") or 0
+            for form in self.forms
+            if form.cleaned_data and not form.cleaned_data.get("DELETE")
+        )
+        if total != 0:
+            raise ValidationError(f"The entry does not balance: debits and credits differ by {total:,.2f}.")
+
+        # Checked here as well as by the writer, so a queued entry in a closed
+        # period comes back as a form error rather than from the queue.
+        entry = self.instance
+        ensure_period_open(entry.date)
+        if entry.pk:
+            ensure_period_open(JournalEntry.objects.filter(pk=entry.pk).values_list("date", flat=True).first())
+
+
 class TransactionInline(admin.TabularInline):
     model = Transaction
+    formset = TransactionFormSet
     extra = 0
     can_delete = True
+    readonly_fields = ("tax_amount", )
 
     class Media:
         js = ("custom_admin.js")
 
 
 class AccountAdmin(ModelAdmin):
-    list_display = ("name", "account_type", "normal_balance", "reference_code")
+    list_display = ("name", "account_type", "normal_balance", "reference_code", "role", "parent")
     search_fields = ("name", )
-    list_filter = ("account_type", )
+    list_filter = ("account_type", "role")
+    list_select_related = ("parent", )
     
 
 class JournalEntryAdmin(ModelAdmin):
@@ -38,14 +95,49 @@ class JournalEntryAdmin(ModelAdmin):
     list_filter = ("date", )
     search_fields = ("description", )
 
-    def save_related(self, request, form, formsets, change):
-        super().save_related(request, form, formsets, change)
+    def queue_additions(self, request, change) -> bool:
+        return not change and posting_queue_enabled()
+
+    def changeform_view(self, request, object_id=None, form_url="", extra_context=None):
+        # New entries are written by the posting queue's writer, which must
+        # not wait on a transaction (and SQLite's write lock) held by this
+        # request; the writer gives the entry and its lines one savepoint.
+        if request.method == "POST" and self.queue_additions(request, object_id is not None):
+            try:
+                return self._changeform_view(request, object_id, form_url, extra_context)
+            except ValidationError as e:
+                # The writer rejected the entry, e.g. its period was closed
+                # after the form was checked; nothing was written.
+                self.message_user(request, "; ".join(e.messages), messages.ERROR)
+                return HttpResponseRedirect(request.get_full_path())
+        return super().changeform_view(request, object_id, form_url, extra_context)
 
-        journal_entry = form.instance
-        transactions = journal_entry.transaction_set.all()
-        for transaction in transactions:
-            if not transaction.account or transaction.amount == 0:
-                transaction.delete()
+    def save_model(self, request, obj, form, change):
+        if not self.queue_additions(request, change):
+            super().save_model(request, obj, form, change)
+            return
+        # Saved together with the lines in save_related.
+        obj.created_by = request.user
+
+    def save_related(self, request, form, formsets, change):
+        form.save_m2m()
+        for formset in formsets:
+            if formset.model is not Transaction:
+                self.save_formset(request, form, formset, change=change)
+                continue
+            saved = formset.save(commit=False)
+            if self.queue_additions(request, change):
+                future = get_posting_queue().submit(save_entry, form.instance, saved, formset.deleted_objects,
+                                                    request.user)
+                try:
+                    future.result(timeout=posting_timeout())
+                except TimeoutError:
+                    if future.cancel():
+                        raise ValidationError("The ledger is busy and the entry was not saved; please try again.")
+                    raise ValidationError("The entry is still being written; check the journal before "
+                                          "submitting it again.")
+            else:
+                post_transactions(form.instance, saved, formset.deleted_objects, user=request.user)
 
 
 class TaxRateAdmin(ModelAdmin):
@@ -54,14 +146,58 @@ class TaxRateAdmin(ModelAdmin):
 
 
 class TransactionAdmin(ModelAdmin):
-    list_display = ("journal_entry__date", "journal_entry", "description", "account", "formatted_amount")
+    list_display = ("date", "journal_entry", "description", "account", "formatted_amount")
     search_fields = ("journal_entry", )
-    list_filter = ("journal_entry__date", "account")
+    list_filter = ("date", "account")
 
     def formatted_amount(self, obj):
         return f"{obj.amount:,.2f}"
 
 
+class FiscalPeriodAdmin(ModelAdmin):
+    list_display = ("name", "start_date", "end_date", "is_closed", "closed_at", "closing_entry")
+    list_filter = ("is_closed", )
+    readonly_fields = ("is_closed", "closed_at", "closing_entry")
+    actions = ["close_selected_periods"]
+
+    @admin.action(description="Close selected periods")
+    def close_selected_periods(self, request, queryset):
+        for period in queryset.filter(is_closed=False).order_by("end_date"):
+            try:
+                close_period(period, user=request.user)
+            except ValidationError as e:
+                self.message_user(request, f"{period}: {'; '.join(e.messages)}", messages.ERROR)
+                break
+            self.message_user(request, f"{period} closed.", messages.SUCCESS)
+
+
+class BankStatementAdmin(ModelAdmin):
+    list_display = ("name", "account", "created_at")
+    list_filter = ("account", )
+    actions = ["reconcile_selected_statements"]
+
+    @admin.action(description="Reconcile selected statements")
+    def reconcile_selected_statements(self, request, queryset):
+        for statement in queryset:
+            result = reconcile_statement(statement)
+            self.message_user(request, f"{statement}: matched {result['matched_by_reference']} by reference and "
+                                       f"{result['matched_by_amount']} by amount and date; "
+                                       f"{result['unmatched_lines']} unmatched.", messages.SUCCESS)
+
+
+class BankMatchAdmin(admin.ModelAdmin):
+    list_display = ("line", "transaction", "rule", "matched_at")
+    list_filter = ("rule", "line__statement")
+    raw_id_fields = ("line", "transaction")
+    readonly_fields = ("rule", "matched_at")
+    list_select_related = ("line", "transaction")
+
+    def save_model(self, request, obj, form, change):
+        # Matches made by hand are kept by re-runs even if the amounts differ.
+        obj.rule = BankMatch.MANUAL
+        super().save_model(request, obj, form, change)
+
+
 class AccountingAdminSite(admin.AdminSite):
     site_title = "Accounting App"
     site_header = "Accounting App"
@@ -77,75 +213,327 @@ class AccountingAdminSite(admin.AdminSite):
 
     @staticmethod
     def handle_date_request(request):
-        start_date = None
-        end_date = None
-        if request.method == "POST":
-            start_date = request.POST.get("start_date")
-            end_date = request.POST.get("end_date")
+        params = request.POST if request.method == "POST" else request.GET
+        start_date = params.get("start_date") or None
+        end_date = params.get("end_date") or None
         
         return start_date, end_date
 
-    def trial_balance_view(self, request):
+    @staticmethod
+    def handle_depth_request(request):
+        params = request.POST if request.method == "POST" else request.GET
+        try:
+            depth = int(params.get("depth") or 0)
+        except ValueError:
+            depth = 0
+
+        return depth if depth > 0 else None
+
+    async def trial_balance_view(self, request):
         start_date, end_date = self.handle_date_request(request)
-        components = self.view_components.get_trial_balance(start_date, end_date)
+        depth = self.handle_depth_request(request)
+        sections = await gather_sections({
+            "components": (serve_report, self.view_components.get_trial_balance, start_date, end_date, depth),
+            "available_apps": (self.get_app_list, request),
+        })
 
-        context = {"available_apps": self.get_app_list(request)}
-        context.update(components)
+        context = {
+            "start_date": start_date,
+            "end_date": end_date,
+            "depth": depth,
+            "available_apps": sections["available_apps"],
+        }
+        context.update(sections["components"])
         context.update(self.site_context)
+        context["form"] = AccountTreeForm(initial={"start_date": start_date, "end_date": end_date, "depth": depth})
 
-        return render(request, "admin/trial_balance.html", context)
+        return await sync_to_async(render)(request, "admin/trial_balance.html", context)
 
-    def account_balance_view(self, request, account_name):
+    async def account_balance_view(self, request, account_name):
         start_date, end_date = self.handle_date_request(request)
-        components = self.view_components.get_account_balance(account_name, start_date, end_date)
+        after = request.GET.get("after")
+        components, sections = await asyncio.gather(
+            self.view_components.aget_account_balance(account_name, start_date, end_date, after),
+            gather_sections({"available_apps": (self.get_app_list, request)}),
+        )
 
         context = {
             "account_name": account_name,
-            "available_apps": self.get_app_list(request),
+            "start_date": start_date,
+            "end_date": end_date,
+            "is_first_page": not after,
+            "available_apps": sections["available_apps"],
         }
         context.update(self.site_context)
         context.update(components)
 
-        return render(request, "admin/account_balance.html", context)
+        return await sync_to_async(render)(request, "admin/account_balance.html", context)
 
-    def report_view(self, request, report_name):
-        context = {
-            "report_name": report_name,
-            "available_apps": self.get_app_list(request),
-        }
+    async def report_view(self, request, report_name):
         urls_dict = {
             "Income Statement": "admin/income_statement.html",
             "Retained Earnings Statement": "admin/retained_earnings_statement.html",
             "Balance Sheet": "admin/balance_sheet.html",
         }
+        reports = {
+            "Income Statement": self.view_components.get_income_statement,
+            "Retained Earnings Statement": self.view_components.get_retained_earnings_statement,
+            "Balance Sheet": self.view_components.get_balance_sheet,
+        }
         
+        # Reports that can render the account tree at a chosen depth.
+        tree_reports = {"Income Statement", "Balance Sheet"}
+
         start_date, end_date = self.handle_date_request(request)
-        if report_name == "Income Statement":
-            view_components = self.view_components.get_income_statement(start_date, end_date)
-        elif report_name == "Retained Earnings Statement":
-            view_components = self.view_components.get_retained_earnings_statement(start_date, end_date)
-        elif report_name == "Balance Sheet":
-            view_components = self.view_components.get_balance_sheet(start_date, end_date)
-        else:
-            view_components = {}
-        
-        context.update(view_components)
+        depth = self.handle_depth_request(request)
+        sections = {"available_apps": (self.get_app_list, request)}
+        if report_name in tree_reports:
+            sections["components"] = (serve_report, reports[report_name], start_date, end_date, depth)
+        elif report_name in reports:
+            sections["components"] = (serve_report, reports[report_name], start_date, end_date)
+        sections = await gather_sections(sections)
+
+        context = {
+            "report_name": report_name,
+            "available_apps": sections["available_apps"],
+        }
+        context.update(sections.get("components", {}))
         context.update(self.site_context)
+        if report_name in tree_reports:
+            context["form"] = AccountTreeForm(initial={"start_date": start_date, "end_date": end_date, "depth": depth})
         
-        return render(request, urls_dict.get(report_name, "admin/index.html"), context)
+        return await sync_to_async(render)(request, urls_dict.get(report_name, "admin/index.html"), context)
+
+    comparative_reports = {
+        "Income Statement": ("get_comparative_income_statement", "month"),
+        "Balance Sheet": ("get_comparative_balance_sheet", "quarter"),
+    }
+
+    def handle_comparative_request(self, request, report_name):
+        if report_name not in self.comparative_reports:
+            raise Http404(f"No comparative report {report_name!r}.")
+        method, default_grain = self.comparative_reports[report_name]
+        params = request.POST if request.method == "POST" else request.GET
+        grain = params.get("grain") if params.get("grain") in PERIOD_GRAINS else default_grain
+        start_date, end_date = default_period_range(*self.handle_date_request(request))
+
+        return getattr(self.view_components, method), start_date, end_date, grain
+
+    async def comparative_report_view(self, request, report_name):
+        report, start_date, end_date, grain = await sync_to_async(self.handle_comparative_request)(request, report_name)
+        sections = await gather_sections({
+            "components": (report, start_date, end_date, grain),
+            "available_apps": (self.get_app_list, request),
+        })
+
+        context = {
+            "report_name": report_name,
+            "start_date": start_date,
+            "end_date": end_date,
+            "grain": grain,
+            "available_apps": sections["available_apps"],
+        }
+        context.update(sections["components"])
+        context.update(self.site_context)
+        context["form"] = ComparativeReportForm(initial={"start_date": start_date, "end_date": end_date, "grain": grain})
+
+        return await sync_to_async(render)(request, "admin/comparative_report.html", context)
+
+    def handle_tax_report_request(self, request):
+        params = request.POST if request.method == "POST" else request.GET
+        grain = params.get("grain") if params.get("grain") in PERIOD_GRAINS else "month"
+        start_date, end_date = default_period_range(*self.handle_date_request(request))
+
+        return start_date, end_date, grain
+
+    async def tax_report_view(self, request):
+        start_date, end_date, grain = await sync_to_async(self.handle_tax_report_request)(request)
+        sections = await gather_sections({
+            "components": (self.view_components.get_tax_report, start_date, end_date, grain),
+            "available_apps": (self.get_app_list, request),
+        })
+
+        context = {
+            "start_date": start_date,
+            "end_date": end_date,
+            "grain": grain,
+            "available_apps": sections["available_apps"],
+        }
+        context.update(sections["components"])
+        context.update(self.site_context)
+        context["form"] = ComparativeReportForm(initial={"start_date": start_date, "end_date": end_date, "grain": grain})
+
+        return await sync_to_async(render)(request, "admin/tax_report.html", context)
+
+    def journal_import_view(self, request):
+        if not request.user.has_perm("accounting.add_journalentry"):
+            raise PermissionDenied
+
+        form = JournalImportForm(request.POST or None, request.FILES or None)
+        result = None
+        if request.method == "POST" and form.is_valid():
+            upload = form.cleaned_data["file"]
+            file_format = upload.name.rsplit(".", 1)[-1].lower()
+            if file_format not in IMPORT_FORMATS:
+                form.add_error("file", f"Unsupported file type; expected one of {', '.join(IMPORT_FORMATS)}.")
+            else:
+                try:
+                    result = import_journal(upload.file, file_format, user=request.user)
+                except ValueError as e:
+                    form.add_error("file", str(e))
+
+        context = {
+            "available_apps": self.get_app_list(request),
+            "import_form": form,
+            "result": result,
+        }
+        context.update(self.site_context)
+
+        return render(request, "admin/journal_import.html", context)
+
+    @staticmethod
+    def handle_export_request(request):
+        file_format = request.GET.get("format", "csv")
+        if file_format not in EXPORT_FORMATS:
+            raise Http404(f"Unsupported export format {file_format!r}.")
+
+        return file_format
+
+    def export_view(self, request, export_name):
+        file_format = self.handle_export_request(request)
+        start_date, end_date = self.handle_date_request(request)
+        filename = "_".join(filter(None, [export_name, start_date, end_date]))
+
+        if export_name == "trial-balance":
+            components = self.view_components.get_trial_balance(start_date, end_date, self.handle_depth_request(request))
+            header = ["Account", "Opening balance", "Debit", "Credit", "Closing balance"]
+            rows = trial_balance_rows(components)
+        elif export_name == "general-ledger":
+            header = ["Reference code", "Account", "Date", "Journal entry", "Description", "Debit", "Credit", "Balance"]
+            rows = general_ledger_rows(start_date, end_date)
+        else:
+            raise Http404(f"Unknown export {export_name!r}.")
+
+        return export_response(request, filename, header, rows, file_format)
+
+    def comparative_export_view(self, request, report_name):
+        file_format = self.handle_export_request(request)
+        report, start_date, end_date, grain = self.handle_comparative_request(request, report_name)
+        filename = "_".join([report_name, grain, start_date, end_date])
+
+        components = report(start_date, end_date, grain)
+        return export_response(request, filename, ["Account", *components["periods"]], comparative_rows(components), file_format)
+
+    def account_export_view(self, request, account_name):
+        file_format = self.handle_export_request(request)
+        start_date, end_date = self.handle_date_request(request)
+        filename = "_".join(filter(None, [account_name, start_date, end_date]))
+
+        header = ["Date", "Journal entry", "Description", "Debit", "Credit", "Balance"]
+        rows = account_ledger_rows(account_name, start_date, end_date)
+
+        return export_response(request, filename, header, rows, file_format)
+
+    def instrumentation_view(self, request):
+        context = {
+            "available_apps": self.get_app_list(request),
+            "instrumentation_enabled": instrumentation_enabled(),
+            "samples": summarize_samples(),
+        }
+        context.update(self.site_context)
+
+        return render(request, "admin/instrumentation.html", context)
+
+    def instrument_view(self, view, name, label_format="{}"):
+        def profile(request, kwargs):
+            start_date, end_date = self.handle_date_request(request)
+            detail = kwargs.get("report_name") or kwargs.get("export_name")
+            label = label_format.format(detail) if detail else name
+            return request_profile(label, start_date, end_date)
+
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_inner(request, *args, **kwargs):
+                if not instrumentation_enabled():
+                    return await view(request, *args, **kwargs)
+
+                # The wrappers installed here only see this thread's
+                # connections; gather_sections shares the profile with the
+                # threads that run the report sections.
+                with profile(request, kwargs) as view_profile:
+                    response = await view(request, *args, **kwargs)
+                response["Server-Timing"] = view_profile.server_timing()
+                return response
+            return async_inner
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if not instrumentation_enabled():
+                return view(request, *args, **kwargs)
+
+            with profile(request, kwargs) as view_profile:
+                response = view(request, *args, **kwargs)
+                if response.streaming:
+                    # Exports query as the body is sent, after the headers,
+                    # so they are only profiled in the log.
+                    response.streaming_content = follow_stream(view_profile, response.streaming_content)
+                    return response
+            response["Server-Timing"] = view_profile.server_timing()
+            return response
+        return inner
+
+    def admin_view(self, view, cacheable=False):
+        # AdminSite.admin_view only wraps sync views; async report views get
+        # the same permission check, cache and CSRF handling here.
+        if not iscoroutinefunction(view):
+            return super().admin_view(view, cacheable)
+
+        async def inner(request, *args, **kwargs):
+            if not await sync_to_async(self.has_permission)(request):
+                return redirect_to_login(request.get_full_path(), reverse("admin:login", current_app=self.name))
+            return await view(request, *args, **kwargs)
+
+        if not cacheable:
+            inner = never_cache(inner)
+        if not getattr(view, "csrf_exempt", False):
+            inner = csrf_protect(inner)
+        return update_wrapper(inner, view)
 
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
             path("trial-balance/", 
-                 self.admin_view(self.trial_balance_view), 
+                 self.admin_view(self.instrument_view(self.trial_balance_view, "Trial Balance")), 
                  name="trial_balance"),
             path("account-balance/<str:account_name>/",
-                 self.admin_view(self.account_balance_view),
+                 self.admin_view(self.instrument_view(self.account_balance_view, "Account Balance")),
                  name="account_balance"),
             path("report/<str:report_name>/",
-                 self.admin_view(self.report_view),
+                 self.admin_view(self.instrument_view(self.report_view, "Report")),
                  name="report_view"),
+            path("comparative/<str:report_name>/",
+                 self.admin_view(self.instrument_view(self.comparative_report_view, "Comparative Report",
+                                                     "{} (comparative)")),
+                 name="comparative_report"),
+            path("tax-report/",
+                 self.admin_view(self.instrument_view(self.tax_report_view, "Tax Report")),
+                 name="tax_report"),
+            path("journal-import/",
+                 self.admin_view(self.journal_import_view),
+                 name="journal_import"),
+            path("export/account-balance/<str:account_name>/",
+                 self.admin_view(self.instrument_view(self.account_export_view, "Account Export")),
+                 name="account_export"),
+            path("export/comparative/<str:report_name>/",
+                 self.admin_view(self.instrument_view(self.comparative_export_view, "Comparative Export",
+                                                     "{} (comparative export)")),
+                 name="comparative_export"),
+            path("export/<str:export_name>/",
+                 self.admin_view(self.instrument_view(self.export_view, "Export")),
+                 name="export_view"),
+            path("instrumentation/",
+                 self.admin_view(self.instrumentation_view),
+                 name="instrumentation"),
         ]
         return custom_urls + urls
 
@@ -156,10 +544,7 @@ class AccountingAdminSite(admin.AdminSite):
         trial_balance_model = create_custom_model("Bảng cân đối thử", reverse("trial_balance"))
         balance_view_app["models"].append(trial_balance_model)
 
-        accounts = get_account_info("name", "all")
-        for account in accounts:
-            balance_view_model = create_custom_model(account.name, reverse("account_balance", args=[account.name]))
-            balance_view_app["models"].append(balance_view_model)
+        balance_view_app["models"].extend(chart_of_accounts.menu())
 
         # Create Report View app
         report_view_app = create_custom_app("Report View", reverse("admin:index"))
@@ -173,10 +558,25 @@ class AccountingAdminSite(admin.AdminSite):
             report_view_model = create_custom_model(report[1], report[2])
             report_view_app["models"].append(report_view_model)
 
+        comparative_reports = [
+            ("Báo cáo lợi nhuận theo tháng", reverse("comparative_report", args=["Income Statement"])),
+            ("Bảng cân đối kế toán theo quý", reverse("comparative_report", args=["Balance Sheet"])),
+        ]
+        for label, url in comparative_reports:
+            report_view_app["models"].append(create_custom_model(label, url))
+        report_view_app["models"].append(create_custom_model("Báo cáo thuế GTGT", reverse("tax_report")))
+
+        # Create Data app
+        data_app = create_custom_app("Data", reverse("admin:index"))
+        data_app["models"].append(create_custom_model("Nhập bút toán", reverse("journal_import")))
+        data_app["models"].append(create_custom_model("Xuất sổ cái (CSV)", reverse("export_view", args=["general-ledger"])))
+        data_app["models"].append(create_custom_model("Report performance", reverse("instrumentation")))
+
         app_list = super().get_app_list(request)
         app_list[0]["app_url"] = reverse("admin:index")
         app_list.append(balance_view_app)
         app_list.append(report_view_app)
+        app_list.append(data_app)
         
         return app_list
 
@@ -185,5 +585,8 @@ accounting_admin_site = AccountingAdminSite(name="accounting_admin")
 for model in [(Account, AccountAdmin), 
               (JournalEntry, JournalEntryAdmin), 
               (Transaction, TransactionAdmin), 
-              (TaxRate, TaxRateAdmin)]:
+              (TaxRate, TaxRateAdmin),
+              (FiscalPeriod, FiscalPeriodAdmin),
+              (BankStatement, BankStatementAdmin),
+              (BankMatch, BankMatchAdmin)]:
     accounting_admin_site.register(*model)
@@ -0,0 +1,230 @@
+from datetime import date
+from functools import wraps
+
+from django.http import JsonResponse
+from django.urls import path, reverse
+from django.utils.cache import patch_cache_control
+from django.utils.http import urlencode
+from django.views.decorators.http import condition, require_GET
+
+from .changefeed import DEFAULT_LIMIT, MAX_LIMIT, read_changes
+from .components import ViewComponent
+from .report_cache import get_ledger_generation
+
+
+MAX_PAGE_SIZE = 500
+
+view_components = ViewComponent()
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def ledger_generation(request) -> tuple:
+    # Shared by the ETag and Last-Modified checks of one request.
+    if not hasattr(request, "_ledger_generation"):
+        request._ledger_generation = get_ledger_generation()
+    return request._ledger_generation
+
+
+def ledger_etag(request, *args, **kwargs) -> str:
+    generation, _ = ledger_generation(request)
+    return f"ledger-{generation}"
+
+
+def ledger_last_modified(request, *args, **kwargs):
+    _, updated_at = ledger_generation(request)
+    return updated_at
+
+
+def report_endpoint(view):
+    # GET only, staff only, and answered with 304 Not Modified before any
+    # report work while the ledger generation is unchanged.
+    conditional = condition(etag_func=ledger_etag, last_modified_func=ledger_last_modified)(view)
+
+    @require_GET
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        if not (request.user.is_active and request.user.is_staff):
+            return JsonResponse({"error": "Authentication required."}, status=403)
+        try:
+            response = conditional(request, *args, **kwargs)
+        except BadRequest as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        # Per-user data that clients should revalidate with the ETag.
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+    return inner
+
+
+def read_date_range(request) -> tuple:
+    start_date = request.GET.get("start_date") or None
+    end_date = request.GET.get("end_date") or None
+    for value in (start_date, end_date):
+        if value:
+            try:
+                date.fromisoformat(value)
+            except ValueError:
+                raise BadRequest(f"Invalid date {value!r}; expected YYYY-MM-DD.")
+    if bool(start_date) != bool(end_date):
+        raise BadRequest("start_date and end_date must be given together.")
+
+    return start_date, end_date
+
+
+def read_depth(request):
+    depth = request.GET.get("depth") or None
+    if depth is None:
+        return None
+    try:
+        depth = int(depth)
+    except ValueError:
+        raise BadRequest("depth must be a number.")
+    if depth < 1:
+        raise BadRequest("depth must be positive.")
+
+    return depth
+
+
+def serialize_accounts(accounts) -> list:
+    return [
+        {
+            "id": account.pk,
+            "reference_code": account.reference_code,
+            "name": account.name,
+            "parent": account.parent_id,
+            "depth": account.depth,
+            "balance": account.balance,
+        }
+        for account in accounts
+    ]
+
+
+def report_response(start_date, end_date, report: dict) -> JsonResponse:
+    return JsonResponse({"start_date": start_date, "end_date": end_date, **report})
+
+
+@report_endpoint
+def trial_balance(request):
+    start_date, end_date = read_date_range(request)
+    components = view_components.get_trial_balance(start_date, end_date, read_depth(request))
+    report = {
+        "accounts": [
+            {
+                "id": row["account_id"],
+                "name": row["account__name"],
+                "depth": row.get("depth", 0),
+                "opening": row["opening"],
+                "debit": row["debit"],
+                "credit": abs(row["credit"]),
+                "closing": row["closing"],
+            }
+            for row in components["accounts"]
+        ],
+        "total_opening": components["total_opening"],
+        "total_debit": components["total_debit"],
+        "total_credit": components["total_credit"],
+        "total_closing": components["total_closing"],
+    }
+    return report_response(start_date, end_date, report)
+
+
+@report_endpoint
+def account_ledger(request, account_name):
+    start_date, end_date = read_date_range(request)
+    try:
+        page_size = min(int(request.GET.get("page_size", 100)), MAX_PAGE_SIZE)
+    except ValueError:
+        raise BadRequest("page_size must be a number.")
+    if page_size < 1:
+        raise BadRequest("page_size must be positive.")
+
+    ledger = view_components.get_account_page(account_name, start_date, end_date, request.GET.get("after"), page_size)
+    next_url = None
+    if ledger["next_cursor"]:
+        params = {key: value for key, value in request.GET.items() if key != "after"}
+        next_url = f"{reverse('api_account_ledger', args=[account_name])}?{urlencode({**params, 'after': ledger['next_cursor']})}"
+
+    report = {
+        "account": account_name,
+        "transactions": [
+            {
+                "id": transaction.pk,
+                "date": transaction.date,
+                "journal_entry": transaction.journal_entry_id,
+                "description": transaction.description,
+                "amount": transaction.amount,
+                "running_balance": transaction.running_balance,
+            }
+            for transaction in ledger["transactions"]
+        ],
+        "next": next_url,
+    }
+    return report_response(start_date, end_date, report)
+
+
+@report_endpoint
+def income_statement(request):
+    start_date, end_date = read_date_range(request)
+    components = view_components.get_income_statement(start_date, end_date, read_depth(request))
+    report = {
+        "revenue_accounts": serialize_accounts(components["revenue_accounts"]),
+        "expense_accounts": serialize_accounts(components["expense_accounts"]),
+        "total_revenue": components["total_revenue"],
+        "total_expense": components["total_expense"],
+        "net_income": components["net_income"],
+    }
+    return report_response(start_date, end_date, report)
+
+
+@report_endpoint
+def balance_sheet(request):
+    start_date, end_date = read_date_range(request)
+    components = view_components.get_balance_sheet(start_date, end_date, read_depth(request))
+    report = {
+        "asset_accounts": serialize_accounts(components["asset_accounts"]),
+        "liability_accounts": serialize_accounts(components["liability_accounts"]),
+        "equity_accounts": serialize_accounts(components["equity_accounts"]),
+        "total_assets": components["total_assets"],
+        "total_liabilities": components["total_liabilities"],
+        "total_equity": components["total_equity"],
+        "total_liabilities_and_equity": components["total_liabilities_and_equity"],
+    }
+    return report_response(start_date, end_date, report)
+
+
+@report_endpoint
+def retained_earnings_statement(request):
+    start_date, end_date = read_date_range(request)
+    components = view_components.get_retained_earnings_statement(start_date, end_date)
+    return report_response(start_date, end_date, components)
+
+
+@report_endpoint
+def changes(request):
+    # Every recorded change also bumps the ledger generation, so a polling
+    # consumer gets 304 until there is something new.
+    try:
+        after = int(request.GET.get("after") or 0)
+        limit = min(int(request.GET.get("limit") or DEFAULT_LIMIT), MAX_LIMIT)
+    except ValueError:
+        raise BadRequest("after and limit must be numbers.")
+    if after < 0 or limit < 1:
+        raise BadRequest("after must not be negative and limit must be positive.")
+
+    feed = read_changes(after, limit)
+    next_url = None
+    if feed["has_more"]:
+        next_url = f"{reverse('api_changes')}?{urlencode({'after': feed['next_cursor'], 'limit': limit})}"
+    return JsonResponse({**feed, "next": next_url})
+
+
+urlpatterns = [
+    path("trial-balance/", trial_balance, name="api_trial_balance"),
+    path("accounts/<str:account_name>/ledger/", account_ledger, name="api_account_ledger"),
+    path("income-statement/", income_statement, name="api_income_statement"),
+    path("balance-sheet/", balance_sheet, name="api_balance_sheet"),
+    path("retained-earnings-statement/", retained_earnings_statement, name="api_retained_earnings_statement"),
+    path("changes/", changes, name="api_changes"),
+]
@@ -5,3 +5,6 @@ class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounting'
     verbose_name = "Accounting Management"
+
+    def ready(self):
+        from . import database, signals
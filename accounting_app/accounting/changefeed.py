@@ -0,0 +1,60 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import Account, ChangeEvent, JournalEntry, Transaction
+
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+# Current state attached to create and update events, per model.
+FEED_FIELDS = {
+    "account": (Account, ["id", "name", "account_type", "reference_code", "role", "parent_id", "path", "depth"]),
+    "journalentry": (JournalEntry, ["id", "description", "date", "is_closing"]),
+    "transaction": (Transaction, ["id", "journal_entry_id", "account_id", "date", "amount", "description",
+                                  "tax_rate_id", "tax_amount"]),
+}
+
+
+def read_changes(after: int=0, limit: int=DEFAULT_LIMIT) -> dict:
+    # Events after the cursor in id order, with one query per model for the
+    # rows they point at. Rows deleted since are reported with data None;
+    # consumers should expect the later delete event.
+    events = list(ChangeEvent.objects.filter(id__gt=after).order_by("id")[:limit + 1])
+    has_more = len(events) > limit
+    events = events[:limit]
+
+    wanted = defaultdict(set)
+    for event in events:
+        if event.action != ChangeEvent.DELETE:
+            wanted[event.model].add(event.object_id)
+    current = {}
+    for model_name, object_ids in wanted.items():
+        model, fields = FEED_FIELDS[model_name]
+        for row in model.objects.filter(pk__in=object_ids).values(*fields):
+            current[(model_name, row["id"])] = row
+
+    changes = [
+        {
+            "id": event.id,
+            "model": event.model,
+            "object_id": event.object_id,
+            "action": event.action,
+            "created_at": event.created_at,
+            "data": current.get((event.model, event.object_id)),
+        }
+        for event in events
+    ]
+    result = {
+        "changes": changes,
+        "next_cursor": events[-1].id if events else after,
+        "has_more": has_more,
+    }
+    return result
+
+
+def prune_changes(days: int) -> int:
+    deleted, _ = ChangeEvent.objects.filter(created_at__lt=timezone.now() - timedelta(days=days)).delete()
+    return deleted
@@ -1,109 +1,166 @@
 from django import forms
-from django.db.models import Sum, Q
-from .models import Transaction
+from .concurrency import gather_sections
+from .database import report_reads
+from .models import Account
+from .instrumentation import instrumented
+from .registry import chart_of_accounts
+from .report_cache import cached_report
 
-from .utils import (calc_cumulative_balance,
-                    calc_total_revenue_expense,
-                    calc_net_income,
+from .utils import (PERIOD_GRAINS,
+                    TRIAL_BALANCE_COLUMNS,
+                    attach_balances,
+                    calc_balances,
+                    calc_period_balances,
+                    calc_retained_earnings,
+                    calc_tax_report,
                     calc_account_balance,
-                    calc_tx_total,
-                    get_account_info,
-                    get_account_transactions)
-                    
+                    calc_net_income,
+                    calc_trial_balance,
+                    get_account_ledger,
+                    period_label,
+                    quantize_amount)
 
 
 class DateRangeForm(forms.Form):
     start_date = forms.DateField(widget=forms.DateInput(attrs={"class": "datepicker", "type": "date"}))
     end_date = forms.DateField(widget=forms.DateInput(attrs={"class": "datepicker", "type": "date"}))
-    
+
+
+class AccountTreeForm(DateRangeForm):
+    depth = forms.IntegerField(min_value=1, required=False,
+                               help_text="Account levels to show with subtotals; leave blank to list every account.")
+
+
+class ComparativeReportForm(DateRangeForm):
+    grain = forms.ChoiceField(choices=[(grain, grain.title()) for grain in PERIOD_GRAINS])
+
+
+class JournalImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV or XLSX with columns: entry, date, account, description, amount (or debit/credit).")
+
 
 class ViewComponent:
-    def get_trial_balance(self, start_date, end_date):
-        accounts = (
-            Transaction.objects
-            .values("account__name")
-            .annotate(
-                debit=Sum("amount", filter=Q(amount__gt=0)),
-                credit=Sum("amount", filter=Q(amount__lt=0))
-            )
-            .order_by("account__name")
-        )
-        if start_date and end_date:
-            accounts = accounts.filter(journal_entry__date__range=(start_date, end_date))
+    @instrumented("trial_balance")
+    @report_reads
+    @cached_report("trial_balance")
+    def get_trial_balance(self, start_date, end_date, depth=None):
+        trial_balance = calc_trial_balance(start_date, end_date)
+        accounts = []
+        for account_id, columns in trial_balance["by_account"].items():
+            account = chart_of_accounts.get(account_id)
+            accounts.append({"account_id": account_id, "account__name": account.name if account else "", **columns})
+        accounts.sort(key=lambda row: row["account__name"])
 
+        totals = trial_balance["totals"]
         components = {
-            "accounts": accounts,
-            "total_debit": sum(row["debit"] or 0 for row in accounts),
-            "total_credit": sum(abs(row["credit"] or 0) for row in accounts),
+            "accounts": accounts if depth is None else self.trial_balance_tree(accounts, depth),
+            "total_opening": totals["opening"],
+            "total_debit": totals["debit"],
+            "total_credit": abs(totals["credit"]),
+            "total_closing": totals["closing"],
         }
         return components
 
-    def get_account_balance(self, account_name, start_date, end_date):
-        account_transactions = get_account_transactions(account_name, start_date, end_date)
-        if len(account_transactions) == 0:
+    def trial_balance_tree(self, rows, depth):
+        # Rolls every column up the hierarchy; the totals stay those of the
+        # leaf rows.
+        rolled = {
+            column: chart_of_accounts.rollup({row["account_id"]: row[column] for row in rows})
+            for column in TRIAL_BALANCE_COLUMNS
+        }
+        account_types = [account_type for account_type, _ in Account.ACCOUNT_TYPES]
+        tree = [
+            {
+                "account_id": account.pk,
+                "account__name": account.name,
+                "depth": account.depth,
+                **{column: rolled[column][account.pk] for column in TRIAL_BALANCE_COLUMNS},
+            }
+            for account in chart_of_accounts.tree(*account_types, depth=depth)
+            if account.pk in rolled["closing"]
+        ]
+        return tree
+
+    @instrumented("account_balance")
+    @report_reads
+    def get_account_balance(self, account_name, start_date, end_date, after=None):
+        ledger = self.get_account_page(account_name, start_date, end_date, after)
+        if len(ledger["transactions"]) == 0:
+            return {}
+        total = self.get_account_total(account_name, start_date, end_date)
+        return self.account_balance_components(ledger, total)
+
+    @instrumented("account_balance")
+    async def aget_account_balance(self, account_name, start_date, end_date, after=None):
+        # The ledger page and the account total do not depend on each other.
+        sections = await gather_sections({
+            "ledger": (self.get_account_page, account_name, start_date, end_date, after),
+            "total": (self.get_account_total, account_name, start_date, end_date),
+        })
+        return self.account_balance_components(sections["ledger"], sections["total"])
+
+    @report_reads
+    def get_account_page(self, account_name, start_date, end_date, after=None, page_size=100):
+        return get_account_ledger(account_name, start_date, end_date, after, page_size)
+
+    @report_reads
+    def get_account_total(self, account_name, start_date, end_date):
+        return calc_account_balance(chart_of_accounts.by_name(account_name), start_date, end_date)
+
+    def account_balance_components(self, ledger, total):
+        if len(ledger["transactions"]) == 0:
             components = {}
         else:
-            account_balance = calc_cumulative_balance(account_transactions)
+            normal_balance = ledger["transactions"][0].account.normal_balance
             components = {
-                "transactions": account_transactions,
-                "balance": account_balance,
-                "total_debit": (account_balance["debit_balance"][-1] 
-                                if account_balance["debit_balance"][0] != "" 
-                                else ""),
-                "total_credit": (account_balance["credit_balance"][-1]  
-                                if account_balance["credit_balance"][0] != ""  
-                                else ""),
+                "transactions": ledger["transactions"],
+                "normal_balance": normal_balance,
+                "next_cursor": ledger["next_cursor"],
+                "total_debit": total if normal_balance == "Debit" else "",
+                "total_credit": total if normal_balance == "Credit" else "",
             }
         
         return components
 
-    def get_income_statement(self, start_date, end_date):
-        total_revenue, total_expense = calc_total_revenue_expense(start_date, end_date)
+    @instrumented("income_statement")
+    @report_reads
+    @cached_report("income_statement")
+    def get_income_statement(self, start_date, end_date, depth=None):
+        balances = calc_balances(start_date, end_date, ["Revenue", "Expense"], exclude_closing=True)
+        accounts = self.report_accounts(["Revenue", "Expense"], balances["by_account"], depth)
+        total_revenue = balances["by_type"]["Revenue"]
+        total_expense = balances["by_type"]["Expense"]
         net_income = calc_net_income(total_revenue, total_expense)
         components = {
-            "revenue_accounts": get_account_info("type", account_type="Revenue"),
-            "expense_accounts": get_account_info("type", account_type="Expense"),
+            "revenue_accounts": [acc for acc in accounts if acc.account_type == "Revenue"],
+            "expense_accounts": [acc for acc in accounts if acc.account_type == "Expense"],
             "total_revenue": total_revenue,
             "total_expense": total_expense,
             "net_income": net_income,
         }
         return components
 
+    @instrumented("retained_earnings_statement")
+    @report_reads
+    @cached_report("retained_earnings_statement")
     def get_retained_earnings_statement(self, start_date, end_date):
-        net_income = calc_net_income()
-        cash_dividends = calc_tx_total(get_account_transactions("Chi cổ tức bằng tiền mặt"))
-        increased_retained_earnings = net_income - cash_dividends
-    
-        retained_earnings_tx = get_account_transactions("Lợi nhuận sau thuế chưa phân phối", start_date, end_date)
-        beginning_retained_earnings = abs(calc_tx_total(retained_earnings_tx))
-        ending_retained_earnings = beginning_retained_earnings + increased_retained_earnings
-
-        components = {
-            "beginning_retained_earnings": beginning_retained_earnings,
-            "net_income": net_income,
-            "cash_dividends": cash_dividends,
-            "increased_retained_earnings": increased_retained_earnings,
-            "ending_retained_earnings": ending_retained_earnings,
-        }
+        components = calc_retained_earnings(start_date, end_date)
         return components
 
-    def get_balance_sheet(self, start_date, end_date):
-        asset_accounts = get_account_info("type", account_type="Asset")
-        liability_accounts = get_account_info("type", account_type="Liability")
-        equity_accounts = get_account_info("type", account_type="Equity")
+    @instrumented("balance_sheet")
+    @report_reads
+    @cached_report("balance_sheet")
+    def get_balance_sheet(self, start_date, end_date, depth=None):
+        account_types = ["Asset", "Liability", "Equity"]
+        balances = calc_balances(start_date, end_date, account_types)
+        accounts = self.report_accounts(account_types, balances["by_account"], depth)
+        asset_accounts = [acc for acc in accounts if acc.account_type == "Asset"]
+        liability_accounts = [acc for acc in accounts if acc.account_type == "Liability"]
+        equity_accounts = [acc for acc in accounts if acc.account_type == "Equity"]
 
-        for acc in asset_accounts:
-            acc.balance = calc_account_balance(acc.name, start_date, end_date)
-        
-        for acc in liability_accounts:
-            acc.balance = calc_account_balance(acc.name, start_date, end_date)
-
-        for acc in equity_accounts:
-            acc.balance = calc_account_balance(acc.name, start_date, end_date)
-
-        total_assets = sum([acc.balance for acc in asset_accounts])
-        total_liabilities = sum([acc.balance for acc in liability_accounts])
-        total_equity = sum([acc.balance for acc in equity_accounts])
+        total_assets = balances["by_type"]["Asset"]
+        total_liabilities = balances["by_type"]["Liability"]
+        total_equity = balances["by_type"]["Equity"]
         total_liabilities_and_equity = total_liabilities + total_equity
 
         components = {
@@ -116,3 +173,75 @@ class ViewComponent:
             "total_liabilities_and_equity": total_liabilities_and_equity,
         }
         return components
+
+    @instrumented("comparative_income_statement")
+    @report_reads
+    @cached_report("comparative_income_statement")
+    def get_comparative_income_statement(self, start_date, end_date, grain="month"):
+        balances = calc_period_balances(start_date, end_date, grain, ["Revenue", "Expense"], exclude_closing=True)
+        total_revenue = balances["by_type"]["Revenue"]
+        total_expense = balances["by_type"]["Expense"]
+        net_income = [calc_net_income(revenue, expense) for revenue, expense in zip(total_revenue, total_expense)]
+
+        components = {
+            "periods": [period_label(period, grain) for period in balances["periods"]],
+            "sections": [
+                self.comparative_section("Doanh thu", "Tổng doanh thu", "Revenue", balances, sign=-1),
+                self.comparative_section("Chi phí vận hành", "Tổng chi phí", "Expense", balances),
+            ],
+            "summary": [("Lợi nhuận ròng trước thuế", net_income)],
+        }
+        return components
+
+    @instrumented("comparative_balance_sheet")
+    @report_reads
+    @cached_report("comparative_balance_sheet")
+    def get_comparative_balance_sheet(self, start_date, end_date, grain="quarter"):
+        balances = calc_period_balances(start_date, end_date, grain, ["Asset", "Liability", "Equity"], cumulative=True)
+        total_liabilities_and_equity = [
+            -(liabilities + equity)
+            for liabilities, equity in zip(balances["by_type"]["Liability"], balances["by_type"]["Equity"])
+        ]
+
+        components = {
+            "periods": [period_label(period, grain) for period in balances["periods"]],
+            "sections": [
+                self.comparative_section("Tài sản", "Tổng cộng tài sản", "Asset", balances),
+                self.comparative_section("Nợ phải trả", "Tổng cộng nợ phải trả", "Liability", balances, sign=-1),
+                self.comparative_section("Vốn góp", "Tổng cộng vốn góp", "Equity", balances, sign=-1),
+            ],
+            "summary": [("Tổng cộng vốn góp và nợ phải trả", total_liabilities_and_equity)],
+        }
+        return components
+
+    @instrumented("tax_report")
+    @report_reads
+    @cached_report("tax_report")
+    def get_tax_report(self, start_date, end_date, grain="month"):
+        tax_report = calc_tax_report(start_date, end_date, grain)
+        components = {
+            "rows": [dict(row, period=period_label(row["period"], grain)) for row in tax_report["rows"]],
+            "totals": tax_report["totals"],
+        }
+        return components
+
+    def report_accounts(self, account_types, by_account, depth=None):
+        # Flat by default; with a depth, the account tree cut at that level
+        # with each node's subtotal as its balance.
+        if depth is None:
+            return attach_balances(chart_of_accounts.by_type(*account_types), by_account)
+        return attach_balances(chart_of_accounts.tree(*account_types, depth=depth), chart_of_accounts.rollup(by_account))
+
+    def comparative_section(self, title, total_title, account_type, balances, sign=1):
+        # sign=-1 shows credit-normal sections as positive figures.
+        empty = [quantize_amount(0)] * len(balances["periods"])
+        section = {
+            "title": title,
+            "accounts": [
+                {"name": account.name, "values": [sign * value for value in balances["by_account"].get(account.pk, empty)]}
+                for account in chart_of_accounts.by_type(account_type)
+            ],
+            "total_title": total_title,
+            "total": [sign * value for value in balances["by_type"][account_type]],
+        }
+        return section
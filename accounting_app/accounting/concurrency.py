@@ -0,0 +1,65 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from .instrumentation import current_profile, share_profile
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def report_workers() -> int:
+    return getattr(settings, "ACCOUNTING_REPORT_WORKERS", 4)
+
+
+def get_executor(workers: int) -> ThreadPoolExecutor:
+    with _executors_lock:
+        if workers not in _executors:
+            _executors[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="accounting-report")
+        return _executors[workers]
+
+
+def run_inline(profile, func, *args):
+    # Connections belong to a thread, and the request profile's wrappers
+    # are installed on the view's, not on the sync thread a section runs in.
+    with share_profile(profile):
+        return func(*args)
+
+
+def run_section(profile, func, *args):
+    # Runs in a pool thread with its own database connections, which are
+    # recycled according to CONN_MAX_AGE like a request's would be.
+    try:
+        return run_inline(profile, func, *args)
+    finally:
+        close_old_connections()
+
+
+def in_transaction() -> bool:
+    return any(connections[alias].in_atomic_block for alias in connections)
+
+
+async def gather_sections(sections: dict) -> dict:
+    # sections: name -> (callable, *args). Independent report sections run
+    # side by side on a bounded thread pool, so a page takes as long as its
+    # slowest section. Inside a transaction other connections cannot see
+    # its writes, so sections then run one after another on the caller's.
+    workers = report_workers()
+    profile = current_profile()
+    # Connections are thread-bound, so ask from the caller's sync thread.
+    if workers <= 1 or await sync_to_async(in_transaction)():
+        results = {}
+        for name, (func, *args) in sections.items():
+            results[name] = await sync_to_async(run_inline)(profile, func, *args)
+        return results
+
+    loop = asyncio.get_running_loop()
+    executor = get_executor(workers)
+    futures = [loop.run_in_executor(executor, run_section, profile, func, *args)
+               for func, *args in sections.values()]
+    return dict(zip(sections, await asyncio.gather(*futures)))
@@ -0,0 +1,69 @@
+import sqlite3
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+REPORTS_ALIAS = "reports"
+
+_report_reads = ContextVar("accounting_report_reads", default=False)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    # Straight on the driver connection, so the statements stay out of
+    # query counts and request profiles.
+    if connection.vendor != "sqlite":
+        return
+    for name, value in getattr(settings, "ACCOUNTING_SQLITE_PRAGMAS", {}).items():
+        # The journal mode is stored in the file; a read-only connection
+        # cannot change it and follows the writer's.
+        if name == "journal_mode" and connection.alias == REPORTS_ALIAS:
+            continue
+        connection.connection.execute(f"PRAGMA {name} = {value}")
+    if connection.alias == REPORTS_ALIAS:
+        connection.connection.execute("PRAGMA query_only = ON")
+    # Django assumes SQLite's old default of 999 bound parameters, which
+    # splits a large journal entry's lines over several INSERTs; builds
+    # since 3.32 allow 32766.
+    connection.features.max_query_params = connection.connection.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+
+
+def report_reads(method):
+    # Marks a ViewComponent method's reads for the read-only reports alias.
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        token = _report_reads.set(True)
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _report_reads.reset(token)
+    return wrapper
+
+
+class ReportRouter:
+    def db_for_read(self, model, **hints):
+        if not _report_reads.get() or REPORTS_ALIAS not in settings.DATABASES:
+            return None
+        # Another connection could not see this transaction's own writes.
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return REPORTS_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Instances read for a report still save through the writer.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPORTS_ALIAS}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPORTS_ALIAS:
+            return False
+        return None
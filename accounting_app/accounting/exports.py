@@ -0,0 +1,150 @@
+import csv
+import tempfile
+from functools import partial
+from typing import AsyncIterator, Iterable, Iterator, Optional
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+from .concurrency import run_inline
+from .instrumentation import current_profile
+from .models import Transaction
+from .utils import get_account_transactions, filter_date_range, quantize_amount
+
+
+EXPORT_FORMATS = ("csv", "xlsx")
+EXPORT_CHUNK_SIZE = 2000
+FILE_BLOCK_SIZE = 64 * 1024
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+class Echo:
+    # csv.writer target that hands each formatted line straight back.
+    def write(self, value):
+        return value
+
+
+def stream_csv(header: list, rows: Iterable) -> Iterator[str]:
+    # One string per EXPORT_CHUNK_SIZE rows, so each piece sent costs one
+    # step of the iterator rather than one per row.
+    writer = csv.writer(Echo())
+    yield "\ufeff" + writer.writerow(header)
+    lines = []
+    for row in rows:
+        lines.append(writer.writerow(row))
+        if len(lines) >= EXPORT_CHUNK_SIZE:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+def write_xlsx(header: list, rows: Iterable):
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ValueError("XLSX export requires the openpyxl package.")
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def stream_file(output) -> Iterator[bytes]:
+    try:
+        yield from iter(partial(output.read, FILE_BLOCK_SIZE), b"")
+    finally:
+        output.close()
+
+
+def aiterate(iterator: Iterator) -> AsyncIterator:
+    # Under ASGI a synchronous iterator is read to the end before anything
+    # is sent. Each step runs on the thread that created the iterator,
+    # whose connection owns the query cursor, and reports its queries to
+    # the request's profile, which is looked up now, while the view runs.
+    profile = current_profile()
+    step = sync_to_async(run_inline)
+
+    async def steps():
+        while (part := await step(profile, next, iterator, None)) is not None:
+            yield part
+    return steps()
+
+
+def export_response(request, filename: str, header: list, rows: Iterable, file_format: str="csv"):
+    if file_format == "xlsx":
+        content = stream_file(write_xlsx(header, rows))
+    else:
+        content = stream_csv(header, rows)
+    if isinstance(request, ASGIRequest):
+        content = aiterate(content)
+
+    response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[file_format])
+    # Account and report names are usually Vietnamese; this adds the RFC 6266
+    # filename* form browsers decode.
+    response["Content-Disposition"] = content_disposition_header(True, f"{filename}.{file_format}")
+    return response
+
+
+def split_debit_credit(amount) -> tuple:
+    return (amount, "") if amount > 0 else ("", -amount)
+
+
+def trial_balance_rows(components: dict) -> Iterator[list]:
+    for row in components["accounts"]:
+        yield [row["account__name"], row["opening"], row["debit"], abs(row["credit"]), row["closing"]]
+    yield ["Total", components["total_opening"], components["total_debit"], components["total_credit"],
+           components["total_closing"]]
+
+
+def comparative_rows(components: dict) -> Iterator[list]:
+    for section in components["sections"]:
+        yield [section["title"]]
+        for account in section["accounts"]:
+            yield [account["name"], *map(quantize_amount, account["values"])]
+        yield [section["total_title"], *map(quantize_amount, section["total"])]
+    for title, values in components["summary"]:
+        yield [title, *map(quantize_amount, values)]
+
+
+def account_ledger_rows(account_name: str,
+                        start_date: Optional[str]=None,
+                        end_date: Optional[str]=None) -> Iterator[list]:
+    transactions = (
+        get_account_transactions(account_name, start_date, end_date)
+        .order_by("date", "pk")
+        .values_list("date", "journal_entry_id", "description", "amount")
+    )
+    balance = quantize_amount(0)
+    for day, entry_id, description, amount in transactions.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        balance += amount
+        yield [day, entry_id, description, *split_debit_credit(amount), balance]
+
+
+def general_ledger_rows(start_date: Optional[str]=None, end_date: Optional[str]=None) -> Iterator[list]:
+    transactions = (
+        filter_date_range(Transaction.objects.all(), start_date, end_date)
+        .order_by("account_id", "date", "pk")
+        .values_list("account__reference_code", "account__name", "account_id",
+                     "date", "journal_entry_id", "description", "amount")
+    )
+    current_account = None
+    balance = quantize_amount(0)
+    for code, name, account_id, day, entry_id, description, amount in transactions.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        if account_id != current_account:
+            current_account = account_id
+            balance = quantize_amount(0)
+        balance += amount
+        yield [code, name, day, entry_id, description, *split_debit_credit(amount), balance]
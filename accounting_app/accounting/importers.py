@@ -0,0 +1,226 @@
+import csv
+import io
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import IO, Iterator, Optional
+
+from django.db import transaction as db_transaction
+
+from .models import ChangeEvent, FiscalPeriod, JournalEntry, Transaction
+from .registry import chart_of_accounts
+from .report_cache import bump_ledger_generation
+from .snapshots import refresh_daily_balances
+from .utils import quantize_amount
+
+
+# Expected columns: entry, date, account (reference code), description and
+# either amount (signed, debit positive) or debit/credit. Lines of one entry
+# must be contiguous so the file can be streamed.
+IMPORT_FORMATS = ("csv", "xlsx")
+MAX_AMOUNT = Decimal(10) ** 10
+
+
+def read_csv_rows(fileobj: IO) -> Iterator[tuple]:
+    if isinstance(fileobj, io.TextIOBase):
+        text = fileobj
+    else:
+        text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(text)
+    reader.fieldnames = [(name or "").strip().lower() for name in reader.fieldnames or []]
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_xlsx_rows(fileobj: IO) -> Iterator[tuple]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("XLSX import requires the openpyxl package.")
+
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(name or "").strip().lower() for name in next(rows, [])]
+        for line_no, values in enumerate(rows, start=2):
+            if any(value not in (None, "") for value in values):
+                yield line_no, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def read_rows(fileobj: IO, file_format: str="csv") -> Iterator[tuple]:
+    if file_format == "csv":
+        return read_csv_rows(fileobj)
+    if file_format == "xlsx":
+        return read_xlsx_rows(fileobj)
+    raise ValueError(f"Unsupported import format {file_format!r}; expected one of {', '.join(IMPORT_FORMATS)}.")
+
+
+def group_entries(rows: Iterator[tuple]) -> Iterator[list]:
+    lines = []
+    current = None
+    for line_no, row in rows:
+        key = str(row.get("entry") or "").strip()
+        if lines and key != current:
+            yield lines
+            lines = []
+        current = key
+        lines.append((line_no, row))
+    if lines:
+        yield lines
+
+
+def parse_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value).strip())
+
+
+def parse_amount(value) -> Decimal:
+    if value in (None, ""):
+        return Decimal(0)
+    return Decimal(str(value).strip().replace(",", ""))
+
+
+def parse_account_code(value) -> int:
+    # Reference codes are integers, so "111", "0111" and a spreadsheet's
+    # 111.0 all name account 111; "1121.1" is rejected rather than
+    # truncated to 1121.
+    try:
+        code = Decimal(str(value if value is not None else "").strip())
+    except InvalidOperation:
+        raise ValueError(f"account reference {value!r} is not a number")
+    if not code.is_finite() or code != code.to_integral_value():
+        raise ValueError(f"account reference {value!r} is not a whole number")
+    return int(code)
+
+
+def parse_line(row: dict, accounts: dict) -> tuple:
+    code = parse_account_code(row.get("account"))
+    try:
+        account_id = accounts[code]
+    except KeyError:
+        raise ValueError(f"unknown account reference {code!r}")
+    if account_id is None:
+        raise ValueError(f"account reference {code!r} matches more than one account")
+
+    try:
+        if row.get("amount") not in (None, ""):
+            amount = parse_amount(row["amount"])
+        else:
+            amount = parse_amount(row.get("debit")) - parse_amount(row.get("credit"))
+    except InvalidOperation:
+        raise ValueError("amount is not a number")
+    if amount != quantize_amount(amount) or abs(amount) >= MAX_AMOUNT:
+        raise ValueError(f"amount {amount} does not fit 12 digits with 2 decimal places")
+    if amount == 0:
+        raise ValueError("amount is zero")
+
+    return account_id, amount, str(row.get("description") or "").strip()
+
+
+def validate_entry(lines: list, accounts: dict, closed_through: Optional[date]) -> tuple:
+    errors = []
+    first_line, first_row = lines[0]
+    try:
+        entry_date = parse_date(first_row.get("date"))
+    except (TypeError, ValueError):
+        return None, [(first_line, f"invalid date {first_row.get('date')!r}")]
+    if closed_through and entry_date <= closed_through:
+        return None, [(first_line, f"the fiscal period containing {entry_date} is closed")]
+
+    parsed = []
+    for line_no, row in lines:
+        try:
+            if row.get("date") not in (None, "") and parse_date(row["date"]) != entry_date:
+                raise ValueError("date differs from the entry's first line")
+            parsed.append(parse_line(row, accounts))
+        except (TypeError, ValueError) as e:
+            errors.append((line_no, str(e)))
+    if errors:
+        return None, errors
+
+    total = sum(amount for _, amount, _ in parsed)
+    if total != 0:
+        return None, [(first_line, f"entry {first_row.get('entry')!r} does not balance: debits and credits differ by {total}")]
+
+    entry = {
+        "description": parsed[0][2][:255] or str(first_row.get("entry") or "").strip()[:255],
+        "date": entry_date,
+        "lines": parsed,
+    }
+    return entry, []
+
+
+def write_entries(entries: list, user=None) -> int:
+    with db_transaction.atomic():
+        journal_entries = JournalEntry.objects.bulk_create([
+            JournalEntry(description=entry["description"], date=entry["date"], created_by=user)
+            for entry in entries
+        ], batch_size=500)
+        transactions = [
+            Transaction(
+                journal_entry=journal_entry,
+                account_id=account_id,
+                amount=amount,
+                description=description or journal_entry.description,
+                date=journal_entry.date,
+                created_by=user,
+            )
+            for journal_entry, entry in zip(journal_entries, entries)
+            for account_id, amount, description in entry["lines"]
+        ]
+        Transaction.objects.bulk_create(transactions, batch_size=2000)
+        ChangeEvent.record(JournalEntry, ChangeEvent.CREATE, [journal_entry.pk for journal_entry in journal_entries])
+        ChangeEvent.record(Transaction, ChangeEvent.CREATE, [transaction.pk for transaction in transactions])
+        refresh_daily_balances({t.account_id for t in transactions}, min(entry["date"] for entry in entries))
+        bump_ledger_generation()
+
+    return len(transactions)
+
+
+def import_journal(fileobj: IO,
+                   file_format: str="csv",
+                   user=None,
+                   chunk_size: int=1000,
+                   dry_run: bool=False) -> dict:
+    accounts = {}
+    for account in chart_of_accounts.all():
+        # Ambiguous reference codes resolve to None and are rejected.
+        code = account.reference_code
+        accounts[code] = None if code in accounts else account.pk
+    closed_through = FiscalPeriod.closed_through()
+
+    result = {
+        "entries": 0,
+        "transactions": 0,
+        "rejected_entries": 0,
+        "errors": [],
+    }
+
+    def flush(entries):
+        result["entries"] += len(entries)
+        if dry_run:
+            result["transactions"] += sum(len(entry["lines"]) for entry in entries)
+        else:
+            result["transactions"] += write_entries(entries, user)
+
+    pending = []
+    for lines in group_entries(read_rows(fileobj, file_format)):
+        entry, errors = validate_entry(lines, accounts, closed_through)
+        if errors:
+            result["rejected_entries"] += 1
+            result["errors"].extend(errors)
+            continue
+
+        pending.append(entry)
+        if len(pending) >= chunk_size:
+            flush(pending)
+            pending = []
+
+    if pending:
+        flush(pending)
+
+    return result
@@ -0,0 +1,247 @@
+import heapq
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from datetime import date
+from functools import wraps
+from typing import Optional
+
+import numpy as np
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger("accounting.instrumentation")
+
+SLOW_QUERY_COUNT = 5
+SAMPLES_PER_KEY = 1000
+
+_current_profile = ContextVar("accounting_profile", default=None)
+_samples = defaultdict(lambda: deque(maxlen=SAMPLES_PER_KEY))
+_samples_lock = threading.Lock()
+
+
+def instrumentation_enabled() -> bool:
+    return getattr(settings, "ACCOUNTING_INSTRUMENTATION", False)
+
+
+def range_width(start_date: Optional[str], end_date: Optional[str]) -> str:
+    if not (start_date and end_date):
+        return "all"
+    try:
+        days = (date.fromisoformat(str(end_date)) - date.fromisoformat(str(start_date))).days + 1
+    except ValueError:
+        return "invalid"
+    for limit, label in ((31, "<=1m"), (92, "<=1q"), (366, "<=1y")):
+        if days <= limit:
+            return label
+    return ">1y"
+
+
+class RequestProfile:
+    # Report sections running on pool threads share one profile, so the
+    # counters are only changed under the lock.
+    def __init__(self, name: str, width: str):
+        self.name = name
+        self.width = width
+        self.queries = 0
+        self.sql_time = 0.0
+        self.rows = 0
+        self.slowest = []
+        self.spans = []
+        self.started = time.perf_counter()
+        self.total_time = None
+        self.streaming = False
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper().
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.queries += 1
+                self.sql_time += elapsed
+                item = (elapsed, self.queries, sql[:500])
+                if len(self.slowest) < SLOW_QUERY_COUNT:
+                    heapq.heappush(self.slowest, item)
+                else:
+                    heapq.heappushpop(self.slowest, item)
+            self.count_fetched_rows(context["cursor"])
+
+    def count_fetched_rows(self, cursor) -> None:
+        # Rows are fetched after execute() returns, so the cursor's fetch
+        # methods are wrapped (once per cursor) to count them.
+        if "fetchmany" in vars(cursor):
+            return
+
+        def counted(fetch, many):
+            def wrapper(*args):
+                result = fetch(*args)
+                fetched = len(result) if many else int(result is not None)
+                with self._lock:
+                    self.rows += fetched
+                return result
+            return wrapper
+
+        cursor.fetchone = counted(cursor.fetchone, False)
+        cursor.fetchmany = counted(cursor.fetchmany, True)
+        cursor.fetchall = counted(cursor.fetchall, True)
+
+    @contextmanager
+    def span(self, name: str):
+        queries, started = self.queries, time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.spans.append((name, time.perf_counter() - started, self.queries - queries))
+
+    def finish(self) -> None:
+        self.total_time = time.perf_counter() - self.started
+
+    def close(self) -> None:
+        self.finish()
+        record_profile(self)
+
+    @property
+    def python_time(self) -> float:
+        return max((self.total_time or 0) - self.sql_time, 0)
+
+    def as_dict(self) -> dict:
+        return {
+            "report": self.name,
+            "range": self.width,
+            "total_ms": round((self.total_time or 0) * 1000, 2),
+            "sql_ms": round(self.sql_time * 1000, 2),
+            "python_ms": round(self.python_time * 1000, 2),
+            "queries": self.queries,
+            "rows": self.rows,
+            "spans": [{"name": name, "ms": round(elapsed * 1000, 2), "queries": queries}
+                      for name, elapsed, queries in self.spans],
+            "slowest": [{"ms": round(elapsed * 1000, 2), "sql": sql}
+                        for elapsed, _, sql in sorted(self.slowest, reverse=True)],
+        }
+
+    def server_timing(self) -> str:
+        metrics = [
+            f'total;dur={self.total_time * 1000:.1f}',
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.queries} queries"',
+            f'app;dur={self.python_time * 1000:.1f};desc="{self.rows} rows"',
+        ]
+        metrics += [f"{name};dur={elapsed * 1000:.1f}" for name, elapsed, _ in self.spans]
+        return ", ".join(metrics)
+
+
+@contextmanager
+def request_profile(name: str, start_date: Optional[str]=None, end_date: Optional[str]=None):
+    # Recorded on exit, unless the view handed it to follow_stream().
+    profile = RequestProfile(name, range_width(start_date, end_date))
+    try:
+        with share_profile(profile):
+            yield profile
+    finally:
+        if not profile.streaming:
+            profile.close()
+
+
+def follow_stream(profile: RequestProfile, content):
+    # A streaming response's body runs its queries after the view returns;
+    # the profile is recorded when the body is exhausted or closed.
+    profile.streaming = True
+    if hasattr(content, "__aiter__"):
+        async def follow():
+            try:
+                async for part in content:
+                    yield part
+            finally:
+                profile.close()
+    else:
+        def follow():
+            try:
+                with share_profile(profile):
+                    yield from content
+            finally:
+                profile.close()
+    return follow()
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current_profile.get()
+
+
+@contextmanager
+def share_profile(profile: Optional[RequestProfile]):
+    # Lets a worker thread report its queries and spans into the request's
+    # profile; the thread's own connections need their own wrapper.
+    if profile is None:
+        yield
+        return
+    token = _current_profile.set(profile)
+    try:
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(profile))
+            yield
+    finally:
+        _current_profile.reset(token)
+
+
+def record_profile(profile: RequestProfile) -> None:
+    with _samples_lock:
+        _samples[(profile.name, profile.width)].append((profile.total_time, profile.queries))
+    logger.info(json.dumps(profile.as_dict(), ensure_ascii=False))
+
+
+def instrumented(name: str):
+    # Times a ViewComponent method as a span of the current request profile.
+    def decorator(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            profile = _current_profile.get()
+            if profile is None:
+                return method(*args, **kwargs)
+            with profile.span(name):
+                return method(*args, **kwargs)
+
+        @wraps(method)
+        async def async_wrapper(*args, **kwargs):
+            profile = _current_profile.get()
+            if profile is None:
+                return await method(*args, **kwargs)
+            with profile.span(name):
+                return await method(*args, **kwargs)
+
+        return async_wrapper if iscoroutinefunction(method) else wrapper
+    return decorator
+
+
+def summarize_samples() -> list:
+    with _samples_lock:
+        samples = {key: list(values) for key, values in _samples.items()}
+
+    summary = []
+    for (name, width), values in sorted(samples.items()):
+        durations = np.array([total for total, _ in values]) * 1000
+        queries = np.array([count for _, count in values])
+        summary.append({
+            "report": name,
+            "range": width,
+            "count": len(values),
+            "p50_ms": float(np.percentile(durations, 50)),
+            "p95_ms": float(np.percentile(durations, 95)),
+            "avg_queries": float(queries.mean()),
+        })
+    return summary
+
+
+def reset_samples() -> None:
+    with _samples_lock:
+        _samples.clear()
@@ -0,0 +1,47 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from accounting.changefeed import DEFAULT_LIMIT, prune_changes, read_changes
+
+
+class Command(BaseCommand):
+    help = ("Print ledger changes after a cursor as JSON lines, optionally keeping the cursor in a file "
+            "so each run continues where the last one stopped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--after", type=int, help="Print changes after this event id.")
+        parser.add_argument("--cursor-file", help="Read the cursor from, and save the new cursor to, this file.")
+        parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT, help="Changes read per batch.")
+        parser.add_argument("--prune-days", type=int, help="Delete changes older than this many days and exit.")
+
+    def handle(self, *args, **options):
+        if options["prune_days"] is not None:
+            deleted = prune_changes(options["prune_days"])
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} change(s)."))
+            return
+        if options["limit"] < 1:
+            raise CommandError("--limit must be positive.")
+
+        cursor_file = Path(options["cursor_file"]) if options["cursor_file"] else None
+        after = options["after"]
+        if after is None:
+            after = 0
+            if cursor_file and cursor_file.exists():
+                try:
+                    after = int(cursor_file.read_text().strip() or 0)
+                except ValueError:
+                    raise CommandError(f"{cursor_file} does not contain a cursor.")
+
+        while True:
+            feed = read_changes(after, options["limit"])
+            for change in feed["changes"]:
+                self.stdout.write(json.dumps(change, cls=DjangoJSONEncoder, ensure_ascii=False))
+            after = feed["next_cursor"]
+            # Saved after every batch so an interrupted run resumes there.
+            if cursor_file:
+                cursor_file.write_text(f"{after}\n")
+            if not feed["has_more"]:
+                break
@@ -0,0 +1,23 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from accounting.models import FiscalPeriod
+from accounting.periods import close_period
+
+
+class Command(BaseCommand):
+    help = "Close a fiscal period: post its closing entry and carry balances forward."
+
+    def add_arguments(self, parser):
+        parser.add_argument("period_id", type=int)
+
+    def handle(self, *args, **options):
+        period = FiscalPeriod.objects.filter(pk=options["period_id"]).first()
+        if period is None:
+            raise CommandError(f"Fiscal period {options['period_id']} does not exist.")
+
+        try:
+            close_period(period)
+        except ValidationError as e:
+            raise CommandError("; ".join(e.messages))
+        self.stdout.write(self.style.SUCCESS(f"{period} closed."))
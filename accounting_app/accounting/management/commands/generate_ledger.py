@@ -0,0 +1,31 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from accounting.synthetic import generate_ledger
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic ledger on the Vietnamese chart of accounts for testing and benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--accounts", type=int, default=30, help="Number of accounts in the chart.")
+        parser.add_argument("--entries", type=int, default=1000, help="Number of journal entries.")
+        parser.add_argument("--lines", type=int, default=2, help="Transactions per journal entry.")
+        parser.add_argument("--start-date", type=date.fromisoformat, default=date(2024, 1, 1))
+        parser.add_argument("--days", type=int, default=365, help="Number of days the entries are spread over.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        summary = generate_ledger(
+            accounts=options["accounts"],
+            entries=options["entries"],
+            lines_per_entry=options["lines"],
+            start_date=options["start_date"],
+            days=options["days"],
+            seed=options["seed"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {summary['entries']} entries ({summary['transactions']} transactions) "
+            f"over {summary['accounts']} accounts."
+        ))
@@ -0,0 +1,38 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounting.importers import IMPORT_FORMATS, import_journal
+
+
+class Command(BaseCommand):
+    help = "Import journal entries from a CSV or XLSX file, rejecting entries that do not balance."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=IMPORT_FORMATS,
+                            help="File format; defaults to the file extension.")
+        parser.add_argument("--chunk-size", type=int, default=1000,
+                            help="Number of entries written per database transaction.")
+        parser.add_argument("--dry-run", action="store_true", help="Validate the file without writing anything.")
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        file_format = options["format"] or path.suffix.lstrip(".").lower()
+        if file_format not in IMPORT_FORMATS:
+            raise CommandError(f"Cannot infer the format of {path}; pass --format.")
+
+        try:
+            with path.open("rb") as fileobj:
+                result = import_journal(fileobj, file_format, chunk_size=options["chunk_size"],
+                                        dry_run=options["dry_run"])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for line_no, message in result["errors"]:
+            self.stderr.write(f"line {line_no}: {message}")
+        verb = "Validated" if options["dry_run"] else "Imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {result['entries']} entries ({result['transactions']} transactions); "
+            f"rejected {result['rejected_entries']} entries."
+        ))
@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from accounting.components import ViewComponent
+from accounting.precompute import precompute_reports
+from accounting.report_cache import get_ledger_generation
+
+
+class Command(BaseCommand):
+    help = ("Precompute the configured reports for the standard periods into report snapshots, "
+            "again each time postings settle.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Precompute now and exit.")
+        parser.add_argument("--interval", type=float, default=10,
+                            help="Seconds between checks of the ledger generation.")
+        parser.add_argument("--settle", type=float,
+                            default=getattr(settings, "ACCOUNTING_PRECOMPUTE_SETTLE_SECONDS", 30),
+                            help="Seconds without postings before the reports are recomputed.")
+
+    def handle(self, *args, **options):
+        view_components = ViewComponent()
+        computed = None
+        while True:
+            close_old_connections()
+            generation, updated_at = get_ledger_generation()
+            settled = (timezone.now() - updated_at).total_seconds() >= options["settle"]
+            if options["once"] or (generation != computed and settled):
+                count = precompute_reports(view_components)
+                computed = generation
+                self.stdout.write(self.style.SUCCESS(f"Precomputed {count} report snapshot(s) at generation {generation}."))
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
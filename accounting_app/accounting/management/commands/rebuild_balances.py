@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounting.snapshots import rebuild_daily_balances, verify_daily_balances
+
+
+class Command(BaseCommand):
+    help = "Rebuild or verify the per-account daily balance snapshots from the transaction ledger."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verify", action="store_true",
+                            help="Compare the stored snapshots with the ledger without changing them.")
+
+    def handle(self, *args, **options):
+        if options["verify"]:
+            mismatches = verify_daily_balances()
+            for (account_id, day), expected, stored in mismatches:
+                expected = expected.balance if expected else "no snapshot"
+                stored = stored.balance if stored else "no snapshot"
+                self.stderr.write(f"account {account_id} on {day}: expected {expected}, stored {stored}")
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} daily balance snapshot(s) do not match the ledger.")
+            self.stdout.write(self.style.SUCCESS("Daily balance snapshots match the ledger."))
+        else:
+            count = rebuild_daily_balances()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} daily balance snapshot(s)."))
@@ -0,0 +1,57 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounting.importers import IMPORT_FORMATS
+from accounting.models import Account, BankStatement
+from accounting.reconciliation import DEFAULT_WINDOW_DAYS, import_statement, reconcile_statement
+
+
+class Command(BaseCommand):
+    help = ("Import a bank statement for a cash or bank account and match its lines against the account's "
+            "transactions, or re-run the matching of an imported statement.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", help="CSV or XLSX statement to import.")
+        parser.add_argument("--account", type=int, help="Reference code of the account the statement is for.")
+        parser.add_argument("--statement", type=int, help="Re-run the matching of this imported statement.")
+        parser.add_argument("--format", choices=IMPORT_FORMATS, help="File format; defaults to the file extension.")
+        parser.add_argument("--window", type=int, default=DEFAULT_WINDOW_DAYS,
+                            help="Days a transaction's date may differ from the statement line's.")
+
+    def handle(self, *args, **options):
+        if options["statement"]:
+            try:
+                statement = BankStatement.objects.select_related("account").get(pk=options["statement"])
+            except BankStatement.DoesNotExist:
+                raise CommandError(f"No statement {options['statement']}.")
+        else:
+            if not (options["path"] and options["account"]):
+                raise CommandError("Pass a statement file and --account, or --statement.")
+            try:
+                account = Account.objects.get(reference_code=options["account"])
+            except (Account.DoesNotExist, Account.MultipleObjectsReturned):
+                raise CommandError(f"No single account with reference code {options['account']}.")
+
+            path = Path(options["path"])
+            file_format = options["format"] or path.suffix.lstrip(".").lower()
+            if file_format not in IMPORT_FORMATS:
+                raise CommandError(f"Cannot infer the format of {path}; pass --format.")
+            try:
+                with path.open("rb") as fileobj:
+                    imported = import_statement(fileobj, account, file_format, name=path.name)
+            except (OSError, ValueError) as e:
+                raise CommandError(str(e))
+
+            for line_no, message in imported["errors"]:
+                self.stderr.write(f"line {line_no}: {message}")
+            statement = imported["statement"]
+            if statement is None:
+                raise CommandError("The file has no valid statement lines.")
+            self.stdout.write(f"Imported {imported['lines']} lines into statement {statement.pk}.")
+
+        result = reconcile_statement(statement, options["window"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Matched {result['matched_by_reference']} lines by reference and {result['matched_by_amount']} "
+            f"by amount and date; {result['unmatched_lines']} unmatched, {result['released']} released."
+        ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounting.components import ViewComponent
+from accounting.report_cache import report_cache
+
+
+class Command(BaseCommand):
+    help = "Show hit/miss statistics for the report cache, or clear it."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clear", action="store_true", help="Remove every cached report and statistic.")
+
+    def handle(self, *args, **options):
+        if report_cache.cache is None:
+            raise CommandError("The report cache is disabled (ACCOUNTING_REPORT_CACHE is None).")
+        if not report_cache.is_shared:
+            raise CommandError("The report cache uses LocMemCache, which is private to each process, so this "
+                               "command would only see its own empty copy. Set REPORT_CACHE_BACKEND to a shared "
+                               "backend such as django.core.cache.backends.filebased.FileBasedCache.")
+
+        if options["clear"]:
+            report_cache.clear()
+            self.stdout.write(self.style.SUCCESS("Report cache cleared."))
+            return
+
+        reports = [method.report for method in vars(ViewComponent).values() if hasattr(method, "report")]
+        for report, stats in report_cache.stats(reports).items():
+            hit_rate = f"{stats['hit_rate']:.1%}" if stats["hit_rate"] is not None else "-"
+            self.stdout.write(f"{report}: {stats['hits']} hits, {stats['misses']} misses, hit rate {hit_rate}")
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:21
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Q, Sum
+
+
+def build_daily_balances(apps, schema_editor):
+    Transaction = apps.get_model("accounting", "Transaction")
+    AccountDailyBalance = apps.get_model("accounting", "AccountDailyBalance")
+
+    rows = (
+        Transaction.objects
+        .values("account_id", "journal_entry__date")
+        .annotate(
+            debit=Sum("amount", filter=Q(amount__gt=0)),
+            credit=Sum("amount", filter=Q(amount__lt=0)),
+        )
+        .order_by("account_id", "journal_entry__date")
+    )
+
+    cents = Decimal("0.01")
+    snapshots = []
+    running = {}
+    for row in rows.iterator(chunk_size=2000):
+        debit = Decimal(row["debit"] or 0).quantize(cents)
+        credit = Decimal(row["credit"] or 0).quantize(cents)
+        if not debit and not credit:
+            continue
+        balance = running.get(row["account_id"], Decimal(0)) + debit + credit
+        running[row["account_id"]] = balance
+        snapshots.append(AccountDailyBalance(
+            account_id=row["account_id"],
+            date=row["journal_entry__date"],
+            debit=debit,
+            credit=credit,
+            movement=debit + credit,
+            balance=balance,
+        ))
+
+    AccountDailyBalance.objects.bulk_create(snapshots, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0002_transaction_description'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountDailyBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('debit', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('credit', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('movement', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_balances', to='accounting.account')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('account', 'date'), name='unique_account_daily_balance')],
+            },
+        ),
+        migrations.RunPython(build_daily_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:02
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_entry_dates(apps, schema_editor):
+    JournalEntry = apps.get_model("accounting", "JournalEntry")
+    Transaction = apps.get_model("accounting", "Transaction")
+    entry_date = JournalEntry.objects.filter(pk=OuterRef("journal_entry_id")).values("date")[:1]
+    Transaction.objects.update(date=Subquery(entry_date))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0004_fiscal_period'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='date',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.RunPython(copy_entry_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='transaction',
+            name='date',
+            field=models.DateField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='account',
+            name='name',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', 'date', 'amount'], name='transaction_account_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['date', 'account', 'amount'], name='transaction_date_account_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+# Accounts the reports used to look up by name.
+ROLE_BY_NAME = {
+    "Lợi nhuận sau thuế chưa phân phối": "retained_earnings",
+    "Chi cổ tức bằng tiền mặt": "dividends",
+}
+
+
+def assign_roles(apps, schema_editor):
+    Account = apps.get_model("accounting", "Account")
+    for name, role in ROLE_BY_NAME.items():
+        Account.objects.filter(name=name, role="").update(role=role)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0006_ledger_generation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='role',
+            field=models.CharField(blank=True, choices=[('retained_earnings', 'Retained earnings'), ('current_year_earnings', 'Current-year earnings'), ('dividends', 'Dividends')], db_index=True, max_length=30),
+        ),
+        migrations.RunPython(assign_roles, migrations.RunPython.noop),
+    ]
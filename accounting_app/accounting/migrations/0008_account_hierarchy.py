@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
+
+
+def set_root_paths(apps, schema_editor):
+    # Existing accounts all start as roots.
+    Account = apps.get_model("accounting", "Account")
+    Account.objects.update(path=Concat(Cast("id", CharField()), Value("/")))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0007_account_role'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='children', to='accounting.account'),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(set_root_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0008_account_hierarchy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report', models.CharField(max_length=100)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('variant', models.CharField(blank=True, max_length=100)),
+                ('generation', models.BigIntegerField()),
+                ('computed_at', models.DateTimeField()),
+                ('components', models.BinaryField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('report', 'start_date', 'end_date', 'variant'), name='unique_report_snapshot')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0009_report_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='tax_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='tax_rate',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='accounting.taxrate'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0012_bank_reconciliation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChartOfAccountsVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
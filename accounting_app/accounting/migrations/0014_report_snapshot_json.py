@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+def delete_snapshots(apps, schema_editor):
+    # Pickled snapshots cannot be read as JSON; precompute_reports rebuilds
+    # them on its next run.
+    apps.get_model("accounting", "ReportSnapshot").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0013_chart_of_accounts_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_snapshots, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='reportsnapshot',
+            name='components',
+            field=models.JSONField(),
+        ),
+    ]
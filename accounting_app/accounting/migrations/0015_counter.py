@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+def copy_counters(apps, schema_editor):
+    Counter = apps.get_model('accounting', 'Counter')
+    sources = [
+        ('ledger_generation', apps.get_model('accounting', 'LedgerGeneration'), 'generation'),
+        ('chart_of_accounts', apps.get_model('accounting', 'ChartOfAccountsVersion'), 'version'),
+    ]
+    for name, model, field in sources:
+        value = model.objects.filter(pk=1).values_list(field, flat=True).first()
+        if value is not None:
+            Counter.objects.create(name=name, value=value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounting', '0014_report_snapshot_json'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(copy_counters, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='ChartOfAccountsVersion',
+        ),
+        migrations.DeleteModel(
+            name='LedgerGeneration',
+        ),
+    ]
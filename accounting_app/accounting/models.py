@@ -1,4 +1,12 @@
-from django.db import models
+import time
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction as db_transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 
@@ -24,10 +32,33 @@ class Account(ChangeLog):
         ("Debit", "Debit"),
         ("Credit", "Credit"),
     ]
-    name = models.CharField(max_length=255)
+    # Accounts the statements and the period close treat specially.
+    RETAINED_EARNINGS = "retained_earnings"
+    CURRENT_YEAR_EARNINGS = "current_year_earnings"
+    DIVIDENDS = "dividends"
+    ROLES = [
+        (RETAINED_EARNINGS, "Retained earnings"),
+        (CURRENT_YEAR_EARNINGS, "Current-year earnings"),
+        (DIVIDENDS, "Dividends"),
+    ]
+    name = models.CharField(max_length=255, db_index=True)
     account_type = models.CharField(max_length=20, choices=ACCOUNT_TYPES)
     normal_balance = models.CharField(max_length=10, choices=NORMAL_BALANCE, blank=True)
     reference_code = models.IntegerField()
+    role = models.CharField(max_length=30, choices=ROLES, blank=True, db_index=True)
+    parent = models.ForeignKey("self", on_delete=models.PROTECT, null=True, blank=True, related_name="children")
+    # Materialized path of ids from the root down to this account, e.g.
+    # "3/17/42/"; subtotals add each balance to every id on it.
+    path = models.CharField(max_length=255, blank=True, editable=False, db_index=True)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    def clean(self):
+        if self.parent_id is None:
+            return
+        if self.pk and (self.parent_id == self.pk or f"/{self.pk}/" in f"/{self.parent.path}"):
+            raise ValidationError({"parent": "An account cannot be placed under itself or one of its sub-accounts."})
+        if self.parent.account_type != self.account_type:
+            raise ValidationError({"parent": f"Sub-accounts must have the parent's type ({self.parent.account_type})."})
 
     def save(self, *args, **kwargs):
         if not self.normal_balance:
@@ -35,7 +66,29 @@ class Account(ChangeLog):
                 self.normal_balance = "Debit"
             else:
                 self.normal_balance = "Credit"
-        super().save(*args, **kwargs)
+        # The post_save handlers bump the chart of accounts version; path and
+        # depth commit with it, so no process reloads the chart without them.
+        with db_transaction.atomic():
+            super().save(*args, **kwargs)
+            self.update_path()
+
+    def update_path(self) -> None:
+        parent_path = self.parent.path if self.parent_id else ""
+        path = f"{parent_path}{self.pk}/"
+        if path == self.path:
+            return
+        depth = path.count("/") - 1
+        old_path, old_depth = self.path, self.depth
+        Account.objects.filter(pk=self.pk).update(path=path, depth=depth)
+        if old_path:
+            # Re-root the whole subtree in one statement.
+            descendants = Account.objects.filter(path__startswith=old_path).exclude(pk=self.pk)
+            moved = list(descendants.values_list("pk", flat=True))
+            if moved:
+                descendants.update(path=Concat(Value(path), Substr("path", len(old_path) + 1)),
+                                   depth=F("depth") + (depth - old_depth))
+                ChangeEvent.record(Account, ChangeEvent.UPDATE, moved)
+        self.path, self.depth = path, depth
 
     def __str__(self):
         return f"({self.account_type}) {self.reference_code} {self.name}"
@@ -44,6 +97,23 @@ class Account(ChangeLog):
 class JournalEntry(ChangeLog):
     description = models.CharField(max_length=255)
     date = models.DateField()
+    is_closing = models.BooleanField(default=False, editable=False)
+
+    def clean(self):
+        closed_through = FiscalPeriod.closed_through()
+        if self.date and closed_through and self.date <= closed_through:
+            raise ValidationError({"date": f"The fiscal period containing {self.date} is closed."})
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            return
+        # Keep the date denormalized onto the entry's transactions in sync.
+        moved = list(Transaction.objects.filter(journal_entry=self).exclude(date=self.date).values_list("pk", flat=True))
+        if moved:
+            Transaction.objects.filter(pk__in=moved).update(date=self.date)
+            ChangeEvent.record(Transaction, ChangeEvent.UPDATE, moved)
 
     def __str__(self):
         return f"{self.description}"
@@ -57,15 +127,47 @@ class Transaction(ChangeLog):
     description = models.CharField(max_length=1000, blank=True)
     account = models.ForeignKey(Account, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=12, decimal_places=2)
+    date = models.DateField(editable=False)
+    # The line's amount is the taxable base; tax_amount follows the rate
+    # (see taxes.py) and is kept for reporting only.
+    tax_rate = models.ForeignKey("TaxRate", on_delete=models.PROTECT, null=True, blank=True)
+    tax_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+
+    def clean(self):
+        closed_through = FiscalPeriod.closed_through()
+        if self.journal_entry_id and closed_through and self.journal_entry.date <= closed_through:
+            raise ValidationError(f"The fiscal period containing {self.journal_entry.date} is closed.")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_tax = (instance.__dict__.get("amount"), instance.__dict__.get("tax_rate_id"))
+        return instance
 
     def save(self, *args, **kwargs):
         if not self.description and self.journal_entry:
             self.description = self.journal_entry.description
+        self.date = self.journal_entry.date
+        # The stored tax stands while the amount and rate do; otherwise the
+        # rate comes from the related object when it is already loaded.
+        if (self.amount, self.tax_rate_id) != getattr(self, "_loaded_tax", None):
+            self.tax_amount = 0
+            if self.tax_rate_id and self.amount:
+                rate = (self.tax_rate.rate if Transaction.tax_rate.is_cached(self)
+                        else TaxRate.objects.values_list("rate", flat=True).get(pk=self.tax_rate_id))
+                self.tax_amount = (self.amount * rate / 100).quantize(Decimal("0.01"), ROUND_HALF_UP)
         super().save(*args, **kwargs)
+        self._loaded_tax = (self.amount, self.tax_rate_id)
 
     def __str__(self):
         return f"{self.account} {self.description} {self.amount:,.2f}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["account", "date", "amount"], name="transaction_account_date_idx"),
+            models.Index(fields=["date", "account", "amount"], name="transaction_date_account_idx"),
+        ]
+
 
 class TaxRate(ChangeLog):
     name = models.CharField(max_length=255)
@@ -73,3 +175,189 @@ class TaxRate(ChangeLog):
 
     def __str__(self):
         return f"{self.name} {self.rate}%"
+
+
+class AccountDailyBalance(models.Model):
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name="daily_balances")
+    date = models.DateField()
+    debit = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    credit = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    movement = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    balance = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.account} {self.date} {self.balance:,.2f}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["account", "date"], name="unique_account_daily_balance"),
+        ]
+
+
+class FiscalPeriod(ChangeLog):
+    name = models.CharField(max_length=255)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    is_closed = models.BooleanField(default=False, editable=False)
+    closed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    closing_entry = models.OneToOneField(JournalEntry, on_delete=models.PROTECT, null=True, blank=True, 
+                                         editable=False, related_name="closed_period")
+
+    @classmethod
+    def closed_through(cls):
+        return cls.objects.filter(is_closed=True).aggregate(end_date=models.Max("end_date"))["end_date"]
+
+    @classmethod
+    def last_closed(cls):
+        return cls.objects.filter(is_closed=True).order_by("-end_date").first()
+
+    def clean(self):
+        if self.start_date and self.end_date and self.start_date > self.end_date:
+            raise ValidationError({"end_date": "The period must end on or after its start date."})
+
+    def __str__(self):
+        return f"{self.name} ({self.start_date} - {self.end_date})"
+
+
+class OpeningBalance(models.Model):
+    # Balances as of period.end_date, carried forward into the next period.
+    period = models.ForeignKey(FiscalPeriod, on_delete=models.CASCADE, related_name="opening_balances")
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name="opening_balances")
+    debit = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    credit = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    balance = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.account} {self.period.end_date} {self.balance:,.2f}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["period", "account"], name="unique_period_opening_balance"),
+        ]
+
+
+class Counter(models.Model):
+    # Named counters shared by every process. The ledger generation advances
+    # on every ledger write and report caches key on it; the chart of
+    # accounts version advances on every account change and each process's
+    # registry reloads when it sees a new value.
+    LEDGER_GENERATION = "ledger_generation"
+    CHART_OF_ACCOUNTS = "chart_of_accounts"
+    name = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def read(cls, name: str) -> tuple:
+        row = cls.objects.filter(name=name).values_list("value", "updated_at").first()
+        if row is None:
+            # Seed from the clock so a recreated row never reuses an old value.
+            counter, _ = cls.objects.get_or_create(name=name, defaults={"value": time.time_ns()})
+            row = (counter.value, counter.updated_at)
+        return row
+
+    @classmethod
+    def bump(cls, name: str) -> None:
+        if not cls.objects.filter(name=name).update(value=F("value") + 1, updated_at=timezone.now()):
+            cls.objects.get_or_create(name=name, defaults={"value": time.time_ns()})
+
+    def __str__(self):
+        return f"{self.name} {self.value} ({self.updated_at})"
+
+
+class ReportSnapshot(models.Model):
+    # A report precomputed for a standard period by the precompute_reports
+    # worker. generation is the ledger generation it was computed from;
+    # components are stored as plain JSON (see precompute.py).
+    report = models.CharField(max_length=100)
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    variant = models.CharField(max_length=100, blank=True)
+    generation = models.BigIntegerField()
+    computed_at = models.DateTimeField()
+    components = models.JSONField()
+
+    def __str__(self):
+        return f"{self.report} {self.start_date or ''} - {self.end_date or ''} ({self.computed_at})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["report", "start_date", "end_date", "variant"],
+                                    name="unique_report_snapshot"),
+        ]
+
+
+class ChangeEvent(models.Model):
+    # Append-only change feed of the ledger for downstream consumers; the id
+    # is the cursor. Rows are written by the model signals and by the bulk
+    # writers (posting, imports) alongside their own writes.
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+    ACTIONS = [
+        (CREATE, "Create"),
+        (UPDATE, "Update"),
+        (DELETE, "Delete"),
+    ]
+    id = models.BigAutoField(primary_key=True)
+    model = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def record(cls, model, action, object_ids, batch_size: int=2000) -> None:
+        # object_ids may be a query iterator; events are built and written
+        # batch_size at a time, so memory stays bounded however many there are.
+        object_ids = iter(object_ids)
+        while batch := list(islice(object_ids, batch_size)):
+            cls.objects.bulk_create([
+                cls(model=model._meta.model_name, object_id=object_id, action=action)
+                for object_id in batch
+            ])
+
+    def __str__(self):
+        return f"#{self.id} {self.action} {self.model} {self.object_id}"
+
+
+class BankStatement(ChangeLog):
+    # An imported bank statement for a cash or bank account; its lines are
+    # matched against the account's transactions by reconciliation.py.
+    account = models.ForeignKey(Account, on_delete=models.PROTECT, related_name="bank_statements")
+    name = models.CharField(max_length=255)
+
+    def __str__(self):
+        return f"{self.name} ({self.account})"
+
+
+class BankStatementLine(models.Model):
+    statement = models.ForeignKey(BankStatement, on_delete=models.CASCADE, related_name="lines")
+    date = models.DateField()
+    # Signed like the ledger: deposits are debits to the bank account.
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    reference = models.CharField(max_length=100, blank=True)
+    description = models.CharField(max_length=1000, blank=True)
+
+    def __str__(self):
+        return f"{self.date} {self.reference} {self.amount:,.2f}"
+
+
+class BankMatch(models.Model):
+    # Reconciliation state: a statement line and the transaction it was
+    # matched to, each matched at most once. Deleting the transaction
+    # deletes the match and leaves the line to be matched again.
+    REFERENCE = "reference"
+    AMOUNT_DATE = "amount_date"
+    MANUAL = "manual"
+    RULES = [
+        (REFERENCE, "Amount and reference"),
+        (AMOUNT_DATE, "Amount and date"),
+        (MANUAL, "Manual"),
+    ]
+    line = models.OneToOneField(BankStatementLine, on_delete=models.CASCADE, related_name="match")
+    transaction = models.OneToOneField(Transaction, on_delete=models.CASCADE, related_name="bank_match")
+    rule = models.CharField(max_length=20, choices=RULES, default=MANUAL)
+    matched_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.line} - {self.transaction}"
@@ -0,0 +1,89 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Account, AccountDailyBalance, FiscalPeriod, JournalEntry, OpeningBalance, Transaction
+from .registry import chart_of_accounts
+from .utils import cents_to_decimal, get_opening_balances, quantize_amount, sum_cents
+
+
+
+def ensure_period_open(day) -> None:
+    if not day:
+        return
+    closed_through = FiscalPeriod.closed_through()
+    if closed_through and day <= closed_through:
+        raise ValidationError(f"The fiscal period containing {day} is closed.")
+
+
+def calc_closing_balances(period: FiscalPeriod) -> dict:
+    # Balances as of period.end_date: the previous close's opening balances
+    # plus the daily movements since then.
+    closed_through, openings = get_opening_balances()
+    snapshots = AccountDailyBalance.objects.filter(date__lte=period.end_date)
+    if closed_through:
+        snapshots = snapshots.filter(date__gt=closed_through)
+
+    balances = {}
+    rows = list(openings.values("account_id", "debit", "credit", "balance"))
+    rows += [
+        dict(row, **{column: cents_to_decimal(row[column]) for column in ("debit", "credit", "balance")})
+        for row in (
+            snapshots
+            .values("account_id")
+            .annotate(debit=sum_cents("debit"), credit=sum_cents("credit"), balance=sum_cents("movement"))
+            .order_by()
+        )
+    ]
+    for row in rows:
+        totals = balances.setdefault(row["account_id"], {"debit": quantize_amount(0),
+                                                          "credit": quantize_amount(0),
+                                                          "balance": quantize_amount(0)})
+        for column in totals:
+            totals[column] += quantize_amount(row[column])
+
+    return balances
+
+
+def close_period(period: FiscalPeriod, user=None, retained_earnings_account: Account=None) -> FiscalPeriod:
+    if period.is_closed:
+        raise ValidationError(f"{period} is already closed.")
+    closed_through = FiscalPeriod.closed_through()
+    if closed_through and period.start_date <= closed_through:
+        raise ValidationError(f"{period} overlaps a closed period ending {closed_through}.")
+    if retained_earnings_account is None:
+        retained_earnings_account = next(iter(chart_of_accounts.by_role(Account.RETAINED_EARNINGS)), None)
+    if retained_earnings_account is None:
+        raise ValidationError("No account has the retained earnings role.")
+
+    with db_transaction.atomic():
+        balances = calc_closing_balances(period)
+        income_accounts = {acc.pk for acc in chart_of_accounts.by_type("Revenue", "Expense")} & balances.keys()
+        closing_lines = [(account_id, -balances[account_id]["balance"])
+                         for account_id in sorted(income_accounts)
+                         if balances[account_id]["balance"]]
+
+        if closing_lines:
+            closing_entry = JournalEntry.objects.create(
+                description=f"Closing entry {period.name}",
+                date=period.end_date,
+                is_closing=True,
+                created_by=user,
+            )
+            closing_lines.append((retained_earnings_account.pk, -sum(amount for _, amount in closing_lines)))
+            for account_id, amount in closing_lines:
+                Transaction.objects.create(journal_entry=closing_entry, account_id=account_id,
+                                           amount=amount, created_by=user)
+            period.closing_entry = closing_entry
+            balances = calc_closing_balances(period)
+
+        OpeningBalance.objects.bulk_create([
+            OpeningBalance(period=period, account_id=account_id, **totals)
+            for account_id, totals in balances.items()
+        ])
+        period.is_closed = True
+        period.closed_at = timezone.now()
+        period.save()
+
+    return period
@@ -0,0 +1,175 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date
+from typing import Iterable
+
+from django.core.exceptions import ValidationError
+from django.db import transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Account, ChangeEvent, JournalEntry, TaxRate, Transaction
+from .periods import ensure_period_open
+from .report_cache import bump_ledger_generation
+from .signals import bulk_posting
+from .snapshots import apply_movements, split_movements
+from .taxes import recalculate_tax_amounts
+from .utils import cents_to_decimal, quantize_amount, sum_cents
+
+
+_deferred_refresh = ContextVar("accounting_deferred_refresh", default=None)
+
+
+class DeferredRefresh:
+    # Snapshot changes and whether to bump the ledger generation, collected
+    # over a batch of postings in one transaction (see posting_queue.py).
+    def __init__(self):
+        self.movements = []
+        self.posted = False
+
+    @contextmanager
+    def savepoint(self):
+        # A write that rolls back takes its snapshot changes with it.
+        mark = len(self.movements)
+        try:
+            with db_transaction.atomic():
+                yield
+        except BaseException:
+            del self.movements[mark:]
+            raise
+
+
+@contextmanager
+def deferred_refresh():
+    # The snapshots are updated and the ledger generation bumped once at the
+    # end of the batch instead of after every entry.
+    pending = DeferredRefresh()
+    token = _deferred_refresh.set(pending)
+    try:
+        yield pending
+    finally:
+        _deferred_refresh.reset(token)
+    apply_movements(pending.movements)
+    if pending.posted:
+        bump_ledger_generation()
+
+
+def is_empty_line(transaction: Transaction) -> bool:
+    return not transaction.account_id or not transaction.amount
+
+
+def check_entry_balance(journal_entry: JournalEntry) -> None:
+    total = Transaction.objects.filter(journal_entry=journal_entry).aggregate(total=sum_cents("amount"))["total"]
+    total = cents_to_decimal(total)
+    if total != 0:
+        raise ValidationError(f"{journal_entry} does not balance: debits and credits differ by {total}.")
+
+
+def post_transactions(journal_entry: JournalEntry,
+                      saved: Iterable[Transaction]=(),
+                      deleted: Iterable[Transaction]=(),
+                      user=None) -> dict:
+    # saved: new or changed lines of journal_entry, deleted: lines to remove.
+    # Lines without an account or amount are dropped, and the entry must
+    # balance afterwards or nothing is written.
+    saved = list(saved)
+    deleted_ids = {transaction.pk for transaction in deleted if transaction.pk}
+    existing_ids = deleted_ids | {transaction.pk for transaction in saved if transaction.pk}
+
+    with db_transaction.atomic(), bulk_posting():
+        previous = []
+        if existing_ids:
+            previous = list(Transaction.objects.filter(pk__in=existing_ids).values_list("account_id", "date", "amount"))
+        ensure_period_open(min([journal_entry.date] + [day for _, day, _ in previous]))
+
+        now = timezone.now()
+        created, changed = [], []
+        for transaction in saved:
+            if is_empty_line(transaction):
+                if transaction.pk:
+                    deleted_ids.add(transaction.pk)
+                continue
+            transaction.journal_entry = journal_entry
+            transaction.date = journal_entry.date
+            if not transaction.tax_rate_id:
+                transaction.tax_amount = 0
+            if not transaction.description:
+                transaction.description = journal_entry.description
+            if transaction.pk:
+                transaction.updated_at = now
+                changed.append(transaction)
+            else:
+                if transaction.created_by_id is None:
+                    transaction.created_by = user
+                created.append(transaction)
+
+        Transaction.objects.bulk_create(created, batch_size=2000)
+        Transaction.objects.bulk_update(changed, ["account", "amount", "description", "date", "tax_rate",
+                                                  "tax_amount", "updated_at"])
+        removed = list(
+            Transaction.objects
+            .filter(Q(pk__in=deleted_ids) | Q(journal_entry=journal_entry, amount=0))
+            .values_list("pk", flat=True)
+        )
+        deleted_count = 0
+        if removed:
+            deleted_count, _ = Transaction.objects.filter(pk__in=removed).delete()
+        check_entry_balance(journal_entry)
+        if any(transaction.tax_rate_id for transaction in created + changed):
+            recalculate_tax_amounts(Transaction.objects.filter(journal_entry=journal_entry))
+        ChangeEvent.record(Transaction, ChangeEvent.CREATE, [transaction.pk for transaction in created])
+        ChangeEvent.record(Transaction, ChangeEvent.UPDATE, [transaction.pk for transaction in changed])
+        ChangeEvent.record(Transaction, ChangeEvent.DELETE, removed)
+
+        # Only the days the entry's lines leave and land on change; later
+        # balances move by the difference.
+        movements = split_movements(previous, sign=-1)
+        movements += split_movements([(transaction.account_id, transaction.date, transaction.amount)
+                                      for transaction in created + changed])
+        pending = _deferred_refresh.get()
+        if pending is not None:
+            pending.movements += movements
+            pending.posted = True
+        else:
+            apply_movements(movements)
+            bump_ledger_generation()
+
+    result = {
+        "created": len(created),
+        "updated": len(changed),
+        "deleted": deleted_count,
+    }
+    return result
+
+
+def post_entry(description: str,
+               entry_date: date,
+               lines: Iterable[tuple],
+               user=None) -> JournalEntry:
+    # lines: (account or account id, amount, description), optionally
+    # followed by a tax rate or tax rate id.
+    with db_transaction.atomic():
+        journal_entry = JournalEntry.objects.create(description=description, date=entry_date, created_by=user)
+        transactions = []
+        for line in lines:
+            account, amount, line_description, tax_rate = (*line, None)[:4]
+            transactions.append(Transaction(
+                account_id=account.pk if isinstance(account, Account) else account,
+                amount=amount,
+                description=line_description or "",
+                tax_rate_id=tax_rate.pk if isinstance(tax_rate, TaxRate) else tax_rate,
+            ))
+        post_transactions(journal_entry, transactions, user=user)
+
+    return journal_entry
+
+
+def save_entry(journal_entry: JournalEntry,
+               saved: Iterable[Transaction]=(),
+               deleted: Iterable[Transaction]=(),
+               user=None) -> dict:
+    # The entry itself and then its lines, for writers that are handed both
+    # (the posting queue on behalf of the admin).
+    with db_transaction.atomic():
+        journal_entry.save()
+        return post_transactions(journal_entry, saved, deleted, user=user)
@@ -0,0 +1,137 @@
+import queue
+import threading
+from concurrent.futures import Future
+from datetime import date
+from typing import Iterable
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction as db_transaction
+
+from .concurrency import in_transaction
+from .posting import deferred_refresh, post_entry
+
+
+_posting_queue = None
+_posting_queue_lock = threading.Lock()
+
+
+def posting_queue_enabled() -> bool:
+    return getattr(settings, "ACCOUNTING_POSTING_QUEUE", False)
+
+
+def posting_timeout() -> float:
+    return getattr(settings, "ACCOUNTING_POSTING_TIMEOUT", 30)
+
+
+class PostingQueue:
+    # Funnels ledger writes through one writer thread. Whatever is waiting
+    # when the writer becomes free is written in one database transaction,
+    # each write in its own savepoint, so SQLite's write lock is taken and
+    # the balance snapshots are refreshed once per batch instead of once per
+    # entry, and a failing write only rolls back itself. Callers get a Future
+    # per write.
+    def __init__(self, max_batch: int=100):
+        self.max_batch = max_batch
+        self.batches = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._thread = None
+        self._ensure_writer()
+
+    def _ensure_writer(self) -> None:
+        # Start the writer, or a new one if the last died, so writes already
+        # queued are not left waiting forever.
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError("The posting queue has been stopped.")
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="accounting-posting", daemon=True)
+                self._thread.start()
+
+    def submit(self, func, *args, **kwargs) -> Future:
+        future = Future()
+        # The writer cannot see, and would wait on the lock of, a caller's
+        # open transaction, so writes made inside one run right there.
+        if in_transaction():
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        self._ensure_writer()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def stop(self) -> None:
+        with self._lock:
+            self._stopped = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while True:
+                batch = [self._queue.get()]
+                while batch[-1] is not None and len(batch) < self.max_batch:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = batch[-1] is None
+                if stop:
+                    batch.pop()
+                if batch:
+                    self._write(batch)
+                if stop:
+                    return
+        finally:
+            connections.close_all()
+
+    def _write(self, batch: list) -> None:
+        results = []
+        try:
+            close_old_connections()
+            with db_transaction.atomic(), deferred_refresh() as pending:
+                for future, func, args, kwargs in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with pending.savepoint():
+                            results.append((future, func(*args, **kwargs), None))
+                    except Exception as e:
+                        results.append((future, None, e))
+        except Exception as e:
+            # Nothing in the batch was written, e.g. the connection could not
+            # be set up or the commit failed; fail every write still waiting.
+            for future, _, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.batches += 1
+
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+def get_posting_queue() -> PostingQueue:
+    global _posting_queue
+    with _posting_queue_lock:
+        if _posting_queue is None:
+            _posting_queue = PostingQueue(getattr(settings, "ACCOUNTING_POSTING_BATCH", 100))
+        return _posting_queue
+
+
+def submit_entry(description: str,
+                 entry_date: date,
+                 lines: Iterable[tuple],
+                 user=None) -> Future:
+    # post_entry() through the posting queue; the Future resolves to the
+    # journal entry or raises why it was rejected.
+    return get_posting_queue().submit(post_entry, description, entry_date, list(lines), user)
@@ -0,0 +1,115 @@
+from datetime import date
+from decimal import Decimal
+from typing import Optional
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .database import report_reads
+from .models import Account, Counter, ReportSnapshot
+from .registry import ACCOUNT_FIELDS
+from .report_cache import get_ledger_generation
+from .utils import standard_periods
+
+
+DEFAULT_REPORTS = ["trial_balance", "income_statement", "balance_sheet", "retained_earnings_statement"]
+
+
+def precomputed_reports() -> list:
+    return getattr(settings, "ACCOUNTING_PRECOMPUTED_REPORTS", DEFAULT_REPORTS)
+
+
+def report_methods(view_components) -> dict:
+    return {
+        method.report: getattr(view_components, name)
+        for name, method in vars(type(view_components)).items()
+        if hasattr(method, "report")
+    }
+
+
+def snapshot_variant(*args) -> str:
+    # Extra report arguments; None means the report's default.
+    return ":".join(str(arg) for arg in args if arg is not None)
+
+
+def dump_components(value):
+    # Report components as plain JSON: accounts become their registry fields
+    # and balance, decimals and dates tagged strings.
+    if isinstance(value, dict):
+        return {key: dump_components(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [dump_components(item) for item in value]
+    if isinstance(value, Account):
+        return {"$account": {field: getattr(value, field) for field in ACCOUNT_FIELDS},
+                "balance": dump_components(getattr(value, "balance", None))}
+    if isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    return value
+
+
+def load_components(value):
+    if isinstance(value, list):
+        return [load_components(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if "$decimal" in value:
+        return Decimal(value["$decimal"])
+    if "$date" in value:
+        return date.fromisoformat(value["$date"])
+    if "$account" in value:
+        account = Account(**value["$account"])
+        account.balance = load_components(value["balance"])
+        return account
+    return {key: load_components(item) for key, item in value.items()}
+
+
+def precompute_reports(view_components, today: Optional[date]=None) -> int:
+    # Snapshots every configured report for the standard periods, stamped
+    # with the ledger generation read before computing; postings that land
+    # meanwhile leave them stale until the next run. Snapshots of periods
+    # that are no longer standard are dropped.
+    methods = report_methods(view_components)
+    periods = standard_periods(today)
+    generation, _ = get_ledger_generation()
+    computed_at = timezone.now()
+
+    kept = []
+    for report in precomputed_reports():
+        for start_date, end_date in periods:
+            components = methods[report](start_date, end_date)
+            snapshot, _ = ReportSnapshot.objects.update_or_create(
+                report=report, start_date=start_date, end_date=end_date, variant="",
+                defaults={
+                    "generation": generation,
+                    "computed_at": computed_at,
+                    "components": dump_components(components),
+                },
+            )
+            kept.append(snapshot.pk)
+
+    ReportSnapshot.objects.exclude(pk__in=kept).delete()
+    return len(kept)
+
+
+@report_reads
+def serve_report(method, start_date, end_date, *args) -> dict:
+    # The latest snapshot of a standard period, with whether the ledger has
+    # moved on since; ad-hoc ranges are computed live.
+    snapshot = (
+        ReportSnapshot.objects
+        .filter(report=method.report, start_date=start_date, end_date=end_date, variant=snapshot_variant(*args))
+        .annotate(is_current=Exists(Counter.objects.filter(name=Counter.LEDGER_GENERATION, value=OuterRef("generation"))))
+        .first()
+    )
+    if snapshot is None:
+        return dict(method(start_date, end_date, *args), snapshot=None)
+
+    components = load_components(snapshot.components)
+    components["snapshot"] = {
+        "computed_at": snapshot.computed_at,
+        "is_stale": not snapshot.is_current,
+    }
+    return components
@@ -0,0 +1,181 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+from decimal import InvalidOperation
+from typing import IO, Optional
+
+from django.db import transaction as db_transaction
+from django.db.models import F, Q
+
+from .importers import parse_amount, parse_date, read_rows
+from .models import Account, BankMatch, BankStatement, BankStatementLine, Transaction
+from .utils import quantize_amount
+
+
+# Expected statement columns: date, reference, description and either amount
+# (signed, deposits positive) or deposit/withdrawal.
+DEFAULT_WINDOW_DAYS = 3
+MIN_REFERENCE_LENGTH = 4
+
+
+def normalize_reference(value: str) -> str:
+    return re.sub(r"[^0-9A-Z]", "", str(value or "").upper())
+
+
+def reference_tokens(description: str) -> set:
+    # Bank references quoted anywhere in a transaction's description.
+    tokens = {normalize_reference(word) for word in str(description or "").split()}
+    return {token for token in tokens if len(token) >= MIN_REFERENCE_LENGTH}
+
+
+def import_statement(fileobj: IO,
+                     account: Account,
+                     file_format: str="csv",
+                     name: Optional[str]=None,
+                     user=None) -> dict:
+    lines, errors = [], []
+    for line_no, row in read_rows(fileobj, file_format):
+        try:
+            line_date = parse_date(row.get("date"))
+        except (TypeError, ValueError):
+            errors.append((line_no, f"invalid date {row.get('date')!r}"))
+            continue
+        try:
+            if row.get("amount") not in (None, ""):
+                amount = parse_amount(row["amount"])
+            else:
+                amount = parse_amount(row.get("deposit")) - parse_amount(row.get("withdrawal"))
+        except InvalidOperation:
+            errors.append((line_no, "amount is not a number"))
+            continue
+        if amount != quantize_amount(amount) or amount == 0:
+            errors.append((line_no, f"invalid amount {amount}"))
+            continue
+        lines.append(BankStatementLine(
+            date=line_date,
+            amount=amount,
+            reference=str(row.get("reference") or "").strip()[:100],
+            description=str(row.get("description") or "").strip()[:1000],
+        ))
+
+    statement = None
+    if lines:
+        with db_transaction.atomic():
+            statement = BankStatement.objects.create(
+                account=account,
+                name=name or f"{account} {min(line.date for line in lines)} - {max(line.date for line in lines)}",
+                created_by=user,
+            )
+            for line in lines:
+                line.statement = statement
+            BankStatementLine.objects.bulk_create(lines, batch_size=2000)
+
+    result = {
+        "statement": statement,
+        "lines": len(lines),
+        "errors": errors,
+    }
+    return result
+
+
+def release_broken_matches(statement: BankStatement) -> int:
+    # Matches whose transaction has since been changed to another amount or
+    # account; deleted transactions take their match with them.
+    deleted, _ = (
+        BankMatch.objects
+        .filter(line__statement=statement)
+        .exclude(rule=BankMatch.MANUAL)
+        .filter(~Q(transaction__amount=F("line__amount")) | ~Q(transaction__account=statement.account_id))
+        .delete()
+    )
+    return deleted
+
+
+def take_closest(dated: list, day, window: timedelta, taken: set) -> Optional[int]:
+    # dated: (date, transaction id) sorted by date. Scans outwards from the
+    # line's date and stops at the window, so the cost is the candidates
+    # within the window, not the whole list. Candidates are deleted as they
+    # are met, taken or already taken through another list, so lines sharing
+    # an amount never walk past each other's matches.
+    index = bisect_left(dated, (day, 0))
+    while True:
+        candidates = []
+        if index < len(dated) and dated[index][0] - day <= window:
+            candidates.append((dated[index][0] - day, index))
+        if index > 0 and day - dated[index - 1][0] <= window:
+            candidates.append((day - dated[index - 1][0], index - 1))
+        if not candidates:
+            return None
+        _, position = min(candidates)
+        pk = dated[position][1]
+        del dated[position]
+        if position < index:
+            index -= 1
+        if pk not in taken:
+            taken.add(pk)
+            return pk
+
+
+def reconcile_statement(statement: BankStatement, window_days: int=DEFAULT_WINDOW_DAYS) -> dict:
+    # Matches the statement's unmatched lines against the account's
+    # unmatched transactions: first on amount and reference, then on amount
+    # and the closest date. Both passes look candidates up in dicts keyed on
+    # integer cents, so the work is linear in lines plus transactions.
+    # Existing matches are kept, so re-runs only handle what is new.
+    window = timedelta(days=window_days)
+    with db_transaction.atomic():
+        released = release_broken_matches(statement)
+        lines = list(
+            statement.lines
+            .filter(match__isnull=True)
+            .order_by("date", "pk")
+            .values_list("pk", "date", "amount", "reference")
+        )
+        matches = []
+        if lines:
+            transactions = (
+                Transaction.objects
+                .filter(account=statement.account_id,
+                        bank_match__isnull=True,
+                        date__gte=lines[0][1] - window,
+                        date__lte=lines[-1][1] + window)
+                .values_list("pk", "date", "amount", "description")
+            )
+            by_reference = defaultdict(list)
+            by_amount = defaultdict(list)
+            for pk, day, amount, description in transactions.iterator(chunk_size=2000):
+                cents = int(amount * 100)
+                by_amount[cents].append((day, pk))
+                for token in reference_tokens(description):
+                    by_reference[(cents, token)].append((day, pk))
+            for dated in list(by_amount.values()) + list(by_reference.values()):
+                dated.sort()
+
+            taken, matched_lines = set(), set()
+            for rule in (BankMatch.REFERENCE, BankMatch.AMOUNT_DATE):
+                for line_id, day, amount, reference in lines:
+                    if line_id in matched_lines:
+                        continue
+                    cents = int(amount * 100)
+                    if rule == BankMatch.REFERENCE:
+                        reference = normalize_reference(reference)
+                        if len(reference) < MIN_REFERENCE_LENGTH:
+                            continue
+                        dated = by_reference.get((cents, reference))
+                    else:
+                        dated = by_amount.get(cents)
+                    pk = take_closest(dated, day, window, taken) if dated else None
+                    if pk is not None:
+                        matched_lines.add(line_id)
+                        matches.append(BankMatch(line_id=line_id, transaction_id=pk, rule=rule))
+            BankMatch.objects.bulk_create(matches, batch_size=2000)
+
+        by_reference = sum(match.rule == BankMatch.REFERENCE for match in matches)
+        result = {
+            "matched_by_reference": by_reference,
+            "matched_by_amount": len(matches) - by_reference,
+            "released": released,
+            "unmatched_lines": len(lines) - len(matches),
+        }
+    return result
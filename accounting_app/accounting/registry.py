@@ -0,0 +1,155 @@
+import threading
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.urls import reverse
+
+from .models import Account, Counter
+from .utils import create_custom_model
+
+
+ACCOUNT_FIELDS = ("id", "name", "account_type", "normal_balance", "reference_code", "role", "parent_id", "path", "depth")
+
+
+def get_chart_version() -> int:
+    return Counter.read(Counter.CHART_OF_ACCOUNTS)[0]
+
+
+def bump_chart_version() -> None:
+    Counter.bump(Counter.CHART_OF_ACCOUNTS)
+
+
+def recheck_interval() -> float:
+    return getattr(settings, "ACCOUNTING_REGISTRY_RECHECK_SECONDS", 5)
+
+
+class ChartOfAccounts:
+    # Process-local copy of the chart of accounts. Writers bump a version
+    # row in the database; every process reloads when it sees a new one.
+    # The row is read once per request, and outside requests (commands,
+    # workers) at most every ACCOUNTING_REGISTRY_RECHECK_SECONDS.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = None
+        self._by_id = {}
+        self._by_name = {}
+        self._by_type = {}
+        self._by_role = {}
+        self._lineage = {}
+        self._tree_order = []
+        self._menu = []
+
+    def recheck(self, **kwargs) -> None:
+        self._checked_at = None
+
+    def _current_version(self):
+        now = time.monotonic()
+        if (self._version is None or self._checked_at is None
+                or now - self._checked_at >= recheck_interval()):
+            self._checked_at = now
+            return get_chart_version()
+        return self._version
+
+    def _load(self) -> None:
+        version = self._current_version()
+        if version == self._version:
+            return
+
+        with self._lock:
+            if version == self._version:
+                return
+            rows = list(Account.objects.order_by("reference_code", "name").values(*ACCOUNT_FIELDS))
+            by_id, by_name, by_type, by_role = {}, {}, {}, {}
+            for row in rows:
+                by_id[row["id"]] = row
+                by_name.setdefault(row["name"], []).append(row)
+                by_type.setdefault(row["account_type"], []).append(row)
+                if row["role"]:
+                    by_role.setdefault(row["role"], []).append(row)
+            # Ancestor ids (root first, the account last) from the materialized
+            # path, and a depth-first order by reference code at every level.
+            lineage = {
+                pk: [int(part) for part in row["path"].split("/") if part] or [pk]
+                for pk, row in by_id.items()
+            }
+            tree_order = sorted(by_id, key=lambda pk: [
+                (by_id[ancestor]["reference_code"], by_id[ancestor]["name"])
+                for ancestor in lineage[pk] if ancestor in by_id
+            ])
+            self._menu = [
+                create_custom_model(row["name"], reverse("account_balance", args=[row["name"]]))
+                for row in rows
+            ]
+            self._by_id, self._by_name, self._by_type, self._by_role = by_id, by_name, by_type, by_role
+            self._lineage, self._tree_order = lineage, tree_order
+            self._version = version
+
+    def invalidate(self) -> None:
+        # Called inside the writer's transaction, so other processes see the
+        # new version together with the committed rows.
+        bump_chart_version()
+        self.forget()
+
+    def forget(self) -> None:
+        self._version = None
+
+    # Lookups return fresh unsaved Account instances, so callers may attach
+    # report values (e.g. ``balance``) without touching the shared copy.
+    def get(self, pk: int) -> Optional[Account]:
+        self._load()
+        row = self._by_id.get(pk)
+        return Account(**row) if row else None
+
+    def by_name(self, name: str) -> list:
+        self._load()
+        return [Account(**row) for row in self._by_name.get(name, [])]
+
+    def by_type(self, *account_types: str) -> list:
+        self._load()
+        return [Account(**row) for account_type in account_types for row in self._by_type.get(account_type, [])]
+
+    def by_role(self, *roles: str) -> list:
+        self._load()
+        return [Account(**row) for role in roles for row in self._by_role.get(role, [])]
+
+    def all(self) -> list:
+        self._load()
+        return [Account(**row) for row in self._by_id.values()]
+
+    def tree(self, *account_types: str, depth: Optional[int]=None) -> list:
+        # Accounts of the given types in depth-first order, down to ``depth``
+        # levels (1 = top-level accounts only).
+        self._load()
+        return [
+            Account(**self._by_id[pk])
+            for pk in self._tree_order
+            if self._by_id[pk]["account_type"] in account_types
+            and (depth is None or self._by_id[pk]["depth"] < depth)
+        ]
+
+    def rollup(self, values: dict) -> dict:
+        # values: {account id: amount}, e.g. from one grouped query. Every
+        # amount is added to its account and to all of the account's
+        # ancestors, giving the subtotal of each node.
+        self._load()
+        totals = {}
+        for pk, value in values.items():
+            for ancestor in self._lineage.get(pk, [pk]):
+                totals[ancestor] = totals.get(ancestor, 0) + value
+        return totals
+
+    def normal_balance(self, pk: int) -> Optional[str]:
+        self._load()
+        row = self._by_id.get(pk)
+        return row["normal_balance"] if row else None
+
+    def menu(self) -> list:
+        self._load()
+        return list(self._menu)
+
+
+chart_of_accounts = ChartOfAccounts()
+request_started.connect(chart_of_accounts.recheck, dispatch_uid="accounting.registry.recheck")
@@ -0,0 +1,96 @@
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from .models import Counter
+
+
+def get_ledger_generation() -> tuple:
+    return Counter.read(Counter.LEDGER_GENERATION)
+
+
+def bump_ledger_generation() -> None:
+    Counter.bump(Counter.LEDGER_GENERATION)
+
+
+class ReportCache:
+    def __init__(self, alias=None):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        alias = self.alias or getattr(settings, "ACCOUNTING_REPORT_CACHE", None)
+        return caches[alias] if alias else None
+
+    @property
+    def is_shared(self) -> bool:
+        # A LocMemCache lives inside one process, so other processes (the
+        # report_cache command, other workers) see neither its entries nor
+        # its hit and miss counts.
+        cache = self.cache
+        return cache is not None and not isinstance(cache, LocMemCache)
+
+    def make_key(self, report, start_date, end_date, generation, *args) -> str:
+        key = f"accounting:report:{report}:{start_date or ''}:{end_date or ''}:{generation}"
+        return ":".join([key, *map(str, args)])
+
+    def get_or_compute(self, report, start_date, end_date, compute, *args):
+        cache = self.cache
+        if cache is None:
+            return compute()
+
+        generation, _ = get_ledger_generation()
+        key = self.make_key(report, start_date, end_date, generation, *args)
+        components = cache.get(key)
+        if components is None:
+            self.record(cache, report, "misses")
+            components = compute()
+            cache.set(key, components)
+        else:
+            self.record(cache, report, "hits")
+
+        return components
+
+    def record(self, cache, report, outcome) -> None:
+        key = f"accounting:report_stats:{report}:{outcome}"
+        if not cache.add(key, 1, None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 1, None)
+
+    def stats(self, reports) -> dict:
+        cache = self.cache
+        if cache is None:
+            return {}
+
+        stats = {}
+        for report in reports:
+            hits = cache.get(f"accounting:report_stats:{report}:hits", 0)
+            misses = cache.get(f"accounting:report_stats:{report}:misses", 0)
+            stats[report] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else None,
+            }
+        return stats
+
+    def clear(self) -> None:
+        if self.cache is not None:
+            self.cache.clear()
+
+
+report_cache = ReportCache()
+
+
+def cached_report(report):
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, start_date, end_date, *args):
+            return report_cache.get_or_compute(report, start_date, end_date,
+                                               lambda: method(self, start_date, end_date, *args), *args)
+        wrapper.report = report
+        return wrapper
+    return decorator
@@ -0,0 +1,171 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction as db_transaction
+from django.db.models import Q, Sum
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Account, ChangeEvent, JournalEntry, TaxRate, Transaction
+from .registry import chart_of_accounts
+from .report_cache import bump_ledger_generation
+from .periods import ensure_period_open
+from .snapshots import record_movements
+from .taxes import recalculate_tax_rate
+
+
+_bulk_posting = ContextVar("accounting_bulk_posting", default=False)
+
+
+@contextmanager
+def bulk_posting():
+    # Set-based writers (see posting.py) update snapshots and the ledger
+    # generation once for the whole batch, so the per-row handlers stand down.
+    token = _bulk_posting.set(True)
+    try:
+        yield
+    finally:
+        _bulk_posting.reset(token)
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_transaction_movement(sender, instance, raw=False, **kwargs):
+    instance._previous_movement = None
+    if instance.pk and not raw and not _bulk_posting.get():
+        instance._previous_movement = (
+            Transaction.objects
+            .filter(pk=instance.pk)
+            .values_list("account_id", "date", "amount")
+            .first()
+        )
+
+
+@receiver(pre_save, sender=Transaction)
+def reject_transaction_in_closed_period(sender, instance, raw=False, **kwargs):
+    if raw or _bulk_posting.get():
+        return
+    ensure_period_open(instance.date)
+    previous = getattr(instance, "_previous_movement", None)
+    if previous:
+        ensure_period_open(previous[1])
+
+
+@receiver(pre_delete, sender=Transaction)
+def reject_transaction_delete_in_closed_period(sender, instance, **kwargs):
+    if not _bulk_posting.get():
+        ensure_period_open(instance.date)
+
+
+@receiver(post_save, sender=Transaction)
+def update_balances_on_transaction_save(sender, instance, raw=False, **kwargs):
+    if raw or _bulk_posting.get():
+        return
+    previous = getattr(instance, "_previous_movement", None)
+    if previous:
+        record_movements([previous], sign=-1)
+    record_movements([(instance.account_id, instance.date, instance.amount)])
+
+
+@receiver(post_delete, sender=Transaction)
+def update_balances_on_transaction_delete(sender, instance, **kwargs):
+    if not _bulk_posting.get():
+        record_movements([(instance.account_id, instance.date, instance.amount)], sign=-1)
+
+
+@receiver(pre_save, sender=JournalEntry)
+def remember_entry_date(sender, instance, raw=False, **kwargs):
+    instance._previous_date = None
+    if instance.pk and not raw:
+        instance._previous_date = JournalEntry.objects.filter(pk=instance.pk).values_list("date", flat=True).first()
+
+
+@receiver(pre_save, sender=JournalEntry)
+def reject_entry_in_closed_period(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    ensure_period_open(instance.date)
+    ensure_period_open(getattr(instance, "_previous_date", None))
+
+
+@receiver(pre_delete, sender=JournalEntry)
+def reject_entry_delete_in_closed_period(sender, instance, **kwargs):
+    ensure_period_open(instance.date)
+
+
+@receiver(post_save, sender=JournalEntry)
+def move_balances_on_entry_date_change(sender, instance, raw=False, **kwargs):
+    previous_date = getattr(instance, "_previous_date", None)
+    if raw or previous_date is None or previous_date == instance.date:
+        return
+
+    lines = (
+        Transaction.objects
+        .filter(journal_entry=instance)
+        .values("account_id")
+        .annotate(
+            debit=Sum("amount", filter=Q(amount__gt=0)),
+            credit=Sum("amount", filter=Q(amount__lt=0)),
+        )
+        .order_by()
+    )
+    movements = []
+    for line in lines:
+        for amount in (line["debit"], line["credit"]):
+            if amount:
+                movements.append((line["account_id"], amount))
+
+    record_movements([(account_id, previous_date, amount) for account_id, amount in movements], sign=-1)
+    record_movements([(account_id, instance.date, amount) for account_id, amount in movements])
+
+
+@receiver(pre_save, sender=TaxRate)
+def remember_tax_rate(sender, instance, raw=False, **kwargs):
+    instance._previous_rate = None
+    if instance.pk and not raw:
+        instance._previous_rate = TaxRate.objects.filter(pk=instance.pk).values_list("rate", flat=True).first()
+
+
+@receiver(post_save, sender=TaxRate)
+def recalculate_tax_on_rate_change(sender, instance, created, raw=False, **kwargs):
+    previous_rate = getattr(instance, "_previous_rate", None)
+    if raw or created or previous_rate is None or previous_rate == instance.rate:
+        return
+    recalculate_tax_rate(instance)
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def invalidate_chart_of_accounts(sender, **kwargs):
+    # Forget again on commit, in case another thread of this process
+    # reloaded pre-commit rows meanwhile.
+    chart_of_accounts.invalidate()
+    db_transaction.on_commit(chart_of_accounts.forget)
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+@receiver(post_save, sender=JournalEntry)
+@receiver(post_delete, sender=JournalEntry)
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+def advance_ledger_generation(sender, raw=False, **kwargs):
+    if not raw and not _bulk_posting.get():
+        bump_ledger_generation()
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_save, sender=JournalEntry)
+@receiver(post_save, sender=Transaction)
+def record_saved_change(sender, instance, created, raw=False, **kwargs):
+    if not raw and not _bulk_posting.get():
+        ChangeEvent.record(sender, ChangeEvent.CREATE if created else ChangeEvent.UPDATE, [instance.pk])
+
+
+@receiver(post_delete, sender=Account)
+@receiver(post_delete, sender=JournalEntry)
+@receiver(post_delete, sender=Transaction)
+def record_deleted_change(sender, instance, **kwargs):
+    # Deleting a journal entry cascades to its lines; each gets its own
+    # event unless a bulk writer records them.
+    if not _bulk_posting.get():
+        ChangeEvent.record(sender, ChangeEvent.DELETE, [instance.pk])
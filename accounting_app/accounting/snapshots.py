@@ -0,0 +1,197 @@
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from itertools import accumulate
+from typing import Iterable, Optional
+
+from django.db import transaction as db_transaction
+from django.db.models import Case, F, OuterRef, Q, QuerySet, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Account, AccountDailyBalance, Transaction
+from .utils import cents_to_decimal, quantize_amount, sum_cents
+
+
+def split_amount(amount: Decimal) -> tuple:
+    amount = quantize_amount(amount)
+    if amount > 0:
+        return amount, quantize_amount(0)
+    return quantize_amount(0), amount
+
+
+def split_movements(lines: Iterable[tuple], sign: int=1) -> list:
+    # lines: (account_id, date, amount); returns (account_id, date, debit,
+    # credit) changes, negated with sign=-1 to take lines back out.
+    movements = []
+    for account_id, day, amount in lines:
+        debit, credit = split_amount(amount)
+        movements.append((account_id, day, sign * debit, sign * credit))
+    return movements
+
+
+def record_movements(lines: Iterable[tuple], sign: int=1) -> None:
+    apply_movements(split_movements(lines, sign))
+
+
+def apply_movements(movements: Iterable[tuple]) -> None:
+    # movements: (account_id, date, debit, credit) changes, grouped per
+    # account and day. The touched days' rows are read, created, updated and
+    # deleted in bulk, and the later balances of every touched account move
+    # in one UPDATE, so the work does not depend on how many days follow.
+    grouped = defaultdict(lambda: [quantize_amount(0), quantize_amount(0)])
+    for account_id, day, debit, credit in movements:
+        grouped[(account_id, day)][0] += debit
+        grouped[(account_id, day)][1] += credit
+    grouped = {key: value for key, value in sorted(grouped.items()) if value[0] or value[1]}
+    if not grouped:
+        return
+
+    account_ids = {account_id for account_id, _ in grouped}
+    existing = {
+        (snapshot.account_id, snapshot.date): snapshot
+        for snapshot in AccountDailyBalance.objects.filter(account_id__in=account_ids,
+                                                           date__in={day for _, day in grouped})
+    }
+    created, changed, emptied = [], [], []
+    for (account_id, day), (debit, credit) in grouped.items():
+        snapshot = existing.get((account_id, day))
+        if snapshot is None:
+            created.append(AccountDailyBalance(account_id=account_id, date=day, debit=debit, credit=credit,
+                                               movement=debit + credit))
+            continue
+        snapshot.debit = quantize_amount(snapshot.debit + debit)
+        snapshot.credit = quantize_amount(snapshot.credit + credit)
+        snapshot.movement = quantize_amount(snapshot.movement + debit + credit)
+        if snapshot.debit == 0 and snapshot.credit == 0:
+            emptied.append(snapshot.pk)
+        else:
+            changed.append(snapshot)
+
+    with db_transaction.atomic():
+        AccountDailyBalance.objects.bulk_create(created, batch_size=2000)
+        if created:
+            # New days start from the balance brought forward; the shift
+            # below adds their movement along with the later days'.
+            created_ids = [snapshot.pk for snapshot in created]
+            brought_forward = (
+                AccountDailyBalance.objects
+                .filter(account_id=OuterRef("account_id"), date__lt=OuterRef("date"))
+                .exclude(pk__in=created_ids)
+                .order_by("-date")
+                .values("balance")[:1]
+            )
+            (AccountDailyBalance.objects
+             .filter(pk__in=created_ids)
+             .update(balance=Coalesce(Subquery(brought_forward), Value(quantize_amount(0)))))
+        AccountDailyBalance.objects.bulk_update(changed, ["debit", "credit", "movement"], batch_size=2000)
+        if emptied:
+            AccountDailyBalance.objects.filter(pk__in=emptied).delete()
+
+        # Each account's rows from a touched day on move by the account's
+        # total movement up to that day; the latest day's branch comes first.
+        by_account = defaultdict(list)
+        for (account_id, day), (debit, credit) in grouped.items():
+            by_account[account_id].append((day, debit + credit))
+        branches, scope = [], Q()
+        for account_id, days in by_account.items():
+            totals = list(zip([day for day, _ in days], accumulate(movement for _, movement in days)))
+            if not any(total for _, total in totals):
+                continue
+            branches += [When(account_id=account_id, date__gte=day, then=Value(total))
+                         for day, total in reversed(totals)]
+            scope |= Q(account_id=account_id, date__gte=totals[0][0])
+        if branches:
+            shift = Case(*branches, default=Value(quantize_amount(0)),
+                         output_field=AccountDailyBalance._meta.get_field("balance"))
+            AccountDailyBalance.objects.filter(scope).update(balance=F("balance") + shift)
+
+
+def compute_daily_balances(transactions: Optional[QuerySet]=None, opening: Optional[dict]=None) -> list:
+    # Running balances per account and day, starting from ``opening``
+    # (account_id -> balance) or zero.
+    if transactions is None:
+        transactions = Transaction.objects.all()
+    rows = (
+        transactions
+        .values("account_id", "date")
+        .annotate(
+            debit=sum_cents("amount", filter=Q(amount__gt=0)),
+            credit=sum_cents("amount", filter=Q(amount__lt=0)),
+        )
+        .order_by("account_id", "date")
+    )
+
+    snapshots = []
+    running = dict(opening or {})
+    for row in rows.iterator(chunk_size=2000):
+        debit = cents_to_decimal(row["debit"])
+        credit = cents_to_decimal(row["credit"])
+        if not debit and not credit:
+            continue
+        balance = running.get(row["account_id"], quantize_amount(0)) + debit + credit
+        running[row["account_id"]] = balance
+        snapshots.append(AccountDailyBalance(
+            account_id=row["account_id"],
+            date=row["date"],
+            debit=debit,
+            credit=credit,
+            movement=debit + credit,
+            balance=balance,
+        ))
+
+    return snapshots
+
+
+def rebuild_daily_balances() -> int:
+    snapshots = compute_daily_balances()
+    with db_transaction.atomic():
+        AccountDailyBalance.objects.all().delete()
+        AccountDailyBalance.objects.bulk_create(snapshots, batch_size=2000)
+
+    return len(snapshots)
+
+
+def refresh_daily_balances(account_ids: Iterable[int], since: date) -> int:
+    # Set-based counterpart of record_movements for bulk writes: recompute the
+    # touched accounts' snapshots from ``since`` onwards in a constant number
+    # of queries.
+    account_ids = set(account_ids)
+    previous = (
+        AccountDailyBalance.objects
+        .filter(account_id=OuterRef("pk"), date__lt=since)
+        .order_by("-date")
+        .values("balance")[:1]
+    )
+    opening = {
+        account_id: quantize_amount(balance)
+        for account_id, balance in (
+            Account.objects
+            .filter(pk__in=account_ids)
+            .annotate(opening=Subquery(previous))
+            .values_list("pk", "opening")
+        )
+    }
+    transactions = Transaction.objects.filter(account_id__in=account_ids, date__gte=since)
+    snapshots = compute_daily_balances(transactions, opening)
+
+    with db_transaction.atomic():
+        AccountDailyBalance.objects.filter(account_id__in=account_ids, date__gte=since).delete()
+        AccountDailyBalance.objects.bulk_create(snapshots, batch_size=2000)
+
+    return len(snapshots)
+
+
+def verify_daily_balances() -> list:
+    fields = ("debit", "credit", "movement", "balance")
+    expected = {(s.account_id, s.date): s for s in compute_daily_balances()}
+    stored = {(s.account_id, s.date): s for s in AccountDailyBalance.objects.all()}
+
+    mismatches = []
+    for key in sorted(expected.keys() | stored.keys()):
+        want, have = expected.get(key), stored.get(key)
+        if want is None or have is None:
+            mismatches.append((key, want, have))
+        elif any(quantize_amount(getattr(want, f)) != quantize_amount(getattr(have, f)) for f in fields):
+            mismatches.append((key, want, have))
+
+    return mismatches
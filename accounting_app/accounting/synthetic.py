@@ -0,0 +1,110 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from .importers import write_entries
+from .models import Account
+
+
+# (reference_code, name, account_type) of the Vietnamese chart of accounts
+# the reports look up by name.
+BASE_ACCOUNTS = [
+    (111, "Tiền mặt", "Asset"),
+    (112, "Tiền gửi ngân hàng", "Asset"),
+    (131, "Phải thu của khách hàng", "Asset"),
+    (156, "Hàng hóa", "Asset"),
+    (211, "Tài sản cố định hữu hình", "Asset"),
+    (331, "Phải trả cho người bán", "Liability"),
+    (341, "Vay và nợ thuê tài chính", "Liability"),
+    (411, "Vốn góp của chủ sở hữu", "Equity"),
+    (421, "Lợi nhuận sau thuế chưa phân phối", "Equity"),
+    (4218, "Chi cổ tức bằng tiền mặt", "Contra Equity"),
+    (511, "Doanh thu bán hàng và cung cấp dịch vụ", "Revenue"),
+    (515, "Doanh thu hoạt động tài chính", "Revenue"),
+    (632, "Giá vốn hàng bán", "Expense"),
+    (641, "Chi phí bán hàng", "Expense"),
+    (642, "Chi phí quản lý doanh nghiệp", "Expense"),
+]
+
+ROLES = {
+    421: Account.RETAINED_EARNINGS,
+    4218: Account.DIVIDENDS,
+}
+
+# Parents that extra generated accounts are created under, e.g. 1121, 1122.
+SUB_ACCOUNT_PARENTS = [
+    (112, "Tiền gửi ngân hàng", "Asset"),
+    (131, "Phải thu của khách hàng", "Asset"),
+    (331, "Phải trả cho người bán", "Liability"),
+    (511, "Doanh thu bán hàng và cung cấp dịch vụ", "Revenue"),
+    (642, "Chi phí quản lý doanh nghiệp", "Expense"),
+]
+
+
+def create_chart_of_accounts(count: int) -> list:
+    # (reference_code, name, account_type, parent reference_code)
+    specs = [(code, name, account_type, None) for code, name, account_type in BASE_ACCOUNTS[:count]]
+    serial = 0
+    while len(specs) < count:
+        code, name, account_type = SUB_ACCOUNT_PARENTS[serial % len(SUB_ACCOUNT_PARENTS)]
+        number = serial // len(SUB_ACCOUNT_PARENTS) + 1
+        specs.append((int(f"{code}{number}"), f"{name} - {number}", account_type, code))
+        serial += 1
+
+    existing = {account.reference_code: account for account in Account.objects.all()}
+    accounts = []
+    for code, name, account_type, parent_code in specs:
+        account = existing.get(code)
+        if account is None:
+            account = Account.objects.create(name=name, account_type=account_type, reference_code=code,
+                                             role=ROLES.get(code, ""), parent=existing.get(parent_code))
+            existing[code] = account
+        accounts.append(account)
+
+    return accounts
+
+
+def generate_ledger(accounts: int=30,
+                    entries: int=1000,
+                    lines_per_entry: int=2,
+                    start_date: date=date(2024, 1, 1),
+                    days: int=365,
+                    seed: int=0,
+                    chunk_size: int=1000) -> dict:
+    rng = random.Random(seed)
+    chart = create_chart_of_accounts(accounts)
+    account_ids = [account.pk for account in chart]
+    lines_per_entry = max(lines_per_entry, 2)
+
+    written = 0
+    pending = []
+    for number in range(entries):
+        lines = []
+        for _ in range(lines_per_entry - 1):
+            amount = Decimal(rng.randint(1, 10_000_000)) / 100
+            lines.append((rng.choice(account_ids), amount if rng.random() < 0.5 else -amount, ""))
+        lines.append((rng.choice(account_ids), -sum(amount for _, amount, _ in lines), ""))
+        lines = [line for line in lines if line[1] != 0]
+        if not lines:
+            continue
+
+        pending.append({
+            "description": f"Bút toán tổng hợp {number + 1}",
+            # Chronological, like a real ledger, so each chunk only refreshes
+            # the snapshots from its own first day onwards.
+            "date": start_date + timedelta(days=number * days // max(entries, 1)),
+            "lines": lines,
+        })
+        if len(pending) >= chunk_size:
+            written += write_entries(pending)
+            pending = []
+
+    if pending:
+        written += write_entries(pending)
+
+    summary = {
+        "accounts": len(chart),
+        "entries": entries,
+        "transactions": written,
+    }
+    return summary
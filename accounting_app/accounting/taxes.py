@@ -0,0 +1,41 @@
+from django.db.models import BigIntegerField, DecimalField, FloatField, OuterRef, QuerySet, Subquery
+from django.db.models.functions import Abs, Cast, Round, Sign
+
+from .models import ChangeEvent, FiscalPeriod, TaxRate, Transaction
+from .report_cache import bump_ledger_generation
+from .utils import to_cents
+
+
+def tax_amount_expression() -> Cast:
+    # Each line's tax from its own rate, computed in the UPDATE itself.
+    # Integer cents times the rate in hundredths of a percent, halves rounded
+    # away from zero with integer division, as Transaction.save() does with
+    # ROUND_HALF_UP; rounding the REAL product drifts on large amounts.
+    rate = Subquery(TaxRate.objects.filter(pk=OuterRef("tax_rate_id")).values("rate")[:1])
+    product = to_cents("amount") * Cast(Round(rate * 100), BigIntegerField())
+    tax_cents = Sign(product) * ((Abs(product) + 5000) / 10000)
+    return Cast(Cast(tax_cents, FloatField()) / 100, DecimalField(max_digits=12, decimal_places=2))
+
+
+def recalculate_tax_amounts(transactions: QuerySet) -> int:
+    return transactions.filter(tax_rate__isnull=False).update(tax_amount=tax_amount_expression())
+
+
+def recalculate_tax_rate(tax_rate: TaxRate) -> int:
+    # After a rate change: one UPDATE over the rate's lines. Lines in closed
+    # periods keep the tax they were filed with.
+    transactions = Transaction.objects.filter(tax_rate=tax_rate)
+    closed_through = FiscalPeriod.closed_through()
+    if closed_through:
+        transactions = transactions.filter(date__gt=closed_through)
+
+    updated = recalculate_tax_amounts(transactions)
+    if not updated:
+        return 0
+    # The rate's lines are streamed from the same filter for the change feed
+    # rather than collected into an IN list, which is bounded by the
+    # database's variable limit.
+    ChangeEvent.record(Transaction, ChangeEvent.UPDATE,
+                       transactions.values_list("pk", flat=True).iterator(chunk_size=2000))
+    bump_ledger_generation()
+    return updated
@@ -1,3 +1,1658 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest.mock import patch
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, connections, transaction as db_transaction
+from django.db.models import Max, Min, Q, Sum
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .changefeed import read_changes
+from .components import ViewComponent
+from .concurrency import gather_sections
+from .database import REPORTS_ALIAS, configure_sqlite, report_reads
+from .importers import import_journal, write_entries
+from .instrumentation import request_profile, reset_samples, share_profile, summarize_samples
+from .models import Account, AccountDailyBalance, BankMatch, ChangeEvent, FiscalPeriod, JournalEntry, ReportSnapshot, TaxRate, Transaction
+from .periods import close_period
+from .posting import post_entry, post_transactions
+from .posting_queue import PostingQueue, get_posting_queue
+from .precompute import precompute_reports, serve_report
+from .reconciliation import import_statement, reconcile_statement, take_closest
+from .registry import ChartOfAccounts, chart_of_accounts, get_chart_version
+from .report_cache import report_cache
+from .snapshots import verify_daily_balances
+from .synthetic import BASE_ACCOUNTS, create_chart_of_accounts, generate_ledger
+from .utils import (calc_account_balance,
+                    calc_account_totals,
+                    calc_cumulative_balance,
+                    calc_tx_total,
+                    filter_date_range,
+                    get_account_ledger,
+                    get_account_transactions,
+                    quantize_amount)
+
+
+# Queries each report may issue once the chart of accounts registry is warm.
+# They must not grow with the size of the ledger.
+QUERY_BUDGETS = {
+    "get_trial_balance": 1,
+    "get_trial_balance_range": 1,
+    "get_account_balance": 3,
+    "get_income_statement": 3,
+    "get_retained_earnings_statement": 1,
+    "get_balance_sheet": 2,
+    "get_balance_sheet_range": 1,
+    "get_balance_sheet_tree": 2,
+    "get_trial_balance_tree": 1,
+    # Views also read the chart of accounts version once per request.
+    "admin_index": 4,
+    "trial_balance_view": 5,
+    "account_balance_view": 6,
+    "report_view": 6,
+    "get_comparative_income_statement": 2,
+    "get_comparative_balance_sheet": 1,
+}
+
+DATE_RANGE = ("2024-02-01", "2024-05-31")
+
+# Set ACCOUNTING_BENCHMARK=1 to print timings; ACCOUNTING_BENCHMARK_SCALE
+# multiplies the generated ledger sizes.
+BENCHMARK = bool(os.getenv("ACCOUNTING_BENCHMARK"))
+SCALE = int(os.getenv("ACCOUNTING_BENCHMARK_SCALE", 1))
+
+
+def logged_queries(logs) -> int:
+    return json.loads(logs.records[-1].getMessage())["queries"]
+
+
+@override_settings(ACCOUNTING_REPORT_CACHE=None)
+class ReportBenchmarkTests(TestCase):
+    accounts = 20
+    entries = 200
+    lines_per_entry = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_ledger(accounts=cls.accounts, entries=cls.entries * SCALE,
+                        lines_per_entry=cls.lines_per_entry, seed=cls.entries)
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.timings = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if BENCHMARK:
+            size = Transaction.objects.count()
+            for name, seconds in sorted(cls.timings.items()):
+                print(f"{cls.__name__} [{size} transactions] {name}: {seconds * 1000:.1f} ms")
+        super().tearDownClass()
+
+    def setUp(self):
+        self.view_component = ViewComponent()
+        self.client.force_login(self.user)
+        # Warm the chart of accounts registry so budgets measure report work.
+        self.client.get("/admin/")
+
+    def measure(self, name, call):
+        with self.assertNumQueries(QUERY_BUDGETS[name]):
+            started = time.perf_counter()
+            result = call()
+            self.timings[name] = time.perf_counter() - started
+        return result
+
+    def expected_balances(self, start_date=None, end_date=None):
+        transactions = Transaction.objects.all()
+        if start_date and end_date:
+            transactions = transactions.filter(date__range=(start_date, end_date))
+        balances = defaultdict(Decimal)
+        for account_id, amount in transactions.values_list("account_id", "amount"):
+            balances[account_id] += amount
+        return balances
+
+    def test_trial_balance(self):
+        components = self.measure("get_trial_balance",
+                                  lambda: self.view_component.get_trial_balance(None, None))
+        self.assertEqual(quantize_amount(components["total_debit"]), quantize_amount(components["total_credit"]))
+
+        totals = Transaction.objects.filter(amount__gt=0).aggregate(total=Sum("amount"))["total"]
+        self.assertEqual(quantize_amount(components["total_debit"]), quantize_amount(totals))
+
+    def test_trial_balance_range(self):
+        components = self.measure("get_trial_balance_range",
+                                  lambda: self.view_component.get_trial_balance(*DATE_RANGE))
+        totals = (
+            Transaction.objects
+            .filter(amount__gt=0, date__range=DATE_RANGE)
+            .aggregate(total=Sum("amount"))["total"]
+        )
+        self.assertEqual(quantize_amount(components["total_debit"]), quantize_amount(totals))
+
+    def test_extended_trial_balance(self):
+        components = self.measure("get_trial_balance_range",
+                                  lambda: self.view_component.get_trial_balance(*DATE_RANGE))
+        opening = self.expected_balances("2000-01-01", "2024-01-31")
+        closing = self.expected_balances("2000-01-01", DATE_RANGE[1])
+        for row in components["accounts"]:
+            self.assertEqual(row["opening"], quantize_amount(opening[row["account_id"]]))
+            self.assertEqual(row["closing"], quantize_amount(closing[row["account_id"]]))
+            self.assertEqual(row["opening"] + row["debit"] + row["credit"], row["closing"])
+        for column in ("opening", "debit", "closing"):
+            self.assertEqual(components[f"total_{column}"], sum(row[column] for row in components["accounts"]))
+        self.assertEqual(components["total_opening"], 0)
+        self.assertEqual(components["total_closing"], 0)
+
+    def test_extended_trial_balance_after_close(self):
+        before = self.view_component.get_trial_balance(*DATE_RANGE)
+        period = FiscalPeriod.objects.create(name="2024-01", start_date=date(2024, 1, 1), end_date=date(2024, 1, 31))
+        close_period(period)
+        # Openings now come from the closed period, with income closed out.
+        with self.assertNumQueries(1):
+            after = self.view_component.get_trial_balance(*DATE_RANGE)
+        self.assertEqual(after["total_debit"], before["total_debit"])
+        closing = self.expected_balances("2000-01-01", DATE_RANGE[1])
+        for row in after["accounts"]:
+            self.assertEqual(row["closing"], quantize_amount(closing[row["account_id"]]))
+
+        lifetime = self.view_component.get_trial_balance(None, None)
+        closing = self.expected_balances()
+        for row in lifetime["accounts"]:
+            self.assertEqual(row["closing"], quantize_amount(closing[row["account_id"]]))
+        february_on = Transaction.objects.filter(amount__gt=0, date__gt="2024-01-31").aggregate(total=Sum("amount"))
+        self.assertEqual(lifetime["total_debit"], quantize_amount(february_on["total"]))
+
+    def test_account_balance(self):
+        components = self.measure("get_account_balance",
+                                  lambda: self.view_component.get_account_balance("Tiền mặt", None, None))
+        expected = self.expected_balances()[Account.objects.get(name="Tiền mặt").pk]
+        self.assertEqual(components["total_debit"], quantize_amount(expected))
+
+    def test_income_statement(self):
+        components = self.measure("get_income_statement",
+                                  lambda: self.view_component.get_income_statement(None, None))
+        balances = self.expected_balances()
+        for account in components["revenue_accounts"] + components["expense_accounts"]:
+            self.assertEqual(account.balance, quantize_amount(balances[account.pk]))
+
+    def test_retained_earnings_statement(self):
+        components = self.measure("get_retained_earnings_statement",
+                                  lambda: self.view_component.get_retained_earnings_statement(None, None))
+        self.assertEqual(components["ending_retained_earnings"],
+                         components["beginning_retained_earnings"] + components["increased_retained_earnings"]
+                         + components["other_adjustments"])
+
+        balances = self.expected_balances()
+        accounts = Account.objects.filter(Q(account_type__in=["Revenue", "Expense"]) | ~Q(role=""))
+        self.assertEqual(components["ending_retained_earnings"],
+                         -quantize_amount(sum(balances[account.pk] for account in accounts)))
+        revenue_expense = Account.objects.filter(account_type__in=["Revenue", "Expense"])
+        self.assertEqual(components["net_income"],
+                         -quantize_amount(sum(balances[account.pk] for account in revenue_expense)))
+
+    def test_closing_does_not_change_retained_earnings(self):
+        lifetime = self.view_component.get_retained_earnings_statement(None, None)
+        january = self.view_component.get_retained_earnings_statement("2024-01-01", "2024-01-31")
+        period = FiscalPeriod.objects.create(name="2024-01", start_date=date(2024, 1, 1), end_date=date(2024, 1, 31))
+        close_period(period)
+        self.assertEqual(period.closing_entry.transaction_set.filter(account__role=Account.RETAINED_EARNINGS).count(), 1)
+        self.assertEqual(self.view_component.get_retained_earnings_statement(None, None), lifetime)
+        self.assertEqual(self.view_component.get_retained_earnings_statement("2024-01-01", "2024-01-31"), january)
+
+    def test_retained_earnings_statement_range(self):
+        components = self.view_component.get_retained_earnings_statement(*DATE_RANGE)
+        before = self.expected_balances("2000-01-01", "2024-01-31")
+        during = self.expected_balances(*DATE_RANGE)
+        accounts = Account.objects.filter(Q(account_type__in=["Revenue", "Expense"]) | ~Q(role=""))
+        self.assertEqual(components["beginning_retained_earnings"],
+                         -quantize_amount(sum(before[account.pk] for account in accounts)))
+        dividends = Account.objects.get(role=Account.DIVIDENDS)
+        self.assertEqual(components["cash_dividends"], quantize_amount(during[dividends.pk]))
+
+    def test_balance_sheet(self):
+        components = self.measure("get_balance_sheet",
+                                  lambda: self.view_component.get_balance_sheet(None, None))
+        balances = self.expected_balances()
+        for account in components["asset_accounts"] + components["liability_accounts"]:
+            self.assertEqual(account.balance, quantize_amount(balances[account.pk]))
+
+    def test_balance_sheet_range(self):
+        components = self.measure("get_balance_sheet_range",
+                                  lambda: self.view_component.get_balance_sheet(*DATE_RANGE))
+        balances = self.expected_balances(*DATE_RANGE)
+        for account in components["asset_accounts"]:
+            self.assertEqual(account.balance, quantize_amount(balances[account.pk]))
+
+    def subtree_balance(self, balances, account):
+        return quantize_amount(sum(balances[pk] for pk in Account.objects.filter(path__startswith=account.path)
+                                   .values_list("pk", flat=True)))
+
+    def test_balance_sheet_tree(self):
+        components = self.measure("get_balance_sheet_tree",
+                                  lambda: self.view_component.get_balance_sheet(None, None, 1))
+        balances = self.expected_balances()
+        self.assertTrue(all(account.depth == 0 for account in components["asset_accounts"]))
+        for account in components["asset_accounts"] + components["liability_accounts"]:
+            self.assertEqual(account.balance, self.subtree_balance(balances, account))
+        self.assertEqual(sum(account.balance for account in components["asset_accounts"]), components["total_assets"])
+
+        components = self.view_component.get_balance_sheet(None, None, 2)
+        self.assertTrue(any(account.depth == 1 for account in components["asset_accounts"]))
+
+    def test_trial_balance_tree(self):
+        flat = self.view_component.get_trial_balance(None, None)
+        components = self.measure("get_trial_balance_tree",
+                                  lambda: self.view_component.get_trial_balance(None, None, 1))
+        self.assertLess(len(components["accounts"]), len(flat["accounts"]))
+        self.assertEqual(sum(row["debit"] or 0 for row in components["accounts"]), flat["total_debit"])
+        self.assertEqual(components["total_debit"], flat["total_debit"])
+
+    def test_admin_views(self):
+        urls = {
+            "admin_index": "/admin/",
+            "trial_balance_view": "/admin/trial-balance/",
+            "account_balance_view": "/admin/account-balance/Tiền mặt/",
+            "report_view": "/admin/report/Balance Sheet/",
+        }
+        for name, url in urls.items():
+            response = self.measure(name, lambda: self.client.get(url))
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_comparative_income_statement(self):
+        components = self.measure("get_comparative_income_statement",
+                                  lambda: self.view_component.get_comparative_income_statement("2024-01-01", "2024-12-31", "month"))
+        self.assertEqual(len(components["periods"]), 12)
+        [net_income] = [values for _, values in components["summary"]]
+        for month, value in zip(range(1, 13), net_income):
+            end = date(2024, month + 1, 1) - timedelta(days=1) if month < 12 else date(2024, 12, 31)
+            single = self.view_component.get_income_statement(date(2024, month, 1).isoformat(), end.isoformat())
+            self.assertEqual(value, single["net_income"])
+
+    def test_comparative_balance_sheet(self):
+        components = self.measure("get_comparative_balance_sheet",
+                                  lambda: self.view_component.get_comparative_balance_sheet("2024-01-01", "2024-12-31", "quarter"))
+        self.assertEqual(components["periods"], ["2024-Q1", "2024-Q2", "2024-Q3", "2024-Q4"])
+        assets = components["sections"][0]
+        lifetime = self.view_component.get_balance_sheet(None, None)
+        self.assertEqual(assets["total"][-1], lifetime["total_assets"])
+
+        balances = self.expected_balances("2024-01-01", "2024-03-31")
+        for account in assets["accounts"]:
+            pk = Account.objects.get(name=account["name"]).pk
+            self.assertEqual(account["values"][0], quantize_amount(balances[pk]))
+
+    def test_comparative_balance_sheet_after_close(self):
+        before = self.view_component.get_comparative_balance_sheet("2024-02-01", "2024-12-31", "month")
+        close_period(FiscalPeriod.objects.create(name="2024-01", start_date=date(2024, 1, 1),
+                                                 end_date=date(2024, 1, 31)))
+        # Openings come from the closed period and the scan starts after it.
+        with CaptureQueriesContext(connection) as queries:
+            after = self.view_component.get_comparative_balance_sheet("2024-02-01", "2024-12-31", "month")
+        self.assertEqual(len(queries), 1)
+        self.assertIn("accounting_openingbalance", queries[0]["sql"])
+        # Assets and liabilities are untouched by the close; equity gains
+        # January's income through the closing entry.
+        self.assertEqual(after["sections"][:2], before["sections"][:2])
+
+    def test_comparative_views(self):
+        response = self.client.get("/admin/comparative/Income Statement/?grain=quarter")
+        self.assertContains(response, "2024-Q4")
+        response = self.client.get("/admin/export/comparative/Balance Sheet/?format=csv&grain=year")
+        self.assertIn("Tổng cộng tài sản", b"".join(response.streaming_content).decode())
+        response = self.client.get("/admin/comparative/Trial Balance/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_exports_stream_under_wsgi_and_asgi(self):
+        account = Account.objects.filter(transaction__isnull=False).first()
+        response = self.client.get(f"/admin/export/account-balance/{account.name}/?format=csv")
+        self.assertFalse(response.is_async)
+        self.assertIn("filename*=utf-8''", response["Content-Disposition"])
+        rows = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0], "\ufeffDate,Journal entry,Description,Debit,Credit,Balance")
+        self.assertEqual(len(rows) - 1, account.transaction_set.count())
+
+        url = "/admin/export/general-ledger/?format=csv"
+        content = b"".join(self.client.get(url).streaming_content)
+
+        async def fetch():
+            client = AsyncClient()
+            await client.aforce_login(self.user)
+            response = await client.get(url)
+            return response, [part async for part in response.streaming_content]
+
+        response, parts = async_to_sync(fetch)()
+        self.assertTrue(response.is_async)
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="general-ledger.csv"')
+        self.assertEqual(b"".join(parts), content)
+        self.assertEqual(len(content.splitlines()) - 1, Transaction.objects.count())
+
+    def test_ledger_pages_cost_the_same(self):
+        account = Account.objects.get(name="Tiền mặt")
+        after = None
+        balance = quantize_amount(0)
+        while True:
+            with self.assertNumQueries(2):
+                ledger = get_account_ledger(account.name, after=after, page_size=50)
+            for transaction in ledger["transactions"]:
+                balance += transaction.amount
+                self.assertEqual(transaction.running_balance, balance)
+            after = ledger["next_cursor"]
+            if not after:
+                break
+        self.assertEqual(balance, calc_account_balance(account.name))
+
+    def test_cents_totals_are_exact(self):
+        balances = self.expected_balances()
+        self.assertEqual(calc_account_totals(Transaction.objects.all()),
+                         {account_id: balance for account_id, balance in balances.items()})
+        self.assertEqual(calc_tx_total(Transaction.objects.filter(amount__gt=0)),
+                         sum(amount for amount in Transaction.objects.filter(amount__gt=0).values_list("amount", flat=True)))
+
+        account = Account.objects.get(name="Tiền mặt")
+        running = calc_cumulative_balance(get_account_transactions(account.name))["debit_balance"]
+        self.assertEqual(running[-1], balances[account.pk])
+        self.assertEqual(calc_account_balance(account.name), balances[account.pk])
+
+        ledger = get_account_ledger(account.name, page_size=10000)["transactions"]
+        self.assertEqual(ledger[-1].running_balance, balances[account.pk])
+
+    def test_account_balance_reads_two_snapshots(self):
+        account = Account.objects.get(name="Tiền mặt")
+        for start_date, end_date in [("2024-03-01", "2024-09-30"), ("2024-06-15", "2024-06-15"), (None, None)]:
+            expected = calc_tx_total(filter_date_range(Transaction.objects.filter(account=account),
+                                                       start_date, end_date))
+            with self.assertNumQueries(2 if start_date else 1):
+                self.assertEqual(calc_account_balance([account], start_date, end_date), expected)
+
+    def test_snapshots_match_ledger(self):
+        self.assertEqual(verify_daily_balances(), [])
+
+
+class SyntheticLedgerTests(TestCase):
+    def ledger_rows(self, after: int=0):
+        return list(
+            Transaction.objects
+            .filter(journal_entry__gt=after)
+            .order_by("journal_entry", "pk")
+            .values_list("journal_entry__description", "date", "account__reference_code", "amount")
+        )
+
+    def test_same_seed_gives_the_same_ledger(self):
+        summary = generate_ledger(accounts=12, entries=50, lines_per_entry=3, seed=7)
+        self.assertEqual(summary["accounts"], 12)
+        self.assertEqual(summary["transactions"], Transaction.objects.count())
+        first = self.ledger_rows()
+        last_entry = JournalEntry.objects.order_by("pk").last().pk
+
+        generate_ledger(accounts=12, entries=50, lines_per_entry=3, seed=7)
+        self.assertEqual(Account.objects.count(), 12)
+        self.assertEqual(self.ledger_rows(last_entry), first)
+
+        generate_ledger(accounts=12, entries=50, lines_per_entry=3, seed=8)
+        self.assertNotEqual(self.ledger_rows(JournalEntry.objects.order_by("pk")[49].pk), first)
+
+    def test_entries_balance_and_stay_in_range(self):
+        generate_ledger(accounts=20, entries=120, lines_per_entry=4, start_date=date(2024, 1, 1), days=90, seed=3)
+        totals = defaultdict(Decimal)
+        for entry_id, amount in Transaction.objects.values_list("journal_entry", "amount"):
+            totals[entry_id] += amount
+        self.assertEqual(len(totals), JournalEntry.objects.count())
+        self.assertEqual({total for total in totals.values() if total}, set())
+        dates = Transaction.objects.aggregate(first=Min("date"), last=Max("date"))
+        self.assertEqual(dates["first"], date(2024, 1, 1))
+        self.assertLess(dates["last"], date(2024, 1, 1) + timedelta(days=90))
+        self.assertEqual(verify_daily_balances(), [])
+
+    def test_sub_accounts_have_parents(self):
+        accounts = create_chart_of_accounts(25)
+        self.assertEqual(len({account.reference_code for account in accounts}), 25)
+        extra = accounts[len(BASE_ACCOUNTS):]
+        self.assertEqual(len(extra), 10)
+        for account in extra:
+            self.assertIsNotNone(account.parent)
+            self.assertTrue(str(account.reference_code).startswith(str(account.parent.reference_code)))
+            self.assertEqual(account.account_type, account.parent.account_type)
+            self.assertEqual(account.depth, 1)
+        self.assertEqual(Account.objects.get(reference_code=421).role, Account.RETAINED_EARNINGS)
+
+    def test_command_and_reports(self):
+        out = StringIO()
+        call_command("generate_ledger", accounts=15, entries=40, lines=2, seed=1, stdout=out)
+        self.assertIn("Generated 40 entries", out.getvalue())
+
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        for url in ["/admin/report/Balance Sheet/", "/admin/report/Income Statement/",
+                    "/admin/trial-balance/", "/admin/account-balance/Tiền mặt/"]:
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+        self.assertContains(self.client.get("/admin/report/Balance Sheet/"), "Tiền mặt")
+
+
+class DailyBalanceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.accounts = create_chart_of_accounts(10)
+
+    def test_single_row_writes_keep_snapshots_in_sync(self):
+        entry = post_entry("Sale", date(2024, 2, 5), [(self.accounts[0], Decimal("50.05"), ""),
+                                                      (self.accounts[1], Decimal("-50.05"), "")])
+        entry.date = date(2023, 12, 1)
+        entry.save()
+        self.assertEqual(verify_daily_balances(), [])
+
+        line = entry.transaction_set.order_by("pk").first()
+        line.amount, line.account = Decimal("33.33"), self.accounts[2]
+        line.save()
+        self.assertEqual(verify_daily_balances(), [])
+
+        entry.delete()
+        self.assertEqual(verify_daily_balances(), [])
+        self.assertFalse(AccountDailyBalance.objects.exists())
+
+    def test_rebuild_balances_command(self):
+        post_entry("Sale", date(2024, 2, 5), [(self.accounts[0], Decimal("10.00"), ""),
+                                              (self.accounts[1], Decimal("-10.00"), "")])
+        AccountDailyBalance.objects.filter(account=self.accounts[0]).update(balance=Decimal("99.00"))
+
+        err = StringIO()
+        with self.assertRaisesMessage(CommandError, "1 daily balance snapshot(s) do not match the ledger."):
+            call_command("rebuild_balances", verify=True, stdout=StringIO(), stderr=err)
+        self.assertIn(f"account {self.accounts[0].pk} on 2024-02-05: expected 10.00, stored 99.00", err.getvalue())
+
+        out = StringIO()
+        call_command("rebuild_balances", stdout=out)
+        self.assertIn("Rebuilt 2 daily balance snapshot(s).", out.getvalue())
+        out = StringIO()
+        call_command("rebuild_balances", verify=True, stdout=out)
+        self.assertIn("Daily balance snapshots match the ledger.", out.getvalue())
+
+
+class ClosedPeriodTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.accounts = create_chart_of_accounts(10)
+        cls.entry = post_entry("January sale", date(2024, 1, 15), [(cls.accounts[0], Decimal("10.00"), ""),
+                                                                   (cls.accounts[1], Decimal("-10.00"), "")])
+        close_period(FiscalPeriod.objects.create(name="2024-01", start_date=date(2024, 1, 1),
+                                                 end_date=date(2024, 1, 31)))
+
+    def assertRejected(self, write):
+        with self.assertRaisesMessage(ValidationError, "is closed"), db_transaction.atomic():
+            write()
+
+    def test_rejects_writes_in_closed_period(self):
+        lines = [(self.accounts[0], Decimal("5.00"), ""), (self.accounts[1], Decimal("-5.00"), "")]
+        self.assertRejected(lambda: JournalEntry.objects.create(description="Late", date=date(2024, 1, 20)))
+        self.assertRejected(lambda: post_entry("Late", date(2024, 1, 31), lines))
+
+        line = self.entry.transaction_set.order_by("pk").first()
+        line.amount = Decimal("11.00")
+        self.assertRejected(line.save)
+        self.assertRejected(line.delete)
+        self.assertRejected(self.entry.delete)
+
+        self.entry.date = date(2024, 2, 1)
+        self.assertRejected(self.entry.save)
+
+    def test_moving_an_entry_into_a_closed_period_is_rejected(self):
+        entry = post_entry("February sale", date(2024, 2, 1), [(self.accounts[0], Decimal("5.00"), ""),
+                                                               (self.accounts[1], Decimal("-5.00"), "")])
+        entry.date = date(2024, 1, 31)
+        self.assertRejected(entry.save)
+        entry.refresh_from_db()
+        self.assertEqual(entry.date, date(2024, 2, 1))
+
+    def test_admin_rejects_entry_in_closed_period(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        data = {"description": "Late", "date": "2024-01-20", "transaction_set-TOTAL_FORMS": 0,
+                "transaction_set-INITIAL_FORMS": 0}
+        response = self.client.post("/admin/accounting/journalentry/add/", data)
+        self.assertContains(response, "is closed")
+        self.assertEqual(JournalEntry.objects.filter(description="Late").count(), 0)
+
+
+class ChartOfAccountsRegistryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.accounts = create_chart_of_accounts(10)
+
+    def test_warm_registry_costs_no_queries(self):
+        chart_of_accounts.menu()
+        with self.assertNumQueries(0):
+            chart_of_accounts.menu()
+            chart_of_accounts.by_type("Asset")
+
+    def test_account_save_and_delete_invalidate(self):
+        self.assertNotIn("Ký quỹ", [account.name for account in chart_of_accounts.by_type("Asset")])
+        account = Account.objects.create(name="Ký quỹ", account_type="Asset", reference_code=244)
+        self.assertIn("Ký quỹ", [account.name for account in chart_of_accounts.by_type("Asset")])
+        self.assertIn("Ký quỹ", [item["name"] for item in chart_of_accounts.menu()])
+
+        account.name = "Ký quỹ, ký cược"
+        account.save()
+        self.assertEqual(chart_of_accounts.get(account.pk).name, "Ký quỹ, ký cược")
+
+        account.delete()
+        self.assertIsNone(chart_of_accounts.get(account.pk))
+
+    def test_other_processes_see_changes(self):
+        # A second registry stands in for another worker process, which only
+        # learns about changes through the version row.
+        other = ChartOfAccounts()
+        self.assertEqual(len(other.all()), 10)
+        account = Account.objects.create(name="Ký quỹ", account_type="Asset", reference_code=244)
+        self.assertIsNone(other.get(account.pk))
+        # The next request reads the version again.
+        other.recheck()
+        self.assertEqual(other.get(account.pk).name, "Ký quỹ")
+
+        account.delete()
+        with override_settings(ACCOUNTING_REGISTRY_RECHECK_SECONDS=0):
+            self.assertIsNone(other.get(account.pk))
+
+
+class ReportCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generate_ledger(accounts=15, entries=50)
+
+    def setUp(self):
+        report_cache.clear()
+        self.addCleanup(report_cache.clear)
+        self.view_component = ViewComponent()
+        chart_of_accounts.menu()
+
+    def test_hits_until_the_ledger_changes(self):
+        components = self.view_component.get_balance_sheet(None, None)
+        # Only the ledger generation is read on a hit.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.view_component.get_balance_sheet(None, None), components)
+        # Other ranges and arguments are cached separately.
+        with self.assertNumQueries(QUERY_BUDGETS["get_balance_sheet_range"] + 1):
+            self.view_component.get_balance_sheet(*DATE_RANGE)
+
+        cash = Account.objects.get(name="Tiền mặt")
+        post_entry("New sale", date(2024, 12, 31), [(cash, Decimal("10.00"), ""),
+                                                    (Account.objects.get(name="Hàng hóa"), Decimal("-10.00"), "")])
+        changed = self.view_component.get_balance_sheet(None, None)
+        self.assertEqual(changed["total_assets"], components["total_assets"])
+        self.assertEqual(next(a.balance for a in changed["asset_accounts"] if a.pk == cash.pk),
+                         next(a.balance for a in components["asset_accounts"] if a.pk == cash.pk) + 10)
+
+    def test_stats_command(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={
+            "default": settings.CACHES["default"],
+            "reports": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location},
+        }):
+            self.view_component.get_balance_sheet(None, None)
+            self.view_component.get_balance_sheet(None, None)
+            self.view_component.get_balance_sheet(None, None)
+
+            # Another thread gets its own cache instance, as another process would.
+            with ThreadPoolExecutor(1) as executor:
+                stats = executor.submit(report_cache.stats, ["balance_sheet"]).result()
+            self.assertEqual(stats["balance_sheet"]["hits"], 2)
+            self.assertEqual(stats["balance_sheet"]["misses"], 1)
+
+            out = StringIO()
+            call_command("report_cache", stdout=out)
+            self.assertIn("balance_sheet: 2 hits, 1 misses, hit rate 66.7%", out.getvalue())
+            self.assertIn("trial_balance: 0 hits, 0 misses, hit rate -", out.getvalue())
+
+            out = StringIO()
+            call_command("report_cache", clear=True, stdout=out)
+            self.assertIn("Report cache cleared.", out.getvalue())
+            self.assertEqual(report_cache.stats(["balance_sheet"])["balance_sheet"]["misses"], 0)
+
+    def test_command_refuses_a_process_local_cache(self):
+        self.view_component.get_balance_sheet(None, None)
+        with self.assertRaisesMessage(CommandError, "LocMemCache"):
+            call_command("report_cache", stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, "LocMemCache"):
+            call_command("report_cache", clear=True, stdout=StringIO())
+
+    @override_settings(ACCOUNTING_REPORT_CACHE=None)
+    def test_disabled(self):
+        self.view_component.get_balance_sheet(None, None)
+        with self.assertNumQueries(QUERY_BUDGETS["get_balance_sheet"]):
+            self.view_component.get_balance_sheet(None, None)
+        self.assertEqual(report_cache.stats(["balance_sheet"]), {})
+
+
+class JournalImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_chart_of_accounts(15)
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+
+    def import_csv(self, text, **kwargs):
+        return import_journal(BytesIO(text.encode()), "csv", **kwargs)
+
+    def test_imports_and_rejects_entries(self):
+        result = self.import_csv(
+            "entry,date,account,description,debit,credit\n"
+            "E1,2024-01-05,111,Cash sale,\"1,000.50\",\n"
+            "E1,2024-01-05,511,,,\"1,000.50\"\n"
+            "E2,2024-01-06,999,Unknown account,5,\n"
+            "E2,2024-01-06,111,,,5\n"
+            "E3,2024-01-07,111,Unbalanced,5,\n"
+            "E3,2024-01-07,511,,,4\n"
+            "E4,2024-13-01,111,Bad date,5,\n"
+            "E5,2024-01-08,111.0,Spreadsheet codes,5,\n"
+            "E5,2024-01-08,0511,,,5\n"
+            "E6,2024-01-09,111.5,Not a code,5,\n"
+            "E6,2024-01-09,511,,,5\n"
+            "E7,2024-01-10,Cash,Not a number,5,\n"
+            "E7,2024-01-10,511,,,5\n"
+        )
+        self.assertEqual((result["entries"], result["transactions"], result["rejected_entries"]), (2, 4, 5))
+        self.assertEqual(result["errors"], [
+            (4, "unknown account reference 999"),
+            (6, "entry 'E3' does not balance: debits and credits differ by 1"),
+            (8, "invalid date '2024-13-01'"),
+            (11, "account reference '111.5' is not a whole number"),
+            (13, "account reference 'Cash' is not a number"),
+        ])
+        entry = JournalEntry.objects.get(description="Cash sale")
+        self.assertEqual(entry.date, date(2024, 1, 5))
+        self.assertEqual(sorted(entry.transaction_set.values_list("amount", flat=True)),
+                         [Decimal("-1000.50"), Decimal("1000.50")])
+        spreadsheet = JournalEntry.objects.get(description="Spreadsheet codes")
+        self.assertEqual(sorted(spreadsheet.transaction_set.values_list("account__reference_code", flat=True)),
+                         [111, 511])
+        self.assertEqual(verify_daily_balances(), [])
+
+    def test_dry_run_and_chunks(self):
+        rows = "".join(f"E{i},2024-02-{i + 1:02d},111,,{i + 1}\nE{i},2024-02-{i + 1:02d},511,,-{i + 1}\n"
+                       for i in range(5))
+        result = self.import_csv("entry,date,account,description,amount\n" + rows, dry_run=True)
+        self.assertEqual((result["entries"], result["transactions"]), (5, 10))
+        self.assertFalse(JournalEntry.objects.exists())
+
+        result = self.import_csv("entry,date,account,description,amount\n" + rows, chunk_size=2)
+        self.assertEqual((result["entries"], result["transactions"]), (5, 10))
+        self.assertEqual(JournalEntry.objects.count(), 5)
+        self.assertEqual(verify_daily_balances(), [])
+
+    def test_rejects_closed_period(self):
+        self.import_csv("entry,date,account,amount\nA,2024-01-05,111,5\nA,2024-01-05,511,-5\n")
+        close_period(FiscalPeriod.objects.create(name="2024-01", start_date=date(2024, 1, 1),
+                                                 end_date=date(2024, 1, 31)))
+        result = self.import_csv("entry,date,account,amount\nB,2024-01-20,111,5\nB,2024-01-20,511,-5\n")
+        self.assertEqual(result["errors"], [(2, "the fiscal period containing 2024-01-20 is closed")])
+
+    def test_xlsx(self):
+        try:
+            from openpyxl import Workbook
+        except ImportError:
+            self.skipTest("openpyxl is not installed")
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(["Entry", "Date", "Account", "Debit", "Credit"])
+        sheet.append(["X", date(2024, 7, 1), 111, 7, None])
+        sheet.append(["X", date(2024, 7, 1), 511.0, None, 7])
+        fileobj = BytesIO()
+        workbook.save(fileobj)
+        fileobj.seek(0)
+
+        result = import_journal(fileobj, "xlsx")
+        self.assertEqual((result["entries"], result["errors"]), (1, []))
+
+    def test_admin_upload_and_command(self):
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile("entries.csv", b"entry,date,account,amount\nA,2024-06-01,111,3\nA,2024-06-01,642,-3\n")
+        response = self.client.post("/admin/journal-import/", {"file": upload})
+        self.assertContains(response, "Imported 1 entries (2 transactions).")
+        self.assertEqual(JournalEntry.objects.get().created_by, self.user)
+
+        upload = SimpleUploadedFile("entries.txt", b"entry")
+        response = self.client.post("/admin/journal-import/", {"file": upload})
+        self.assertContains(response, "Unsupported file type")
+
+        path = Path(tempfile.mkdtemp()) / "entries.csv"
+        path.write_text("entry,date,account,amount\nB,2024-06-02,111,4\nB,2024-06-02,642,-4\nC,2024-06-02,111,1\n")
+        out, err = StringIO(), StringIO()
+        call_command("import_journal", str(path), stdout=out, stderr=err)
+        self.assertIn("Imported 1 entries (2 transactions); rejected 1 entries.", out.getvalue())
+        self.assertIn("line 4: entry 'C' does not balance", err.getvalue())
+        with self.assertRaisesMessage(CommandError, "Cannot infer the format"):
+            call_command("import_journal", str(path.with_suffix(".txt")))
+
+
+class InstrumentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generate_ledger(accounts=15, entries=50)
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        reset_samples()
+
+    def test_disabled_adds_no_header(self):
+        response = self.client.get("/admin/report/Balance Sheet/")
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(summarize_samples(), [])
+
+    @override_settings(ACCOUNTING_INSTRUMENTATION=True, ACCOUNTING_REPORT_CACHE=None)
+    def test_enabled_records_profile(self):
+        with self.assertLogs("accounting.instrumentation", "INFO") as logs:
+            response = self.client.get("/admin/report/Balance Sheet/")
+        self.assertIn("balance_sheet;dur=", response["Server-Timing"])
+        self.assertGreater(logged_queries(logs), 0)
+
+        [sample] = summarize_samples()
+        self.assertEqual((sample["report"], sample["range"], sample["count"]), ("Balance Sheet", "all", 1))
+
+        response = self.client.get("/admin/instrumentation/")
+        self.assertContains(response, "Balance Sheet")
+
+    @override_settings(ACCOUNTING_INSTRUMENTATION=True, ACCOUNTING_REPORT_CACHE=None)
+    def test_counts_section_queries(self):
+        # Sections run one after another here, on the test's transaction.
+        for workers in (1, 4):
+            with self.subTest(workers=workers), self.settings(ACCOUNTING_REPORT_WORKERS=workers):
+                with self.assertLogs("accounting.instrumentation", "INFO") as logs:
+                    response = self.client.get("/admin/account-balance/Tiền mặt/")
+                self.assertGreater(logged_queries(logs), 0)
+                self.assertNotIn('desc="0 queries"', response["Server-Timing"])
+                self.assertIn("account_balance;dur=", response["Server-Timing"])
+
+    def test_counts_fetched_rows(self):
+        with self.assertLogs("accounting.instrumentation", "INFO"):
+            with request_profile("Probe") as profile:
+                list(Transaction.objects.values_list("pk", flat=True))
+                Transaction.objects.filter(pk=0).first()
+                accounts = [Account(name=str(i)) for i in range(50)]
+        self.assertEqual(len(accounts), 50)
+        self.assertEqual(profile.queries, 2)
+        self.assertEqual(profile.rows, Transaction.objects.count())
+
+    @override_settings(ACCOUNTING_INSTRUMENTATION=True)
+    def test_exports_are_profiled_until_streamed(self):
+        url = "/admin/export/general-ledger/?format=csv"
+        response = self.client.get(url)
+        self.assertNotIn("Server-Timing", response)
+        with self.assertLogs("accounting.instrumentation", "INFO") as logs:
+            b"".join(response.streaming_content)
+        self.assertGreater(logged_queries(logs), 0)
+        self.assertGreaterEqual(json.loads(logs.records[-1].getMessage())["rows"], Transaction.objects.count())
+
+        async def fetch():
+            client = AsyncClient()
+            await client.aforce_login(self.user)
+            response = await client.get(url)
+            return [part async for part in response.streaming_content]
+
+        with self.assertLogs("accounting.instrumentation", "INFO") as logs:
+            async_to_sync(fetch)()
+        self.assertGreater(logged_queries(logs), 0)
+        self.assertGreaterEqual(json.loads(logs.records[-1].getMessage())["rows"], Transaction.objects.count())
+
+
+class AccountHierarchyTests(TestCase):
+    def setUp(self):
+        self.cash = Account.objects.create(name="Tiền mặt", account_type="Asset", reference_code=111)
+        self.vnd = Account.objects.create(name="Tiền Việt Nam", account_type="Asset", reference_code=1111,
+                                          parent=self.cash)
+        self.till = Account.objects.create(name="Quỹ bán hàng", account_type="Asset", reference_code=11111,
+                                           parent=self.vnd)
+
+    def test_paths(self):
+        self.assertEqual(self.till.path, f"{self.cash.pk}/{self.vnd.pk}/{self.till.pk}/")
+        self.assertEqual([self.cash.depth, self.vnd.depth, self.till.depth], [0, 1, 2])
+
+    def test_moving_an_account_moves_its_subtree(self):
+        bank = Account.objects.create(name="Tiền gửi ngân hàng", account_type="Asset", reference_code=112)
+        self.vnd.parent = bank
+        self.vnd.save()
+        self.till.refresh_from_db()
+        self.assertEqual(self.till.path, f"{bank.pk}/{self.vnd.pk}/{self.till.pk}/")
+        self.assertEqual(self.till.depth, 2)
+
+        self.vnd.parent = None
+        self.vnd.save()
+        self.till.refresh_from_db()
+        self.assertEqual(self.till.path, f"{self.vnd.pk}/{self.till.pk}/")
+        self.assertEqual(self.till.depth, 1)
+
+    def test_path_commits_with_the_chart_version(self):
+        version = get_chart_version()
+        bank = Account(name="Tiền gửi ngân hàng", account_type="Asset", reference_code=112, parent=self.cash)
+        with patch.object(Account, "update_path", side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            bank.save()
+        self.assertEqual(get_chart_version(), version)
+        self.assertFalse(Account.objects.filter(reference_code=112).exists())
+
+    def test_clean(self):
+        self.cash.parent = self.till
+        with self.assertRaises(ValidationError):
+            self.cash.clean()
+        revenue = Account.objects.create(name="Doanh thu", account_type="Revenue", reference_code=511)
+        revenue.parent = self.cash
+        with self.assertRaises(ValidationError):
+            revenue.clean()
+
+    def test_subtotals(self):
+        revenue = Account.objects.create(name="Doanh thu", account_type="Revenue", reference_code=511)
+        post_entry("Bán hàng", date(2024, 1, 5), [(self.cash, Decimal("10.00"), ""),
+                                                  (self.till, Decimal("5.00"), ""),
+                                                  (revenue, Decimal("-15.00"), "")])
+        view_component = ViewComponent()
+        by_name = {account.name: account.balance
+                   for account in view_component.get_balance_sheet(None, None, 2)["asset_accounts"]}
+        self.assertEqual(by_name, {"Tiền mặt": Decimal("15.00"), "Tiền Việt Nam": Decimal("5.00")})
+        components = view_component.get_trial_balance(None, None, 1)
+        self.assertEqual([(row["account__name"], row["debit"]) for row in components["accounts"]],
+                         [("Tiền mặt", Decimal("15.00")), ("Doanh thu", Decimal("0.00"))])
+
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        response = self.client.get("/admin/report/Balance Sheet/?depth=3")
+        self.assertContains(response, "Quỹ bán hàng")
+        response = self.client.get("/api/balance-sheet/?depth=1")
+        self.assertEqual([account["name"] for account in response.json()["asset_accounts"]], ["Tiền mặt"])
+
+
+@override_settings(ACCOUNTING_REPORT_CACHE=None)
+class ReportSnapshotTests(TestCase):
+    today = date(2024, 12, 15)
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_ledger(accounts=15, entries=100)
+
+    def setUp(self):
+        self.view_component = ViewComponent()
+
+    def test_precompute_standard_periods(self):
+        self.assertEqual(precompute_reports(self.view_component, self.today), 4 * 7)
+        self.assertTrue(ReportSnapshot.objects.filter(report="balance_sheet", start_date="2024-10-01",
+                                                      end_date="2024-12-31").exists())
+
+        with self.assertNumQueries(1):
+            components = serve_report(self.view_component.get_balance_sheet, None, None)
+        self.assertFalse(components.pop("snapshot")["is_stale"])
+        live = self.view_component.get_balance_sheet(None, None)
+        self.assertEqual(components["total_assets"], live["total_assets"])
+        self.assertEqual([account.balance for account in components["asset_accounts"]],
+                         [account.balance for account in live["asset_accounts"]])
+
+        components = serve_report(self.view_component.get_trial_balance, "2024-12-01", "2024-12-31", None)
+        self.assertIsNotNone(components["snapshot"])
+        components = serve_report(self.view_component.get_trial_balance, "2024-12-01", "2024-12-31", 1)
+        self.assertIsNone(components["snapshot"])
+        components = serve_report(self.view_component.get_income_statement, "2024-02-03", "2024-02-20")
+        self.assertIsNone(components["snapshot"])
+
+    def test_snapshots_store_plain_json(self):
+        precompute_reports(self.view_component, self.today)
+        snapshot = ReportSnapshot.objects.get(report="balance_sheet", start_date=None, end_date=None)
+        [cash] = [row for row in snapshot.components["asset_accounts"] if row["$account"]["reference_code"] == 111]
+        self.assertEqual(cash["$account"]["name"], "Tiền mặt")
+        self.assertEqual(json.loads(json.dumps(snapshot.components)), snapshot.components)
+
+        for method in (self.view_component.get_trial_balance, self.view_component.get_income_statement,
+                       self.view_component.get_balance_sheet, self.view_component.get_retained_earnings_statement):
+            components = serve_report(method, "2024-10-01", "2024-12-31")
+            self.assertIsNotNone(components.pop("snapshot"), method.report)
+            live = method("2024-10-01", "2024-12-31")
+            for key, value in live.items():
+                if isinstance(value, list) and value and isinstance(value[0], Account):
+                    self.assertEqual([(account.pk, account.name, account.depth, account.balance) for account in components[key]],
+                                     [(account.pk, account.name, account.depth, account.balance) for account in value])
+                else:
+                    self.assertEqual(components[key], value, key)
+
+    def test_snapshots_go_stale(self):
+        precompute_reports(self.view_component, self.today)
+        cash, revenue = Account.objects.get(reference_code=111), Account.objects.get(reference_code=511)
+        post_entry("Bán hàng", date(2024, 12, 10), [(cash, Decimal("10.00"), ""), (revenue, Decimal("-10.00"), "")])
+        components = serve_report(self.view_component.get_income_statement, None, None)
+        self.assertTrue(components["snapshot"]["is_stale"])
+
+        precompute_reports(self.view_component, date(2025, 1, 5))
+        self.assertFalse(ReportSnapshot.objects.filter(start_date="2024-11-01").exists())
+        components = serve_report(self.view_component.get_income_statement, None, None)
+        self.assertFalse(components["snapshot"]["is_stale"])
+
+    def test_command_and_views(self):
+        call_command("precompute_reports", "--once", stdout=open(os.devnull, "w"))
+        self.assertEqual(ReportSnapshot.objects.count(), 4 * 7)
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        response = self.client.get("/admin/report/Balance Sheet/")
+        self.assertContains(response, "Precomputed at")
+        self.assertNotContains(response, "Stale:")
+        response = self.client.get("/admin/trial-balance/?start_date=2024-02-03&end_date=2024-02-20")
+        self.assertNotContains(response, "Precomputed at")
+
+
+@override_settings(ACCOUNTING_REPORT_CACHE=None)
+class TaxReportTests(TestCase):
+    def setUp(self):
+        self.cash = Account.objects.create(name="Tiền mặt", account_type="Asset", reference_code=111)
+        self.goods = Account.objects.create(name="Hàng hóa", account_type="Asset", reference_code=156)
+        self.vat = Account.objects.create(name="Thuế GTGT", account_type="Liability", reference_code=3331)
+        self.revenue = Account.objects.create(name="Doanh thu", account_type="Revenue", reference_code=511)
+        self.standard = TaxRate.objects.create(name="VAT", rate=Decimal("10"))
+        self.reduced = TaxRate.objects.create(name="VAT", rate=Decimal("5"))
+
+    def sale(self, day, base, tax_rate):
+        tax = (base * tax_rate.rate / 100).quantize(Decimal("0.01"))
+        return post_entry("Bán hàng", day, [(self.cash, base + tax, ""), (self.revenue, -base, "", tax_rate),
+                                            (self.vat, -tax, "")])
+
+    def purchase(self, day, base, tax_rate):
+        tax = (base * tax_rate.rate / 100).quantize(Decimal("0.01"))
+        return post_entry("Mua hàng", day, [(self.goods, base, "", tax_rate), (self.vat, tax, ""),
+                                            (self.cash, -base - tax, "")])
+
+    def test_tax_report(self):
+        self.sale(date(2024, 1, 5), Decimal("100.10"), self.standard)
+        self.sale(date(2024, 1, 20), Decimal("200.00"), self.reduced)
+        self.purchase(date(2024, 1, 25), Decimal("50.00"), self.standard)
+        self.sale(date(2024, 2, 3), Decimal("10.00"), self.standard)
+
+        with self.assertNumQueries(1):
+            components = ViewComponent().get_tax_report("2024-01-01", "2024-12-31", "month")
+        rows = [(row["period"], row["rate"], row["output_base"], row["output_tax"], row["input_tax"], row["tax_payable"])
+                for row in components["rows"]]
+        self.assertEqual(rows, [
+            ("2024-01", Decimal("5"), Decimal("200.00"), Decimal("10.00"), Decimal("0.00"), Decimal("10.00")),
+            ("2024-01", Decimal("10"), Decimal("100.10"), Decimal("10.01"), Decimal("5.00"), Decimal("5.01")),
+            ("2024-02", Decimal("10"), Decimal("10.00"), Decimal("1.00"), Decimal("0.00"), Decimal("1.00")),
+        ])
+        self.assertEqual(components["totals"]["tax_payable"], Decimal("16.01"))
+
+        quarterly = ViewComponent().get_tax_report("2024-01-01", "2024-12-31", "quarter")
+        self.assertEqual(len(quarterly["rows"]), 2)
+        self.assertEqual(quarterly["totals"], components["totals"])
+
+    def test_rate_change_recalculates_open_lines(self):
+        self.sale(date(2024, 1, 5), Decimal("100.00"), self.standard)
+        self.sale(date(2024, 2, 5), Decimal("100.00"), self.standard)
+        Account.objects.create(name="Lợi nhuận sau thuế chưa phân phối", account_type="Equity", reference_code=421,
+                               role=Account.RETAINED_EARNINGS)
+        close_period(FiscalPeriod.objects.create(name="2024-01", start_date=date(2024, 1, 1),
+                                                 end_date=date(2024, 1, 31)))
+
+        self.standard.rate = Decimal("8")
+        # Including the ids read for the change feed and its events.
+        with self.assertNumQueries(7):
+            self.standard.save()
+        taxes = list(Transaction.objects.filter(tax_rate=self.standard).order_by("date").values_list("tax_amount", flat=True))
+        self.assertEqual(taxes, [Decimal("-10.00"), Decimal("-8.00")])
+
+    def test_rate_change_over_many_lines(self):
+        lines = [(self.revenue, Decimal("-1.00"), "", self.reduced) for _ in range(4500)]
+        post_entry("Bán lẻ", date(2024, 3, 1), [*lines, (self.cash, Decimal("4500.00"), "")])
+        after = ChangeEvent.objects.order_by("id").last().id
+
+        self.reduced.rate = Decimal("8")
+        with CaptureQueriesContext(connection) as queries:
+            self.reduced.save()
+        # Past SQLite's variable limit, an id list would fail outright.
+        self.assertFalse([query["sql"] for query in queries if " IN (" in query["sql"]])
+        self.assertEqual(set(Transaction.objects.filter(tax_rate=self.reduced).values_list("tax_amount", flat=True)),
+                         {Decimal("-0.08")})
+        events = ChangeEvent.objects.filter(id__gt=after, model="transaction", action=ChangeEvent.UPDATE)
+        self.assertEqual(events.count(), 4500)
+
+    def test_saving_a_line_reads_the_rate_only_when_needed(self):
+        entry = self.sale(date(2024, 1, 5), Decimal("100.00"), self.standard)
+        line = Transaction.objects.get(journal_entry=entry, account=self.revenue)
+
+        def rate_reads(save):
+            with CaptureQueriesContext(connection) as queries:
+                save()
+            return [query["sql"] for query in queries if "accounting_taxrate" in query["sql"]]
+
+        line.description = "Bán hàng lẻ"
+        self.assertEqual(rate_reads(line.save), [])
+        line.amount = Decimal("-200.00")
+        self.assertEqual(len(rate_reads(line.save)), 1)
+        self.assertEqual(line.tax_amount, Decimal("-20.00"))
+        line.tax_rate = self.reduced
+        self.assertEqual(rate_reads(line.save), [])
+        self.assertEqual(line.tax_amount, Decimal("-10.00"))
+
+    def test_saved_line_gets_tax(self):
+        entry = self.sale(date(2024, 1, 5), Decimal("100.00"), self.standard)
+        line = entry.transaction_set.get(account=self.revenue)
+        line.tax_rate = self.reduced
+        line.save()
+        self.assertEqual(line.tax_amount, Decimal("-5.00"))
+        line.tax_rate = None
+        post_transactions(entry, [line])
+        line.refresh_from_db()
+        self.assertEqual(line.tax_amount, 0)
+
+    def test_database_and_model_round_alike(self):
+        # Half cents round away from zero; as floats, 100.50 * 1% falls just
+        # below the half and 8456802979.59 * 61.22% just above.
+        one_percent = TaxRate.objects.create(name="VAT", rate=Decimal("1"))
+        odd = TaxRate.objects.create(name="VAT", rate=Decimal("61.22"))
+        lines = [(self.revenue, Decimal("-100.50"), "", one_percent),
+                 (self.revenue, Decimal("1.45"), "", self.reduced),
+                 (self.revenue, Decimal("-99.50"), "", self.standard),
+                 (self.revenue, Decimal("8456802979.59"), "", odd)]
+        entry = post_entry("Bán hàng", date(2024, 1, 5),
+                           [*lines, (self.cash, -sum(amount for _, amount, _, _ in lines), "")])
+        expected = [Decimal("-1.01"), Decimal("0.07"), Decimal("-9.95"), Decimal("5177254784.10")]
+
+        lines = list(entry.transaction_set.filter(tax_rate__isnull=False).order_by("pk"))
+        self.assertEqual([line.tax_amount for line in lines], expected)
+        for line in lines:
+            line.save()
+        self.assertEqual([line.tax_amount for line in lines], expected)
+
+    def test_admin_view(self):
+        self.sale(date(2024, 1, 5), Decimal("100.00"), self.standard)
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        response = self.client.get("/admin/tax-report/?grain=quarter")
+        self.assertContains(response, "2024-Q1")
+        self.assertContains(response, "Báo cáo thuế GTGT")
+
+
+class PostingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.accounts = create_chart_of_accounts(10)
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+
+    def lines(self, count):
+        return [(self.accounts[i % 10], Decimal(5) if i % 2 == 0 else Decimal(-5), "") for i in range(count)]
+
+    def test_query_count_does_not_grow_with_lines(self):
+        with self.assertNumQueries(20):
+            post_entry("Small", date(2024, 1, 2), self.lines(10))
+        for count, day in ((100, 3), (200, 4)):
+            with self.assertNumQueries(20):
+                entry = post_entry("Large", date(2024, 1, day), self.lines(count))
+            self.assertEqual(entry.transaction_set.count(), count)
+        self.assertEqual(verify_daily_balances(), [])
+
+    def test_back_dated_post_only_touches_its_days(self):
+        for day in range(1, 31):
+            post_entry("Entry", date(2024, 3, day), self.lines(10))
+        later = dict(AccountDailyBalance.objects.filter(date__gt=date(2024, 1, 2)).values_list("pk", "date"))
+
+        # The same queries whether 30 or 60 days follow the back-dated entry.
+        with self.assertNumQueries(20):
+            entry = post_entry("Back-dated", date(2024, 1, 2), self.lines(10))
+        for day in range(1, 31):
+            post_entry("Entry", date(2024, 4, day), self.lines(10))
+        with self.assertNumQueries(20):
+            post_entry("Back-dated", date(2024, 1, 1), self.lines(10))
+
+        # Later days keep their rows and only have their balance shifted.
+        self.assertEqual(dict(AccountDailyBalance.objects.filter(pk__in=later).values_list("pk", "date")), later)
+        self.assertEqual(verify_daily_balances(), [])
+
+        # Changed and deleted lines take their old amounts back out.
+        first, second, third = entry.transaction_set.order_by("pk")[:3]
+        first.account = self.accounts[9]
+        second.amount, third.amount = Decimal(-7), Decimal(7)
+        post_transactions(entry, [first, second, third], user=self.user)
+        self.assertEqual(verify_daily_balances(), [])
+        post_transactions(entry, deleted=[second, third], user=self.user)
+        self.assertEqual(verify_daily_balances(), [])
+
+    def test_unbalanced_entry_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            post_entry("Unbalanced", date(2024, 1, 2), self.lines(3))
+        self.assertFalse(JournalEntry.objects.exists())
+        self.assertEqual(verify_daily_balances(), [])
+
+    def test_update_and_delete_lines(self):
+        entry = post_entry("Entry", date(2024, 1, 2), self.lines(6))
+        first, second, third, fourth, fifth, sixth = entry.transaction_set.order_by("pk")
+        first.amount = second.amount = Decimal(0)
+        third.account = self.accounts[9]
+        result = post_transactions(entry, [first, second, third], [fifth, sixth], user=self.user)
+        self.assertEqual(result, {"created": 0, "updated": 1, "deleted": 4})
+        self.assertEqual(list(entry.transaction_set.order_by("pk").values_list("account", flat=True)),
+                         [self.accounts[9].pk, self.accounts[3].pk])
+        self.assertEqual(verify_daily_balances(), [])
+
+    def test_admin_drops_zero_lines_and_checks_balance(self):
+        self.client.force_login(self.user)
+        data = {
+            "description": "Admin entry",
+            "date": "2024-01-02",
+            "transaction_set-TOTAL_FORMS": 3,
+            "transaction_set-INITIAL_FORMS": 0,
+        }
+        for i, amount in enumerate([5, -5, 0]):
+            data[f"transaction_set-{i}-account"] = self.accounts[i].pk
+            data[f"transaction_set-{i}-amount"] = amount
+        response = self.client.post("/admin/accounting/journalentry/add/", data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Transaction.objects.count(), 2)
+
+        data["transaction_set-2-amount"] = 3
+        response = self.client.post("/admin/accounting/journalentry/add/", data)
+        self.assertContains(response, "does not balance")
+        self.assertEqual(JournalEntry.objects.count(), 1)
+
+
+class ChangeFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.accounts = create_chart_of_accounts(10)
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+
+    def changes(self, after=0):
+        return [(change["model"], change["object_id"], change["action"])
+                for change in read_changes(after, 10_000)["changes"]]
+
+    def test_records_bulk_and_single_writes(self):
+        after = ChangeEvent.objects.order_by("id").last().id
+        entry = post_entry("Entry", date(2024, 1, 2), [(self.accounts[0], 5, ""), (self.accounts[1], -5, ""),
+                                                       (self.accounts[2], 3, ""), (self.accounts[3], -3, "")])
+        first, second, third, fourth = entry.transaction_set.order_by("pk")
+        self.assertEqual(self.changes(after), [("journalentry", entry.pk, "create")] +
+                         [("transaction", line.pk, "create") for line in (first, second, third, fourth)])
+
+        after = ChangeEvent.objects.order_by("id").last().id
+        first.amount, second.amount = 3, -3
+        post_transactions(entry, [first, second], [third, fourth])
+        self.assertEqual(self.changes(after), [("transaction", first.pk, "update"),
+                                               ("transaction", second.pk, "update"),
+                                               ("transaction", third.pk, "delete"),
+                                               ("transaction", fourth.pk, "delete")])
+
+        after = ChangeEvent.objects.order_by("id").last().id
+        entry.date = date(2024, 1, 5)
+        entry.save()
+        self.assertEqual(sorted(self.changes(after)), [("journalentry", entry.pk, "update"),
+                                                       ("transaction", first.pk, "update"),
+                                                       ("transaction", second.pk, "update")])
+        data = read_changes(after)["changes"][-1]["data"]
+        self.assertEqual(data["date"], date(2024, 1, 5))
+
+        after, entry_id = ChangeEvent.objects.order_by("id").last().id, entry.pk
+        entry.delete()
+        self.assertEqual(sorted(self.changes(after)), [("journalentry", entry_id, "delete"),
+                                                       ("transaction", first.pk, "delete"),
+                                                       ("transaction", second.pk, "delete")])
+
+    def test_import_and_account_moves(self):
+        after = ChangeEvent.objects.order_by("id").last().id
+        write_entries([{"description": "Imported", "date": date(2024, 1, 2),
+                        "lines": [(self.accounts[0].pk, Decimal(7), ""), (self.accounts[1].pk, Decimal(-7), "")]}])
+        entry = JournalEntry.objects.get(description="Imported")
+        self.assertEqual(self.changes(after), [("journalentry", entry.pk, "create")] +
+                         [("transaction", pk, "create")
+                          for pk in entry.transaction_set.order_by("pk").values_list("pk", flat=True)])
+
+        parent = Account.objects.create(name="Nhóm tiền", account_type="Asset", reference_code=110)
+        child = Account.objects.create(name="Tiền mặt - quỹ", account_type="Asset", reference_code=1111,
+                                       parent=self.accounts[0])
+        after = ChangeEvent.objects.order_by("id").last().id
+        self.accounts[0].parent = parent
+        self.accounts[0].save()
+        self.assertEqual(sorted(self.changes(after)), [("account", self.accounts[0].pk, "update"),
+                                                       ("account", child.pk, "update")])
+
+    def test_cursor_pages(self):
+        start = ChangeEvent.objects.order_by("id").last().id
+        for day in range(1, 6):
+            post_entry("Entry", date(2024, 1, day), [(self.accounts[0], 5, ""), (self.accounts[1], -5, "")])
+        expected = list(ChangeEvent.objects.filter(id__gt=start).order_by("id").values_list("id", flat=True))
+
+        ids, after, has_more = [], start, True
+        while has_more:
+            # Events plus one query per model referenced by the page.
+            with self.assertNumQueries(3):
+                feed = read_changes(after, 3)
+            ids += [change["id"] for change in feed["changes"]]
+            after, has_more = feed["next_cursor"], feed["has_more"]
+        self.assertEqual(ids, expected)
+        self.assertEqual(read_changes(after), {"changes": [], "next_cursor": after, "has_more": False})
+
+    def test_api_and_command(self):
+        post_entry("Entry", date(2024, 1, 2), [(self.accounts[0], 5, ""), (self.accounts[1], -5, "")])
+        self.client.force_login(self.user)
+        url, ids = "/api/changes/?limit=5", []
+        while url:
+            page = self.client.get(url).json()
+            ids += [change["id"] for change in page["changes"]]
+            url = page["next"]
+        self.assertEqual(ids, list(ChangeEvent.objects.order_by("id").values_list("id", flat=True)))
+        self.assertEqual(self.client.get("/api/changes/?after=x").status_code, 400)
+
+        cursor_file = Path(tempfile.mkdtemp()) / "cursor"
+        out = StringIO()
+        call_command("change_feed", cursor_file=str(cursor_file), limit=4, stdout=out)
+        self.assertEqual([json.loads(line)["id"] for line in out.getvalue().splitlines()], ids)
+        self.assertEqual(int(cursor_file.read_text()), ids[-1])
+
+        post_entry("Later", date(2024, 1, 3), [(self.accounts[0], 5, ""), (self.accounts[1], -5, "")])
+        out = StringIO()
+        call_command("change_feed", cursor_file=str(cursor_file), stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+
+
+class ReconciliationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.accounts = create_chart_of_accounts(11)
+        cls.bank = Account.objects.get(name="Tiền gửi ngân hàng")
+        cls.sales = Account.objects.get(name="Doanh thu bán hàng và cung cấp dịch vụ")
+
+    def post(self, day, amount, description=""):
+        entry = post_entry(description or "Entry", day, [(self.bank, amount, description), (self.sales, -amount, "")])
+        return entry.transaction_set.get(account=self.bank)
+
+    def statement(self, rows):
+        text = "date,reference,description,deposit,withdrawal\n" + "".join(f"{row}\n" for row in rows)
+        result = import_statement(StringIO(text), self.bank)
+        self.assertEqual(result["errors"], [])
+        return result["statement"]
+
+    def matches(self, statement):
+        return list(statement.lines.order_by("pk").values_list("match__transaction", "match__rule"))
+
+    def test_matches_by_reference_then_closest_date(self):
+        by_reference = self.post(date(2024, 3, 6), Decimal("100.00"), "Thu tiền FT-2403-01")
+        closest = self.post(date(2024, 3, 5), Decimal("100.00"))
+        self.post(date(2024, 3, 20), Decimal("100.00"))
+        statement = self.statement(["2024-03-05,FT240301,,100.00,", "2024-03-04,,,100.00,", "2024-03-05,,,100.00,"])
+
+        result = reconcile_statement(statement)
+        self.assertEqual(result, {"matched_by_reference": 1, "matched_by_amount": 1, "released": 0,
+                                  "unmatched_lines": 1})
+        # The third line has no candidate left within the window.
+        self.assertEqual(self.matches(statement), [(by_reference.pk, BankMatch.REFERENCE),
+                                                   (closest.pk, BankMatch.AMOUNT_DATE),
+                                                   (None, None)])
+
+    def test_reruns_are_incremental(self):
+        withdrawal = self.post(date(2024, 3, 5), Decimal("-40.00"))
+        statement = self.statement(["2024-03-05,,,,40.00", "2024-03-09,,,25.00,"])
+        self.assertEqual(reconcile_statement(statement)["unmatched_lines"], 1)
+        self.assertEqual(self.matches(statement)[0], (withdrawal.pk, BankMatch.AMOUNT_DATE))
+
+        deposit = self.post(date(2024, 3, 10), Decimal("25.00"))
+        result = reconcile_statement(statement)
+        self.assertEqual((result["matched_by_amount"], result["unmatched_lines"]), (1, 0))
+        self.assertEqual(self.matches(statement), [(withdrawal.pk, BankMatch.AMOUNT_DATE),
+                                                   (deposit.pk, BankMatch.AMOUNT_DATE)])
+
+        # A matched transaction changed afterwards is released.
+        deposit, other = deposit.journal_entry.transaction_set.order_by("pk")
+        deposit.amount, other.amount = Decimal("26.00"), Decimal("-26.00")
+        post_transactions(deposit.journal_entry, [deposit, other])
+        result = reconcile_statement(statement)
+        self.assertEqual((result["released"], result["unmatched_lines"]), (1, 1))
+        self.assertEqual(self.matches(statement)[1], (None, None))
+
+    def test_large_statement(self):
+        lines, start = [], date(2024, 1, 1)
+        entries = []
+        for number in range(1000):
+            day = start + timedelta(days=number % 365)
+            amount = Decimal(number % 50 + 1)
+            entries.append({"description": f"Entry {number}", "date": day,
+                            "lines": [(self.bank.pk, amount, f"REF{number:05d}"), (self.sales.pk, -amount, "")]})
+            lines.append(f"{day + timedelta(days=number % 3)},{'REF%05d' % number if number % 2 else ''},,{amount},")
+        write_entries(entries)
+        statement = self.statement(lines)
+
+        result = reconcile_statement(statement)
+        self.assertEqual(result["matched_by_reference"], 500)
+        self.assertEqual(result["unmatched_lines"], 0)
+        self.assertEqual(BankMatch.objects.filter(line__statement=statement).count(), 1000)
+        self.assertEqual(reconcile_statement(statement)["matched_by_amount"], 0)
+
+    def test_taken_candidates_are_dropped(self):
+        day = date(2024, 3, 1)
+        dated = sorted((day + timedelta(days=pk % 3), pk) for pk in range(1000))
+        # Half already matched through another list, e.g. by reference.
+        taken = set(range(0, 1000, 2))
+        picked = [take_closest(dated, day, timedelta(days=3), taken) for _ in range(500)]
+        self.assertEqual(sorted(picked), list(range(1, 1000, 2)))
+        self.assertIsNone(take_closest(dated, day, timedelta(days=3), taken))
+        self.assertEqual(dated, [])
+
+    def test_command(self):
+        self.post(date(2024, 3, 5), Decimal("100.00"))
+        path = Path(tempfile.mkdtemp()) / "statement.csv"
+        path.write_text("date,reference,description,amount\n2024-03-05,,,100.00\n2024-03-06,,,bad\n")
+        out, err = StringIO(), StringIO()
+        call_command("reconcile_statement", str(path), account=self.bank.reference_code, stdout=out, stderr=err)
+        self.assertIn("line 3: amount is not a number", err.getvalue())
+        self.assertIn("Matched 0 lines by reference and 1 by amount and date; 0 unmatched", out.getvalue())
+
+
+class ReportApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generate_ledger(accounts=15, entries=50)
+        cls.user = User.objects.create_superuser("admin", "admin@example.com", "password")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_reports(self):
+        for url in ["/api/trial-balance/",
+                    "/api/income-statement/?start_date=2024-01-01&end_date=2024-06-30",
+                    "/api/balance-sheet/",
+                    "/api/retained-earnings-statement/"]:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertIn("ETag", response)
+            self.assertIn("Last-Modified", response)
+
+        report = self.client.get("/api/trial-balance/").json()
+        self.assertEqual(report["total_debit"], report["total_credit"])
+
+    def test_unchanged_ledger_returns_not_modified(self):
+        response = self.client.get("/api/balance-sheet/")
+        # Session, user and the ledger generation; no report queries.
+        with self.assertNumQueries(3):
+            cached = self.client.get("/api/balance-sheet/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+
+        post_entry("New sale", date(2024, 12, 31), [(Account.objects.get(name="Tiền mặt"), 10, ""),
+                                                    (Account.objects.get(name="Hàng hóa"), -10, "")])
+        changed = self.client.get("/api/balance-sheet/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], response["ETag"])
+
+    def test_ledger_pages(self):
+        url = "/api/accounts/Tiền mặt/ledger/?page_size=20"
+        ids = []
+        while url:
+            page = self.client.get(url).json()
+            ids += [transaction["id"] for transaction in page["transactions"]]
+            url = page["next"]
+        self.assertEqual(ids, list(Transaction.objects.filter(account__name="Tiền mặt")
+                                   .order_by("date", "pk").values_list("pk", flat=True)))
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.client.get("/api/trial-balance/?start_date=2024-13-01&end_date=2024-12-31").status_code, 400)
+        self.assertEqual(self.client.post("/api/trial-balance/").status_code, 405)
+        self.client.logout()
+        self.assertEqual(self.client.get("/api/trial-balance/").status_code, 403)
+
+
+@override_settings(ACCOUNTING_REPORT_WORKERS=4, ACCOUNTING_REPORT_CACHE=None)
+class ConcurrentReportTests(TransactionTestCase):
+    databases = {"default", REPORTS_ALIAS}
+
+    def setUp(self):
+        generate_ledger(accounts=15, entries=50)
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+
+    def test_sections_run_side_by_side(self):
+        started = time.perf_counter()
+        sections = async_to_sync(gather_sections)({
+            name: (lambda value: time.sleep(0.2) or value, name) for name in ("a", "b", "c")
+        })
+        self.assertEqual(sections, {"a": "a", "b": "b", "c": "c"})
+        self.assertLess(time.perf_counter() - started, 0.5)
+
+    def test_report_views(self):
+        for url in ["/admin/trial-balance/",
+                    "/admin/account-balance/Tiền mặt/",
+                    "/admin/report/Income Statement/",
+                    "/admin/report/Retained Earnings Statement/",
+                    "/admin/report/Balance Sheet/"]:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+        self.assertContains(response, "Tiền mặt")
+
+    def test_requires_login(self):
+        self.client.logout()
+        response = self.client.get("/admin/report/Balance Sheet/")
+        self.assertEqual(response.status_code, 302)
+
+    def test_threads_share_a_profile(self):
+        def work():
+            try:
+                with share_profile(profile):
+                    for _ in range(50):
+                        list(Account.objects.values_list("pk", flat=True)[:1])
+            finally:
+                connections.close_all()
+
+        with self.assertLogs("accounting.instrumentation", "INFO"):
+            with request_profile("Probe") as profile:
+                threads = [threading.Thread(target=work) for _ in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        self.assertEqual(profile.queries, 400)
+        self.assertEqual(profile.rows, 400)
+        self.assertEqual(len(profile.slowest), 5)
+
+    @override_settings(ACCOUNTING_INSTRUMENTATION=True, ACCOUNTING_REPORT_CACHE=None)
+    def test_profile_counts_pool_queries(self):
+        for workers in (1, 4):
+            with self.subTest(workers=workers), self.settings(ACCOUNTING_REPORT_WORKERS=workers):
+                with self.assertLogs("accounting.instrumentation", "INFO") as logs:
+                    response = self.client.get("/admin/report/Balance Sheet/")
+                self.assertGreater(logged_queries(logs), 0)
+                self.assertNotIn('desc="0 queries"', response["Server-Timing"])
+
+
+class PostingQueueTests(TransactionTestCase):
+    databases = {"default", REPORTS_ALIAS}
+
+    def setUp(self):
+        self.accounts = create_chart_of_accounts(10)
+        self.queue = PostingQueue(max_batch=50)
+        self.addCleanup(self.queue.stop)
+
+    def lines(self, amount):
+        return [(self.accounts[0], amount, ""), (self.accounts[1], -amount, "")]
+
+    def test_pending_entries_are_written_together(self):
+        # Hold the writer so the entries queue up behind the first write.
+        release = threading.Event()
+        blocked = self.queue.submit(release.wait, 5)
+        futures = [self.queue.submit(post_entry, f"Entry {day}", date(2024, 1, day), self.lines(day))
+                   for day in range(1, 11)]
+        unbalanced = self.queue.submit(post_entry, "Unbalanced", date(2024, 1, 11),
+                                       [(self.accounts[0], 5, ""), (self.accounts[1], -4, "")])
+
+        def post_then_fail():
+            post_entry("Rolled back", date(2024, 1, 12), self.lines(3))
+            raise ValidationError("Rejected after posting.")
+
+        rolled_back = self.queue.submit(post_then_fail)
+        release.set()
+
+        self.assertTrue(blocked.result(5))
+        entries = [future.result(5) for future in futures]
+        with self.assertRaises(ValidationError):
+            unbalanced.result(5)
+        with self.assertRaises(ValidationError):
+            rolled_back.result(5)
+        self.assertLessEqual(self.queue.batches, 2)
+        self.assertEqual(sorted(entry.pk for entry in entries),
+                         list(JournalEntry.objects.order_by("pk").values_list("pk", flat=True)))
+        self.assertEqual(verify_daily_balances(), [])
+
+    def test_concurrent_callers(self):
+        def post(day):
+            try:
+                return self.queue.submit(post_entry, "Entry", date(2024, 1, day), self.lines(day)).result(10)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=post, args=(day, )) for day in range(1, 21)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(Transaction.objects.count(), 40)
+        self.assertEqual(verify_daily_balances(), [])
+
+    def test_a_failed_batch_fails_every_waiting_write(self):
+        with patch("accounting.posting_queue.close_old_connections", side_effect=DatabaseError("gone")):
+            futures = [self.queue.submit(post_entry, "Entry", date(2024, 1, day), self.lines(day))
+                       for day in range(1, 4)]
+            for future in futures:
+                with self.assertRaises(DatabaseError):
+                    future.result(5)
+        self.assertEqual(self.queue.submit(post_entry, "Entry", date(2024, 1, 5), self.lines(5)).result(5).description,
+                         "Entry")
+
+    def test_a_dead_writer_is_replaced(self):
+        with patch.object(self.queue, "_write", side_effect=SystemExit):
+            self.queue.submit(post_entry, "Lost", date(2024, 1, 2), self.lines(5))
+            self.queue._thread.join(5)
+        self.assertFalse(self.queue._thread.is_alive())
+        entry = self.queue.submit(post_entry, "Entry", date(2024, 1, 3), self.lines(5)).result(5)
+        self.assertEqual(entry.transaction_set.count(), 2)
+
+        self.queue.stop()
+        with self.assertRaises(RuntimeError):
+            self.queue.submit(post_entry, "Entry", date(2024, 1, 4), self.lines(5))
+
+    def test_writes_inside_a_transaction_run_inline(self):
+        with db_transaction.atomic():
+            entry = self.queue.submit(post_entry, "Entry", date(2024, 1, 2), self.lines(5)).result(0)
+            self.assertEqual(entry.transaction_set.count(), 2)
+        self.assertEqual(self.queue.batches, 0)
+
+    def entry_form(self, day):
+        data = {
+            "description": "Admin entry",
+            "date": day,
+            "transaction_set-TOTAL_FORMS": 2,
+            "transaction_set-INITIAL_FORMS": 0,
+        }
+        for i, amount in enumerate([5, -5]):
+            data[f"transaction_set-{i}-account"] = self.accounts[i].pk
+            data[f"transaction_set-{i}-amount"] = amount
+        return data
+
+    @override_settings(ACCOUNTING_POSTING_QUEUE=True)
+    def test_admin_adds_through_the_queue(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        response = self.client.post("/admin/accounting/journalentry/add/", self.entry_form("2024-01-02"))
+        self.assertEqual(response.status_code, 302)
+        entry = JournalEntry.objects.get()
+        self.assertEqual(entry.created_by.username, "admin")
+        self.assertEqual(entry.transaction_set.count(), 2)
+        self.assertEqual(verify_daily_balances(), [])
+
+    @override_settings(ACCOUNTING_POSTING_QUEUE=True, ACCOUNTING_POSTING_TIMEOUT=0.2)
+    def test_admin_gives_up_on_a_busy_writer(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        release = threading.Event()
+        self.addCleanup(release.set)
+        get_posting_queue().submit(release.wait, 5)
+
+        response = self.client.post("/admin/accounting/journalentry/add/", self.entry_form("2024-01-02"))
+        self.assertRedirects(response, "/admin/accounting/journalentry/add/", fetch_redirect_response=False)
+        self.assertEqual([str(message) for message in get_messages(response.wsgi_request)],
+                         ["The ledger is busy and the entry was not saved; please try again."])
+        release.set()
+        self.assertTrue(get_posting_queue().submit(bool, 1).result(5))
+        self.assertFalse(JournalEntry.objects.exists())
+
+    @override_settings(ACCOUNTING_POSTING_QUEUE=True)
+    def test_admin_rejects_closed_periods(self):
+        opening = post_entry("Opening", date(2024, 1, 2), self.lines(5))
+        close_period(FiscalPeriod.objects.create(name="2024-01", start_date=date(2024, 1, 1),
+                                                 end_date=date(2024, 1, 31)))
+        entries = JournalEntry.objects.count()
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+
+        response = self.client.post("/admin/accounting/journalentry/add/", self.entry_form("2024-01-15"))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "The fiscal period containing 2024-01-15 is closed.")
+        self.assertEqual(JournalEntry.objects.count(), entries)
+
+        # Closed by the time the writer gets to it.
+        def closed(*args):
+            raise ValidationError("The fiscal period containing 2024-02-03 is closed.")
+
+        with patch("accounting.admin.save_entry", closed):
+            response = self.client.post("/admin/accounting/journalentry/add/", self.entry_form("2024-02-03"))
+        self.assertRedirects(response, "/admin/accounting/journalentry/add/", fetch_redirect_response=False)
+        self.assertEqual([str(message) for message in get_messages(response.wsgi_request)],
+                         ["The fiscal period containing 2024-02-03 is closed."])
+        self.assertEqual(JournalEntry.objects.count(), entries)
+
+        # Moving an entry out of a closed period.
+        data = dict(self.entry_form("2024-02-10"), **{"transaction_set-INITIAL_FORMS": 2})
+        for i, line in enumerate(opening.transaction_set.order_by("pk")):
+            data[f"transaction_set-{i}-id"] = line.pk
+            data[f"transaction_set-{i}-journal_entry"] = opening.pk
+        response = self.client.post(f"/admin/accounting/journalentry/{opening.pk}/change/", data)
+        self.assertContains(response, "The fiscal period containing 2024-01-02 is closed.")
+        opening.refresh_from_db()
+        self.assertEqual(opening.date, date(2024, 1, 2))
+
+
+class ReportRoutingTests(TransactionTestCase):
+    databases = {"default", REPORTS_ALIAS}
+
+    def setUp(self):
+        create_chart_of_accounts(3)
+
+    def test_report_reads_use_reports_alias(self):
+        read_alias = report_reads(lambda: Account.objects.all().db)
+        self.assertEqual(Account.objects.all().db, "default")
+        self.assertEqual(read_alias(), REPORTS_ALIAS)
+        # Inside a write transaction reports must see its own changes.
+        with db_transaction.atomic():
+            self.assertEqual(read_alias(), "default")
+
+    def test_report_instances_save_to_default(self):
+        account = report_reads(lambda: Account.objects.get(reference_code=111))()
+        self.assertEqual(account._state.db, REPORTS_ALIAS)
+        account.name = "Tiền mặt tại quỹ"
+        account.save()
+        self.assertEqual(Account.objects.get(pk=account.pk).name, "Tiền mặt tại quỹ")
+
+    def test_reports_alias_is_read_only(self):
+        with self.assertRaises(DatabaseError):
+            Account.objects.using(REPORTS_ALIAS).filter(reference_code=111).update(name="x")
+
+    def test_reports_are_served(self):
+        components = ViewComponent().get_trial_balance(None, None)
+        self.assertEqual(components["accounts"], [])
+        self.assertEqual(ViewComponent().get_account_total("Tiền mặt", None, None), 0)
+
+    @override_settings(ACCOUNTING_SQLITE_PRAGMAS={"cache_size": -4096, "temp_store": "MEMORY"})
+    def test_pragmas_applied(self):
+        connection.ensure_connection()
+        configure_sqlite(sender=None, connection=connection)
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA cache_size")
+            self.assertEqual(cursor.fetchone()[0], -4096)
+            cursor.execute("PRAGMA temp_store")
+            self.assertEqual(cursor.fetchone()[0], 2)
+        with connections[REPORTS_ALIAS].cursor() as cursor:
+            cursor.execute("PRAGMA query_only")
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+class LargeReportBenchmarkTests(ReportBenchmarkTests):
+    accounts = 60
+    entries = 2000
+    lines_per_entry = 4
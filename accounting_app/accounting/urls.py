@@ -7,4 +7,11 @@ urlpatterns = [
     path("trial-balance/", accounting_admin_site.trial_balance_view, name="trial_balance"),
     path("account-balance/<str:account_name>/", accounting_admin_site.account_balance_view, name="account_balance"),
     path("report/<str:report_name>/", accounting_admin_site.report_view, name="report_view"),
+    path("comparative/<str:report_name>/", accounting_admin_site.comparative_report_view, name="comparative_report"),
+    path("tax-report/", accounting_admin_site.tax_report_view, name="tax_report"),
+    path("journal-import/", accounting_admin_site.journal_import_view, name="journal_import"),
+    path("export/account-balance/<str:account_name>/", accounting_admin_site.account_export_view, name="account_export"),
+    path("export/comparative/<str:report_name>/", accounting_admin_site.comparative_export_view, name="comparative_export"),
+    path("export/<str:export_name>/", accounting_admin_site.export_view, name="export_view"),
+    path("instrumentation/", accounting_admin_site.instrumentation_view, name="instrumentation"),
 ]
@@ -1,21 +1,127 @@
-from django.db.models import Sum, Q, QuerySet
+from django.core import signing
+from django.db.models import (BigIntegerField, Case, DateField, F, Max, Sum, Q, QuerySet,
+                              Subquery, Value, When)
+from django.db.models.functions import Cast, Coalesce, Round, TruncMonth, TruncQuarter, TruncYear
 
-from .models import Transaction, Account
+from .models import Account, AccountDailyBalance, FiscalPeriod, OpeningBalance, Transaction
 
-from typing import Optional, Union
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Iterable, Optional, Union
 import numpy as np
 
 
+def filter_date_range(queryset: QuerySet,
+                      start_date: Optional[str]=None,
+                      end_date: Optional[str]=None,
+                      field: str="date") -> QuerySet:
+    if start_date and end_date:
+        queryset = queryset.filter(**{f"{field}__range": (start_date, end_date)})
+
+    return queryset
+
+
+def quantize_amount(value: Optional[Union[Decimal, float, int]]) -> Decimal:
+    # SQLite sums decimals as REAL; round back to the field's two places.
+    return Decimal(value or 0).quantize(Decimal("0.01"))
+
+
+def to_cents(field: str="amount") -> Cast:
+    # Exact integer cents, so sums never go through floating point.
+    return Cast(Round(F(field) * 100), BigIntegerField())
+
+
+def sum_cents(field: str="amount", **kwargs) -> Sum:
+    return Sum(to_cents(field), **kwargs)
+
+
+def cents_to_decimal(value: Optional[int]) -> Decimal:
+    return Decimal(int(value or 0)).scaleb(-2)
+
+
+def load_cents(queryset: QuerySet, field: str="amount") -> np.ndarray:
+    amounts = queryset.annotate(amount_cents=to_cents(field)).values_list("amount_cents", flat=True)
+    return np.fromiter(amounts.iterator(chunk_size=2000), dtype=np.int64)
+
+
+def load_grouped_cents(queryset: QuerySet, key: str="account_id", field: str="amount") -> tuple:
+    rows = queryset.annotate(amount_cents=to_cents(field)).values_list(key, "amount_cents")
+    pairs = np.array(list(rows.iterator(chunk_size=2000)), dtype=np.int64).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def group_sum_cents(keys: np.ndarray, amounts: np.ndarray) -> dict:
+    groups, positions = np.unique(keys, return_inverse=True)
+    totals = np.zeros(len(groups), dtype=np.int64)
+    np.add.at(totals, positions, amounts)
+    return {int(group): cents_to_decimal(total) for group, total in zip(groups, totals)}
+
+
 def get_account_transactions(account_name: str, 
                              start_date: Optional[str]=None, 
                              end_date: Optional[str]=None) -> QuerySet:
     transactions = Transaction.objects.filter(account__name=account_name)
-    if start_date and end_date:
-        transactions = transactions.filter(journal_entry__date__range=(start_date, end_date))
+    transactions = filter_date_range(transactions, start_date, end_date)
 
     return transactions
 
 
+def get_account_ledger(account_name: str,
+                       start_date: Optional[str]=None,
+                       end_date: Optional[str]=None,
+                       after: Optional[str]=None,
+                       page_size: int=100) -> dict:
+    # Keyset pagination on (date, id): the cursor carries the
+    # running balance of the last row shown, so any page costs the same.
+    transactions = get_account_transactions(account_name, start_date, end_date)
+    opening_balance = quantize_amount(0)
+    cursor = load_ledger_cursor(after)
+    if cursor:
+        transactions = transactions.filter(
+            Q(date__gt=cursor["date"])
+            | Q(date=cursor["date"], pk__gt=cursor["id"])
+        )
+        opening_balance = quantize_amount(Decimal(cursor["balance"]))
+
+    ordering = ["date", "pk"]
+    page_ids = list(transactions.order_by(*ordering).values_list("pk", flat=True)[:page_size + 1])
+    has_next = len(page_ids) > page_size
+    page = list(
+        Transaction.objects
+        .filter(pk__in=page_ids[:page_size])
+        .select_related("account")
+        .annotate(amount_cents=to_cents("amount"))
+        .order_by(*ordering)
+    )
+    running = np.cumsum(np.fromiter((transaction.amount_cents for transaction in page), dtype=np.int64))
+    for transaction, balance in zip(page, running.tolist()):
+        transaction.running_balance = cents_to_decimal(balance) + opening_balance
+
+    next_cursor = None
+    if has_next and page:
+        last = page[-1]
+        next_cursor = signing.dumps({
+            "date": last.date.isoformat(),
+            "id": last.pk,
+            "balance": str(last.running_balance),
+        }, salt="accounting.ledger")
+
+    ledger = {
+        "transactions": page,
+        "next_cursor": next_cursor,
+    }
+    return ledger
+
+
+def load_ledger_cursor(after: Optional[str]) -> Optional[dict]:
+    if not after:
+        return None
+    try:
+        return signing.loads(after, salt="accounting.ledger")
+    except signing.BadSignature:
+        return None
+
+
 def get_account_cumulative_balance(account_name: str,
                                    start_date: Optional[str]=None, 
                                    end_date: Optional[str]=None) -> QuerySet:
@@ -40,20 +146,23 @@ def get_account_info(by: str="name",
 
 
 def calc_cumulative_balance(transactions: QuerySet) -> dict:
-    if len(transactions) == 0:
+    transactions = transactions.order_by("date", "pk")
+    amounts = load_cents(transactions)
+    if len(amounts) == 0:
         return {
             "debit_balance": [], 
             "credit_balance": []
         }
 
-    debit = [""] * len(transactions)
-    credit = [""] * len(transactions)
+    debit = [""] * len(amounts)
+    credit = [""] * len(amounts)
 
-    normal_balance = transactions.first().account.normal_balance
+    normal_balance = transactions.values_list("account__normal_balance", flat=True).first()
+    running = [cents_to_decimal(value) for value in np.cumsum(amounts).tolist()]
     if normal_balance == "Debit":
-        debit = np.cumsum([float(transaction.amount) for transaction in transactions])
+        debit = running
     elif normal_balance == "Credit":
-        credit = np.cumsum([float(transaction.amount) for transaction in transactions])
+        credit = running
     
     cumulative_balance = {
         "debit_balance": debit,
@@ -82,38 +191,480 @@ def create_custom_model(label: str, url: str, perms: Optional[dict]=None) -> dic
     return custom_model
 
 
+def get_opening_balances(account_types: Optional[Iterable[str]]=None) -> tuple:
+    # Balances carried forward by the last period close, and the date after
+    # which the ledger still has to be scanned.
+    period = FiscalPeriod.last_closed()
+    if period is None:
+        return None, OpeningBalance.objects.none()
+
+    openings = OpeningBalance.objects.filter(period=period)
+    if account_types:
+        openings = openings.filter(account__account_type__in=account_types)
+
+    return period.end_date, openings
+
+
+def calc_balances(start_date: Optional[str]=None,
+                  end_date: Optional[str]=None,
+                  account_types: Optional[Iterable[str]]=None,
+                  exclude_closing: bool=False) -> dict:
+    # One grouped query over the daily snapshots: per-account balances plus
+    # the per-type totals derived from them. Without a date range the scan
+    # starts after the last closed period, on top of its opening balances.
+    snapshots = AccountDailyBalance.objects.all()
+    closing_lines = Transaction.objects.filter(journal_entry__is_closing=True)
+    if account_types:
+        snapshots = snapshots.filter(account__account_type__in=account_types)
+        closing_lines = closing_lines.filter(account__account_type__in=account_types)
+
+    rows = []
+    if start_date and end_date:
+        snapshots = filter_date_range(snapshots, start_date, end_date)
+        closing_lines = filter_date_range(closing_lines, start_date, end_date)
+    else:
+        closed_through, openings = get_opening_balances(account_types)
+        if closed_through:
+            snapshots = snapshots.filter(date__gt=closed_through)
+            rows += list(openings.values("account_id", "account__account_type", "balance"))
+
+    rows += [
+        dict(row, balance=cents_to_decimal(row["balance"]))
+        for row in (
+            snapshots
+            .values("account_id", "account__account_type")
+            .annotate(balance=sum_cents("movement"))
+            .order_by()
+        )
+    ]
+    if exclude_closing:
+        # Closing entries zero revenue and expense accounts; income figures
+        # are reported before them.
+        rows += [
+            dict(row, balance=-cents_to_decimal(row["balance"]))
+            for row in (
+                closing_lines
+                .values("account_id", "account__account_type")
+                .annotate(balance=sum_cents("amount"))
+                .order_by()
+            )
+        ]
+
+    by_account = {}
+    by_type = {account_type: quantize_amount(0) for account_type, _ in Account.ACCOUNT_TYPES}
+    for row in rows:
+        balance = quantize_amount(row["balance"])
+        by_account[row["account_id"]] = by_account.get(row["account_id"], quantize_amount(0)) + balance
+        by_type[row["account__account_type"]] += balance
+
+    balances = {
+        "by_account": by_account,
+        "by_type": by_type,
+    }
+    return balances
+
+
+def calc_retained_earnings(start_date: Optional[str]=None, end_date: Optional[str]=None) -> dict:
+    # Movements of the income accounts and of the role accounts (retained
+    # and current-year earnings, dividends), split into before the range and
+    # within it. The closing-entry lines in the range are UNIONed in so their
+    # transfers can be backed out: all in one statement.
+    accounts = (
+        Q(account__account_type__in=["Revenue", "Expense"])
+        | Q(account__role__in=[Account.RETAINED_EARNINGS, Account.CURRENT_YEAR_EARNINGS, Account.DIVIDENDS])
+    )
+    zero = Value(0, output_field=BigIntegerField())
+    snapshots = AccountDailyBalance.objects.filter(accounts)
+    closing_lines = Transaction.objects.filter(accounts, journal_entry__is_closing=True)
+    if start_date and end_date:
+        snapshots = snapshots.filter(date__lte=end_date)
+        closing_lines = filter_date_range(closing_lines, start_date, end_date)
+        before = sum_cents("movement", filter=Q(date__lt=start_date))
+        during = sum_cents("movement", filter=Q(date__gte=start_date))
+    else:
+        before = zero
+        during = sum_cents("movement")
+
+    rows = (
+        snapshots
+        .values("account__account_type", "account__role")
+        .annotate(before=before, during=during, closing=zero)
+        .order_by()
+        .union(
+            closing_lines
+            .values("account__account_type", "account__role")
+            .annotate(before=zero, during=zero, closing=sum_cents("amount"))
+            .order_by(),
+            all=True,
+        )
+    )
+
+    totals = {scope: {"before": 0, "during": 0} for scope in ("income", "earnings", "dividends")}
+    for row in rows:
+        if row["account__account_type"] in ("Revenue", "Expense"):
+            scope = "income"
+        elif row["account__role"] == Account.DIVIDENDS:
+            scope = "dividends"
+        else:
+            scope = "earnings"
+        totals[scope]["before"] += row["before"] or 0
+        totals[scope]["during"] += (row["during"] or 0) - (row["closing"] or 0)
+
+    # Credit balances are negative; the statement shows earnings as positive.
+    beginning = -sum(scope["before"] for scope in totals.values())
+    net_income = -totals["income"]["during"]
+    dividends = totals["dividends"]["during"]
+    adjustments = -totals["earnings"]["during"]
+
+    retained_earnings = {
+        "beginning_retained_earnings": cents_to_decimal(beginning),
+        "net_income": cents_to_decimal(net_income),
+        "cash_dividends": cents_to_decimal(dividends),
+        "increased_retained_earnings": cents_to_decimal(net_income - dividends),
+        "other_adjustments": cents_to_decimal(adjustments),
+        "ending_retained_earnings": cents_to_decimal(beginning + net_income - dividends + adjustments),
+    }
+    return retained_earnings
+
+
+PERIOD_GRAINS = {
+    "month": (TruncMonth, 1),
+    "quarter": (TruncQuarter, 3),
+    "year": (TruncYear, 12),
+}
+
+
+def truncate_date(day: date, grain: str="month") -> date:
+    months = PERIOD_GRAINS[grain][1]
+    return day.replace(month=(day.month - 1) // months * months + 1, day=1)
+
+
+def next_period(period: date, grain: str="month") -> date:
+    month = period.month - 1 + PERIOD_GRAINS[grain][1]
+    return date(period.year + month // 12, month % 12 + 1, 1)
+
+
+def list_periods(start_date: str, end_date: str, grain: str="month") -> list:
+    period = truncate_date(date.fromisoformat(str(start_date)), grain)
+    end = date.fromisoformat(str(end_date))
+    periods = []
+    while period <= end:
+        periods.append(period)
+        period = next_period(period, grain)
+
+    return periods
+
+
+def standard_periods(today: Optional[date]=None) -> list:
+    # (start_date, end_date) of the whole ledger plus the current and the
+    # previous month, quarter and year.
+    today = today or date.today()
+    periods = [(None, None)]
+    for grain in PERIOD_GRAINS:
+        current = truncate_date(today, grain)
+        previous = truncate_date(current - timedelta(days=1), grain)
+        for start in (previous, current):
+            end = next_period(start, grain) - timedelta(days=1)
+            periods.append((start.isoformat(), end.isoformat()))
+
+    return periods
+
+
+def period_label(period: date, grain: str="month") -> str:
+    if grain == "year":
+        return str(period.year)
+    if grain == "quarter":
+        return f"{period.year}-Q{(period.month - 1) // 3 + 1}"
+    return period.strftime("%Y-%m")
+
+
+def default_period_range(start_date: Optional[str]=None, end_date: Optional[str]=None) -> tuple:
+    # Without a range, compare the periods of the latest year with postings.
+    if start_date and end_date:
+        return start_date, end_date
+    latest = AccountDailyBalance.objects.aggregate(latest=Max("date"))["latest"] or date.today()
+    return date(latest.year, 1, 1).isoformat(), date(latest.year, 12, 31).isoformat()
+
+
+TAX_REPORT_COLUMNS = ("output_base", "output_tax", "input_base", "input_tax")
+
+
+def calc_tax_report(start_date: Optional[str]=None,
+                    end_date: Optional[str]=None,
+                    grain: str="month") -> dict:
+    # Taxable base and tax per rate and period in one grouped query. Credit
+    # lines (sales) are output tax, debit lines (purchases) input tax.
+    trunc = PERIOD_GRAINS[grain][0]
+    transactions = filter_date_range(Transaction.objects.filter(tax_rate__isnull=False), start_date, end_date)
+    sales, purchases = Q(amount__lt=0), Q(amount__gt=0)
+    rows = (
+        transactions
+        .annotate(period=trunc("date"))
+        .values("period", "tax_rate_id", "tax_rate__name", "tax_rate__rate")
+        .annotate(
+            output_base=sum_cents("amount", filter=sales),
+            output_tax=sum_cents("tax_amount", filter=sales),
+            input_base=sum_cents("amount", filter=purchases),
+            input_tax=sum_cents("tax_amount", filter=purchases),
+        )
+        .order_by("period", "tax_rate__rate", "tax_rate_id")
+    )
+
+    report_rows = []
+    totals = dict.fromkeys(TAX_REPORT_COLUMNS + ("tax_payable",), 0)
+    for row in rows:
+        # Sales are credits; shown as positive figures.
+        values = {
+            "output_base": -(row["output_base"] or 0),
+            "output_tax": -(row["output_tax"] or 0),
+            "input_base": row["input_base"] or 0,
+            "input_tax": row["input_tax"] or 0,
+        }
+        values["tax_payable"] = values["output_tax"] - values["input_tax"]
+        for column, value in values.items():
+            totals[column] += value
+        report_rows.append({
+            "period": row["period"],
+            "tax_rate": row["tax_rate__name"],
+            "rate": row["tax_rate__rate"],
+            **{column: cents_to_decimal(value) for column, value in values.items()},
+        })
+
+    tax_report = {
+        "rows": report_rows,
+        "totals": {column: cents_to_decimal(value) for column, value in totals.items()},
+    }
+    return tax_report
+
+
+def calc_period_balances(start_date: str,
+                         end_date: str,
+                         grain: str="month",
+                         account_types: Optional[Iterable[str]]=None,
+                         exclude_closing: bool=False,
+                         cumulative: bool=False) -> dict:
+    # One query grouped by account and truncated date, pivoted into one
+    # column per period. cumulative=True folds everything before start_date
+    # into an opening balance and turns the columns into period-end balances;
+    # as in calc_trial_balance, the last period closed before the range
+    # supplies opening balances and the scan starts after it.
+    trunc = PERIOD_GRAINS[grain][0]
+    periods = list_periods(start_date, end_date, grain)
+    column = {period: position for position, period in enumerate(periods)}
+
+    snapshots = AccountDailyBalance.objects.filter(date__lte=end_date)
+    closing_lines = Transaction.objects.filter(journal_entry__is_closing=True, date__range=(start_date, end_date))
+    closed = FiscalPeriod.objects.filter(is_closed=True, end_date__lt=start_date).order_by("-end_date")
+    openings = OpeningBalance.objects.filter(period=Subquery(closed.values("pk")[:1]))
+    if account_types:
+        snapshots = snapshots.filter(account__account_type__in=account_types)
+        closing_lines = closing_lines.filter(account__account_type__in=account_types)
+        openings = openings.filter(account__account_type__in=account_types)
+    if cumulative:
+        scan_after = Coalesce(Subquery(closed.values("end_date")[:1]), Value(date.min), output_field=DateField())
+        snapshots = snapshots.filter(date__gt=scan_after)
+        period = Case(When(date__lt=start_date, then=Value(None)), default=trunc("date"), output_field=DateField())
+    else:
+        snapshots = snapshots.filter(date__gte=start_date)
+        period = trunc("date")
+
+    rows = (
+        snapshots
+        .values("account_id", "account__account_type", period_start=period)
+        .annotate(cents=sum_cents("movement"))
+        .order_by()
+    )
+    if cumulative:
+        rows = rows.union(
+            openings.values("account_id", "account__account_type",
+                            period_start=Value(None, output_field=DateField()), cents=to_cents("balance")),
+            all=True,
+        )
+    rows = list(rows)
+    if exclude_closing:
+        rows += [
+            dict(row, cents=-row["cents"])
+            for row in (
+                closing_lines
+                .values("account_id", "account__account_type", period_start=trunc("date"))
+                .annotate(cents=sum_cents("amount"))
+                .order_by()
+            )
+        ]
+
+    # Pivot in int64 cents: column 0 holds the opening balance and the
+    # periods follow, so a cumulative report is one cumsum along each row.
+    types_by_account = {row["account_id"]: row["account__account_type"] for row in rows}
+    account_ids = list(types_by_account)
+    position = {account_id: index for index, account_id in enumerate(account_ids)}
+    cents = np.zeros((len(account_ids), len(periods) + 1), dtype=np.int64)
+    np.add.at(
+        cents,
+        (np.array([position[row["account_id"]] for row in rows], dtype=np.intp),
+         np.array([0 if row["period_start"] is None else column[row["period_start"]] + 1 for row in rows], dtype=np.intp)),
+        np.array([row["cents"] or 0 for row in rows], dtype=np.int64),
+    )
+    if cumulative:
+        cents = np.cumsum(cents, axis=1)
+    cents = cents[:, 1:]
+
+    type_names = [account_type for account_type, _ in Account.ACCOUNT_TYPES]
+    type_cents = np.zeros((len(type_names), len(periods)), dtype=np.int64)
+    np.add.at(type_cents,
+              np.array([type_names.index(types_by_account[account_id]) for account_id in account_ids],
+                       dtype=np.intp),
+              cents)
+
+    by_account = {
+        account_id: [cents_to_decimal(value) for value in values]
+        for account_id, values in zip(account_ids, cents.tolist())
+    }
+    by_type = {
+        account_type: [cents_to_decimal(value) for value in values]
+        for account_type, values in zip(type_names, type_cents.tolist())
+    }
+
+    balances = {
+        "periods": periods,
+        "by_account": by_account,
+        "by_type": by_type,
+    }
+    return balances
+
+
+TRIAL_BALANCE_COLUMNS = ("opening", "debit", "credit", "closing")
+
+
+def calc_trial_balance(start_date: Optional[str]=None, end_date: Optional[str]=None) -> dict:
+    # Opening balance, period debits and credits and closing balance per
+    # account from one conditional aggregation over the daily snapshots.
+    # The last period closed before the range supplies opening balances, so
+    # the scan starts after it. The totals are aggregated in the same
+    # statement as rows without an account.
+    ranged = bool(start_date and end_date)
+    zero = Value(0, output_field=BigIntegerField())
+    no_account = Value(None, output_field=BigIntegerField())
+
+    closed = FiscalPeriod.objects.filter(is_closed=True).order_by("-end_date")
+    if ranged:
+        closed = closed.filter(end_date__lt=start_date)
+    scan_after = Coalesce(Subquery(closed.values("end_date")[:1]), Value(date.min), output_field=DateField())
+    openings = OpeningBalance.objects.filter(period=Subquery(closed.values("pk")[:1]))
+    snapshots = AccountDailyBalance.objects.filter(date__gt=scan_after)
+    if ranged:
+        snapshots = snapshots.filter(date__lte=end_date)
+
+    in_period = {"filter": Q(date__gte=start_date)} if ranged else {}
+    movements = {
+        "opening": sum_cents("movement", filter=Q(date__lt=start_date)) if ranged else zero,
+        "debit": sum_cents("debit", **in_period),
+        "credit": sum_cents("credit", **in_period),
+        "closing": sum_cents("movement"),
+    }
+    carried = {"opening": to_cents("balance"), "debit": zero, "credit": zero, "closing": to_cents("balance")}
+    carried_totals = {"opening": sum_cents("balance"), "debit": zero, "credit": zero, "closing": sum_cents("balance")}
+
+    rows = (
+        snapshots.values(row_account=F("account_id")).annotate(**movements).order_by()
+        .union(
+            openings.values(row_account=F("account_id")).annotate(**carried).order_by(),
+            snapshots.values(row_account=no_account).annotate(**movements).order_by(),
+            openings.values(row_account=no_account).annotate(**carried_totals).order_by(),
+            all=True,
+        )
+    )
+
+    by_account = {}
+    totals = dict.fromkeys(TRIAL_BALANCE_COLUMNS, 0)
+    for row in rows:
+        if row["row_account"] is None:
+            target = totals
+        else:
+            target = by_account.setdefault(row["row_account"], dict.fromkeys(TRIAL_BALANCE_COLUMNS, 0))
+        for column in TRIAL_BALANCE_COLUMNS:
+            target[column] += row[column] or 0
+
+    trial_balance = {
+        "by_account": {
+            account_id: {column: cents_to_decimal(value) for column, value in columns.items()}
+            for account_id, columns in by_account.items()
+            if any(columns.values())
+        },
+        "totals": {column: cents_to_decimal(value) for column, value in totals.items()},
+    }
+    return trial_balance
+
+
+def attach_balances(accounts: Iterable[Account], by_account: dict) -> list:
+    accounts = list(accounts)
+    for account in accounts:
+        account.balance = by_account.get(account.pk, quantize_amount(0))
+
+    return accounts
+
+
+def get_balance_before(account_id: int, day: str) -> Decimal:
+    balance = (
+        AccountDailyBalance.objects
+        .filter(account_id=account_id, date__lt=day)
+        .order_by("-date")
+        .values_list("balance", flat=True)
+        .first()
+    )
+    return quantize_amount(balance)
+
+
+def get_balance_on(account_id: int, day: Optional[str]=None) -> Decimal:
+    snapshots = AccountDailyBalance.objects.filter(account_id=account_id)
+    if day:
+        snapshots = snapshots.filter(date__lte=day)
+    balance = snapshots.order_by("-date").values_list("balance", flat=True).first()
+    return quantize_amount(balance)
+
+
+def get_range_balance(account_id: int,
+                      start_date: Optional[str]=None,
+                      end_date: Optional[str]=None) -> Decimal:
+    if start_date and end_date:
+        return get_balance_on(account_id, end_date) - get_balance_before(account_id, start_date)
+    return get_balance_on(account_id)
+
+
 def calc_account_balance(account_name: Union[str, list], 
                          start_date: Optional[str]=None, 
-                         end_date: Optional[str]=None) -> float:
+                         end_date: Optional[str]=None) -> Decimal:
+    # Two snapshot rows per account whatever the range, rather than summing
+    # a day's movement for every day in it.
     if isinstance(account_name, str):
-        tx = get_account_transactions(account_name, start_date, end_date)
-        account_balance = calc_tx_total(tx)
+        account_ids = Account.objects.filter(name=account_name).values_list("pk", flat=True)
     else:
-        tx = [get_account_transactions(account.name, start_date, end_date) for account in account_name]
-        account_balance = sum([calc_tx_total(t) for t in tx])
+        account_ids = [account.pk for account in account_name]
+    account_balance = sum((get_range_balance(pk, start_date, end_date) for pk in account_ids), 
+                          quantize_amount(0))
 
     return account_balance
 
 
-def calc_tx_total(transactions: QuerySet) -> float:
-    total = sum([float(transaction.amount) for transaction in transactions])
-    return total
+def calc_tx_total(transactions: QuerySet) -> Decimal:
+    total = transactions.aggregate(total=sum_cents("amount"))["total"]
+    return cents_to_decimal(total)
+
+
+def calc_account_totals(transactions: QuerySet) -> dict:
+    return group_sum_cents(*load_grouped_cents(transactions))
 
 
 def calc_total_revenue_expense(start_date: Optional[str]=None, 
-                               end_date: Optional[str]=None) -> float:
-    revenue_accounts = get_account_info("type", account_type="Revenue")
-    expense_accounts = get_account_info("type", account_type="Expense")
-    total_revenue = sum([calc_account_balance(account.name, start_date, end_date) for account in revenue_accounts])
-    total_expense = sum([calc_account_balance(account.name, start_date, end_date) for account in expense_accounts])
-    return total_revenue, total_expense
+                               end_date: Optional[str]=None) -> tuple:
+    by_type = calc_balances(start_date, end_date, ["Revenue", "Expense"], exclude_closing=True)["by_type"]
+    return by_type["Revenue"], by_type["Expense"]
 
 
-def calc_net_income(total_revenue: float=None, 
-                    total_expense: float=None,
+def calc_net_income(total_revenue: Optional[Decimal]=None, 
+                    total_expense: Optional[Decimal]=None,
                     start_date: Optional[str]=None, 
-                    end_date: Optional[str]=None) -> float:
-    if total_revenue and total_expense:
+                    end_date: Optional[str]=None) -> Decimal:
+    if total_revenue is not None and total_expense is not None:
         net_income = abs(total_revenue) - abs(total_expense)
     else:
         total_revenue, total_expense = calc_total_revenue_expense(start_date, end_date)
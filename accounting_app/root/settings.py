@@ -79,11 +79,117 @@ WSGI_APPLICATION = 'root.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+#
+# SQLITE_PRODUCTION=1 tunes SQLite for concurrent use on one node: WAL so
+# report readers and admin writers do not block each other, IMMEDIATE write
+# transactions and a busy timeout instead of "database is locked", and a
+# larger page cache and memory map. Report reads from ViewComponent go to the
+# read-only "reports" alias (accounting.database.ReportRouter).
+
+SQLITE_PRODUCTION = os.getenv("SQLITE_PRODUCTION", "") == "1"
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20} if SQLITE_PRODUCTION else {},
+    },
+    'reports': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{BASE_DIR / 'db.sqlite3'}?mode=ro",
+        'OPTIONS': {'timeout': 20} if SQLITE_PRODUCTION else {},
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['accounting.database.ReportRouter']
+
+# Applied to every new SQLite connection.
+ACCOUNTING_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'cache_size': -65536,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+} if SQLITE_PRODUCTION else {}
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+#
+# "reports" holds computed report components keyed by ledger generation.
+# LocMemCache evicts least-recently-used entries past MAX_ENTRIES; for
+# several worker processes use a shared backend such as
+# django.core.cache.backends.filebased.FileBasedCache with a directory
+# LOCATION. TIMEOUT bounds how long an entry lives in either backend. The
+# report_cache command reads the hit/miss counts from the backend, so it
+# refuses to run against a LocMemCache.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv("DEFAULT_CACHE_BACKEND", 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv("DEFAULT_CACHE_LOCATION", 'accounting-default'),
+    },
+    'reports': {
+        'BACKEND': os.getenv("REPORT_CACHE_BACKEND", 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv("REPORT_CACHE_LOCATION", 'accounting-reports'),
+        'TIMEOUT': int(os.getenv("REPORT_CACHE_TIMEOUT", 3600)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv("REPORT_CACHE_MAX_ENTRIES", 500)),
+        },
+    },
+}
+
+# Every process keeps its own copy of the chart of accounts and reloads it
+# when the version row in the database changes. The row is read once per
+# request, and by commands and workers at most this often.
+ACCOUNTING_REGISTRY_RECHECK_SECONDS = 5
+
+# Cache alias used for report results; set to None to always recompute.
+ACCOUNTING_REPORT_CACHE = 'reports'
+
+# Threads the async report views use to compute independent sections side by
+# side (each holds its own database connection); 1 computes them in turn.
+ACCOUNTING_REPORT_WORKERS = int(os.getenv("ACCOUNTING_REPORT_WORKERS", 4))
+
+# Reports the precompute_reports worker snapshots for the standard periods
+# (whole ledger, current and previous month, quarter and year), and how long
+# the ledger must be quiet before it recomputes them.
+ACCOUNTING_PRECOMPUTED_REPORTS = ['trial_balance', 'income_statement', 'balance_sheet', 'retained_earnings_statement']
+ACCOUNTING_PRECOMPUTE_SETTLE_SECONDS = int(os.getenv("ACCOUNTING_PRECOMPUTE_SETTLE_SECONDS", 30))
+
+# Journal entries added in the admin are written by one in-process writer
+# thread that commits whatever is pending as one transaction (up to
+# ACCOUNTING_POSTING_BATCH entries), instead of each request contending for
+# SQLite's write lock. An admin request waits at most
+# ACCOUNTING_POSTING_TIMEOUT seconds for its entry to be written.
+ACCOUNTING_POSTING_QUEUE = SQLITE_PRODUCTION or os.getenv("ACCOUNTING_POSTING_QUEUE", "") == "1"
+ACCOUNTING_POSTING_BATCH = int(os.getenv("ACCOUNTING_POSTING_BATCH", 100))
+ACCOUNTING_POSTING_TIMEOUT = int(os.getenv("ACCOUNTING_POSTING_TIMEOUT", 30))
+
+
+# Report instrumentation: per-request query count, SQL time, slowest
+# statements and rows materialized, logged as JSON, sent as Server-Timing
+# headers and summarised on the admin "Report performance" page.
+
+ACCOUNTING_INSTRUMENTATION = os.getenv("ACCOUNTING_INSTRUMENTATION", "") == "1"
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'accounting.instrumentation': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
 }
 
 
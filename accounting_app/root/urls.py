@@ -22,4 +22,5 @@ from accounting.admin import accounting_admin_site
 urlpatterns = [
     path("admin/", accounting_admin_site.urls),
     path("admin/", include("accounting.urls")),
+    path("api/", include("accounting.api")),
 ]